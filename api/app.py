@@ -1,32 +1,364 @@
-from fastapi import FastAPI, HTTPException
-from .schemas import PromptInput, ScanResult
+import asyncio
+import codecs
+import json
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from .schemas import (PromptInput, ScanResult, BatchPromptInput, BatchScanResult, OutputInput, OutputScanResult,
+                      OutputRedactResult, ConversationInput, ConversationScanResult)
+from .batcher import MicroBatcher
+from .executor import InferenceExecutor, Overloaded
 from src.monitors import SecurePromptPipeline
+from src.utils import load_config
+from src.utils.backends import set_threads
 
-app = FastAPI(title="SecurePrompt API", version="0.2.0")
+config = load_config()
+
+# Threads per forward pass in this worker (before any model is loaded)
+set_threads(config["serving"]["torch_threads"])
 
 # Initialize the pipeline ONCE when the app starts
-# This prevents reloading the heavy BERT/GPT models on every request
+# This prevents reloading the heavy BERT/GPT models on every request.
+# With serving.lazy_models (off by default) the models load in the background,
+# so /health answers at once and /scan serves heuristic-only verdicts, which
+# pass prompts the full ensemble would block, until they are in.
+# Under the pre-fork launcher (api/server.py) they always load up front, so
+# the forked workers share them.
 print("Loading SecurePrompt Pipeline... Please wait.")
-pipeline = SecurePromptPipeline()
-print("SecurePrompt Ready!")
+preload = bool(os.environ.get("SECUREPROMPT_PRELOAD"))
+pipeline = SecurePromptPipeline(config, lazy=config["serving"]["lazy_models"] and not preload)
+print("SecurePrompt Ready!" if pipeline.models_ready else "SecurePrompt serving heuristics; models loading...")
+
+
+def scan_items(items):
+    """scan_batch() over (prompt, user_id) pairs."""
+    return pipeline.scan_batch([prompt for prompt, _ in items], user_ids=[user_id for _, user_id in items])
+
+
+# All model work runs on one size-limited pool; a full queue is rejected at once
+executor_config = config["serving"]["executor"]
+executor = InferenceExecutor(
+    max_workers=executor_config["max_workers"],
+    max_pending=executor_config["max_pending"]
+)
+
+# Concurrent /scan calls are coalesced into one scan_batch() call
+batching_config = config["serving"]["batching"]
+batcher = MicroBatcher(
+    scan_items,
+    max_wait_ms=batching_config["max_wait_ms"],
+    max_batch_size=batching_config["max_batch_size"],
+    executor=executor,
+    max_queue=executor_config["max_pending"]
+) if batching_config["enabled"] else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if batcher is not None:
+        await batcher.start()
+    if config["rules"]["watch"]:
+        pipeline.rules.start_watching()
+    yield
+    pipeline.rules.stop_watching()
+    if batcher is not None:
+        await batcher.stop()
+    executor.shutdown(wait=False)
+    pipeline.close()
+
+
+app = FastAPI(title="SecurePrompt API", version="0.2.0", lifespan=lifespan)
+
+
+def to_scan_result(result: dict) -> dict:
+    """
+    Maps a pipeline decision onto the ScanResult schema.
+    The risk score and the ensemble breakdown travel in `metrics`, plus the
+    stage timings when `metrics.request_timings` is on. Heuristic-only
+    verdicts say so in `warnings`.
+    """
+    breakdown = result.get("breakdown", {})
+    metrics = {
+        "total_risk": result.get("total_risk", 0.0),
+        "breakdown": breakdown
+    }
+    if "timings_ms" in result:
+        metrics["timings_ms"] = result["timings_ms"]
+    warnings = None
+    if breakdown.get("heuristic_only"):
+        cause = "server overloaded" if breakdown.get("models_ready") else "models still loading"
+        warnings = f"Heuristic-only verdict ({cause})"
+    return {
+        "status": result["status"],
+        "reason": result.get("reason"),
+        "metrics": metrics,
+        "warnings": warnings
+    }
+
+
+async def run_with_limits(scan, prompts: list, user_ids=None):
+    """
+    Awaits `scan` (model work on the inference executor) within the
+    per-request deadline. A full queue is a 429 and a missed deadline a 503,
+    both with Retry-After; in degraded mode both get heuristic-only verdicts
+    for `prompts` (audited under `user_ids`) instead.
+    """
+    timeout = executor_config["timeout_seconds"]
+    try:
+        return await asyncio.wait_for(scan, timeout)
+    except Overloaded as e:
+        status_code, detail = 429, f"Server overloaded: {e}"
+    except asyncio.TimeoutError:
+        status_code, detail = 503, f"Scan did not finish within {timeout}s"
+
+    pipeline.metrics.inc("overload_total", len(prompts), status=str(status_code))
+    if executor_config["degraded"]:
+        return await run_in_threadpool(pipeline.scan_heuristics, prompts, user_ids=user_ids)
+    raise HTTPException(status_code=status_code, detail=detail,
+                        headers={"Retry-After": str(executor_config["retry_after_seconds"])})
+
+
+async def scan_with_limits(items) -> list:
+    """Scans (prompt, user_id) pairs (single prompts through the micro-batcher) via run_with_limits."""
+    async def scan():
+        if batcher is not None and len(items) == 1:
+            return [await batcher.submit(items[0])]
+        return await executor.run(scan_items, items)
+
+    return await run_with_limits(scan(), [prompt for prompt, _ in items], [user_id for _, user_id in items])
 
 
 @app.get("/")
 def home():
-    return {"message": "SecurePrompt API is running. Send POST requests to /scan."}
+    return {"message": "SecurePrompt API is running. Send POST requests to /scan or /scan/batch."}
+
+
+@app.get("/health")
+def health():
+    """Liveness plus model readiness and startup timings."""
+    return {
+        "status": "error" if pipeline.load_error is not None else "ok",
+        "models_ready": pipeline.models_ready,
+        "error": str(pipeline.load_error) if pipeline.load_error is not None else None,
+        "startup": pipeline.startup
+    }
 
 
 @app.post("/scan", response_model=ScanResult)
-def scan_prompt(input_data: PromptInput):
+async def scan_prompt(input_data: PromptInput):
     """
     Scans a user prompt for injection attacks, leakage, and policy violations.
     """
     try:
         # 1. Run the logic from src/monitors/integration.py
-        result = pipeline.scan_input(input_data.prompt)
+        result = (await scan_with_limits([(input_data.prompt, input_data.user_id)]))[0]
 
         # 2. Return the dictionary exactly as schemas.py expects
-        return result
+        return to_scan_result(result)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/scan/batch", response_model=BatchScanResult)
+async def scan_prompt_batch(input_data: BatchPromptInput):
+    """
+    Scans many prompts in one request.
+    Each model runs one batched forward pass per length bucket, which is much
+    faster than calling /scan once per prompt.
+    """
+    try:
+        results = await scan_with_limits([(prompt, input_data.user_id) for prompt in input_data.prompts])
+        return {"results": [to_scan_result(result) for result in results]}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
+@app.post("/scan/conversation", response_model=ConversationScanResult)
+async def scan_conversation(input_data: ConversationInput):
+    """
+    Scans the next message of a multi-turn conversation in the context of
+    the earlier turns, which the server remembers per `conversation_id`
+    (send only the new message). Catches attacks split across turns, and a
+    turn costs about as much as scanning the new message alone.
+    """
+    try:
+        result = await run_with_limits(
+            executor.run(pipeline.scan_conversation, input_data.conversation_id, input_data.message,
+                         input_data.user_id),
+            [input_data.message],
+            [input_data.user_id]
+        )
+        if isinstance(result, list):  # degraded: heuristic-only, the turn is not remembered
+            result = result[0]
+        return {
+            **to_scan_result(result),
+            "conversation_id": input_data.conversation_id,
+            "turn": result["breakdown"].get("conversation", {}).get("turns")
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.delete("/scan/conversation/{conversation_id}")
+def end_conversation(conversation_id: str):
+    """Forgets a conversation's state (e.g. when the chat session ends)."""
+    return {"conversation_id": conversation_id, "ended": pipeline.end_conversation(conversation_id)}
+
+
+@app.post("/scan/output", response_model=OutputScanResult)
+def scan_output(input_data: OutputInput):
+    """
+    Scans a complete LLM response for canary leakage, PII and policy violations.
+    """
+    try:
+        return pipeline.scan_output(input_data.response, scope=input_data.scope)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body generator is also reading the request body.
+    The stock class listens for client disconnects on the same receive
+    channel, which would swallow request chunks, so here only the
+    generator reads (request.stream() raises on disconnect anyway).
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/scan/output/stream")
+async def scan_output_stream(request: Request):
+    """
+    Scans a streamed LLM response as it arrives.
+    Send the response as a chunked request body (UTF-8 text). The reply is a
+    Server-Sent Events stream: `chunk` events carry text that passed the
+    scan, and a final `result` event carries the verdict. The stream is cut
+    as soon as a violation is found, so the offending text is never sent on.
+    The `scope` query parameter names the tenant/session whose canary to look for.
+    """
+    scanner = pipeline.stream_scanner(scope=request.query_params.get("scope"))
+    return DuplexStreamingResponse(_stream_events(request, scanner), media_type="text/event-stream")
+
+
+@app.post("/scan/output/redact", response_model=OutputRedactResult)
+def redact_output(input_data: OutputInput):
+    """
+    Returns the LLM response with canaries and PII replaced by typed
+    placeholders ([EMAIL], [CANARY], ...) plus the list of findings, instead
+    of blocking it. Banned phrases still block.
+    """
+    try:
+        return pipeline.redact_output(input_data.response, scope=input_data.scope)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/scan/output/redact/stream")
+async def redact_output_stream(request: Request):
+    """
+    Streaming /scan/output/redact, same protocol as /scan/output/stream:
+    `chunk` events carry redacted text, the final `result` event the
+    status and every finding (offsets in the original response).
+    """
+    redactor = pipeline.stream_redactor(scope=request.query_params.get("scope"))
+    return DuplexStreamingResponse(_stream_events(request, redactor), media_type="text/event-stream")
+
+
+async def _stream_events(request: Request, scanner):
+    """SSE events for a chunked request body fed through a stream scanner/redactor."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async for raw in request.stream():
+        safe = scanner.feed(decoder.decode(raw))
+        if safe:
+            yield _sse("chunk", {"text": safe})
+        if scanner.stopped:
+            break
+
+    if not scanner.stopped:
+        safe = scanner.feed(decoder.decode(b"", final=True)) + scanner.close()
+        if safe:
+            yield _sse("chunk", {"text": safe})
+
+    yield _sse("result", scanner.result())
+
+
+@app.get("/batching/stats")
+def batching_stats():
+    """Queue depth and batch-size counters of the /scan micro-batcher and the inference executor."""
+    if batcher is None:
+        return {"enabled": False, "executor": executor.stats()}
+    return {"enabled": True, **batcher.stats(), "executor": executor.stats()}
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the verdict and per-model score caches."""
+    return pipeline.cache_stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Per-stage latency histograms, BLOCK/PASS counters by reason, and the
+    cache and batcher counters, in the Prometheus text format.
+    """
+    registry = pipeline.metrics
+    if not registry.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (metrics.enabled in config.yaml)")
+
+    for cache_name, stats in pipeline.cache_stats().items():
+        if stats is None:
+            continue
+        for field in ("size", "hits", "misses"):
+            if field in stats:
+                registry.set_gauge(f"cache_{field}", stats[field], cache=cache_name)
+    if batcher is not None:
+        stats = batcher.stats()
+        for field in ("queue_depth", "total_batches", "total_items"):
+            registry.set_gauge(f"batcher_{field}", stats[field])
+    for field in ("pending", "rejected"):
+        registry.set_gauge(f"executor_{field}", executor.stats()[field])
+    if pipeline.audit is not None:
+        for field, value in pipeline.audit.stats().items():
+            registry.set_gauge(f"audit_{field}", value)
+
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admin/rules")
+def rules_info():
+    """Version, digest and compile time of the active rule set."""
+    return pipeline.rules.info()
+
+
+@app.post("/admin/rules/reload")
+def reload_rules():
+    """
+    Recompiles keyword, regex, policy and PII rules from config.yaml and the
+    rules file, then swaps them in. The models are not reloaded.
+    """
+    try:
+        pipeline.rules.reload()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=f"Rule reload failed: {e}")
+    return pipeline.rules.info()
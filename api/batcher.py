@@ -0,0 +1,160 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .executor import Overloaded
+
+
+def _fail(batch, error):
+    """Fails every still-waiting future of (item, future) pairs."""
+    for _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent requests into one batched model call.
+
+    Each caller awaits `submit(item)`. A single background task takes the first
+    queued item, keeps collecting until `max_batch_size` items are waiting or
+    `max_wait_ms` has passed, then runs `batch_fn(items)` once on a dedicated
+    worker thread and resolves every caller's future with its own result.
+    Running all model work on one thread also stops concurrent requests from
+    fighting over torch's intra-op threads.
+
+    With an `executor` (InferenceExecutor) the batches run on that shared,
+    size-limited pool instead. `max_queue` bounds the requests waiting for a
+    batch (0 = unbounded); submit() raises Overloaded when it is full.
+    """
+
+    def __init__(self, batch_fn, max_wait_ms=5.0, max_batch_size=32, executor=None, max_queue=0):
+        self.batch_fn = batch_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.executor = executor
+        self.max_queue = max(0, int(max_queue))
+
+        self._queue = None
+        self._worker = None
+        self._executor = None
+
+        # --- Metrics ---
+        self.total_batches = 0
+        self.total_items = 0
+        self.last_batch_size = 0
+        self.max_seen_batch_size = 0
+        self.last_batch_seconds = 0.0
+        self.rejected = 0
+
+    async def start(self):
+        """Starts the collector task. Must be called from the running event loop."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        if self.executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="secureprompt-batch")
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stops collecting and fails anything still waiting in the queue."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        while self._queue is not None and not self._queue.empty():
+            _fail([self._queue.get_nowait()], RuntimeError("Batcher stopped"))
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def submit(self, item):
+        """Queues one item and waits for its result from the next batch."""
+        if self._worker is None:
+            raise RuntimeError("MicroBatcher.start() has not been called")
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((item, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise Overloaded(f"{self._queue.qsize()} requests waiting for a batch (limit {self.max_queue})")
+        return await future
+
+    async def _run(self):
+        batch = []
+        try:
+            while True:
+                batch = []
+                await self._run_once(batch)
+        except asyncio.CancelledError:
+            # Stopped mid-batch: the requests already taken off the queue
+            # (collected or in flight) would otherwise wait for their deadline
+            _fail(batch, RuntimeError("Batcher stopped"))
+            raise
+
+    async def _run_once(self, batch):
+        """Collects one batch into `batch` (so _run can fail it if cancelled) and runs it."""
+        loop = asyncio.get_running_loop()
+
+        # Block until there is at least one request
+        batch.append(await self._queue.get())
+        deadline = loop.time() + self.max_wait
+
+        # Collect more until the batch is full or the wait budget runs out
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Callers that gave up (e.g. client disconnected) don't need a slot
+        batch[:] = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+
+        items = [item for item, _ in batch]
+        started = time.perf_counter()
+        try:
+            if self.executor is not None:
+                results = await self.executor.run(self.batch_fn, items)
+            else:
+                results = await loop.run_in_executor(self._executor, self.batch_fn, items)
+        except Exception as e:
+            _fail(batch, e)
+            return
+        finally:
+            self._record_batch(len(items), time.perf_counter() - started)
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record_batch(self, size, seconds):
+        self.total_batches += 1
+        self.total_items += size
+        self.last_batch_size = size
+        self.max_seen_batch_size = max(self.max_seen_batch_size, size)
+        self.last_batch_seconds = seconds
+
+    def stats(self) -> dict:
+        """Current queue depth and batch-size counters."""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "total_batches": self.total_batches,
+            "total_items": self.total_items,
+            "last_batch_size": self.last_batch_size,
+            "max_seen_batch_size": self.max_seen_batch_size,
+            "avg_batch_size": round(self.total_items / self.total_batches, 2) if self.total_batches else 0.0,
+            "last_batch_seconds": round(self.last_batch_seconds, 4)
+        }
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    """Raised when the inference queue is full; the request was not started."""
+
+
+class InferenceExecutor:
+    """
+    Size-limited thread pool for model work.
+
+    At most `max_workers` calls run at once and at most `max_pending` are
+    queued or running; `run()` raises Overloaded right away beyond that
+    instead of letting latency grow without bound. A caller that stops
+    waiting (deadline, disconnect) does not free its slot until the call
+    actually finishes, so the limit always reflects the real load.
+    """
+
+    def __init__(self, max_workers=1, max_pending=64, thread_name_prefix="secureprompt-infer"):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=thread_name_prefix)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        # --- Metrics ---
+        self.total_calls = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def run(self, fn, *args):
+        """Runs fn(*args) on the pool and waits for the result."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise Overloaded(f"{self._pending} inference calls pending (limit {self.max_pending})")
+            self._pending += 1
+            self.total_calls += 1
+
+        try:
+            future = self._pool.submit(fn, *args)
+        except RuntimeError:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        # Cancelling the wrapper also cancels the call if it has not started yet
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _):
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "total_calls": self.total_calls,
+            "rejected": self.rejected
+        }
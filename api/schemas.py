@@ -1,12 +1,45 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 class PromptInput(BaseModel):
     prompt: str
     user_id: Optional[str] = "anonymous"
 
+class BatchPromptInput(BaseModel):
+    prompts: List[str]
+    user_id: Optional[str] = "anonymous"
+
 class ScanResult(BaseModel):
     status: str          # "PASS" or "BLOCK"
     reason: Optional[str] = None
     metrics: Dict[str, Any]
-    warnings: Optional[str] = None
\ No newline at end of file
+    warnings: Optional[str] = None
+
+class BatchScanResult(BaseModel):
+    results: List[ScanResult]
+
+
+class ConversationInput(BaseModel):
+    conversation_id: str
+    message: str         # the new turn only; earlier turns are remembered server-side
+    user_id: Optional[str] = "anonymous"
+
+class ConversationScanResult(ScanResult):
+    conversation_id: str
+    turn: Optional[int] = None  # None for a degraded (heuristic-only, not remembered) verdict
+
+
+class OutputInput(BaseModel):
+    response: str
+    scope: Optional[str] = None  # tenant/session whose canary to look for
+
+class OutputScanResult(BaseModel):
+    status: str          # "PASS" or "BLOCK"
+    reason: Optional[str] = None
+    findings: List[Dict[str, Any]] = []  # category, type, start, end, rule (and scope for canaries)
+
+class OutputRedactResult(BaseModel):
+    status: str          # "PASS", "REDACTED" or "BLOCK"
+    reason: Optional[str] = None
+    response: Optional[str] = None  # with matched spans replaced by placeholders; None when blocked
+    findings: List[Dict[str, Any]] = []
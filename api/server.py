@@ -0,0 +1,133 @@
+"""
+Pre-fork launcher: loads BERT and DistilGPT2 once, then forks the workers.
+
+    python -m api.server --workers 4 --port 8000
+    python main.py serve --workers 4
+
+`uvicorn --workers N` starts every worker from scratch, so each one imports
+api/app.py and loads its own copy of both models. Here the parent imports
+api/app.py (models loaded eagerly), freezes the garbage collector so the
+loaded objects are not written to again, binds the socket and forks.
+The workers inherit the weights as copy-on-write pages that are only ever
+read, so the model memory is counted once, not once per worker.
+
+Every worker pins torch to its share of the cores (serving.torch_threads,
+or cores // workers) so N workers do not each start one thread per core.
+The ONNX backend is not supported here: ONNX Runtime sessions own thread
+pools that do not survive fork.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+# Tells api/app.py to load the models before returning (never on a background
+# thread, which would not exist in the forked workers)
+PRELOAD_ENV = "SECUREPROMPT_PRELOAD"
+
+
+def _bind(host, port, backlog=2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock, torch_threads, log_level):
+    """Body of one forked worker: fresh event loop, pinned threads, shared listening socket."""
+    import uvicorn
+    from src.utils.backends import set_threads
+
+    # The parent's signal handlers must not run in the worker
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    set_threads(torch_threads)
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level))
+    server.run(sockets=[sock])
+
+
+def _fork_worker(app, sock, torch_threads, log_level) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(app, sock, torch_threads, log_level)
+        except BaseException as e:
+            print(f"[ERROR] Worker {os.getpid()} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(host="0.0.0.0", port=8000, workers=None, log_level="info"):
+    """Loads the models once, forks `workers` uvicorn workers and supervises them."""
+    os.environ[PRELOAD_ENV] = "1"
+    from api import app as app_module  # loads the pipeline in this (parent) process
+
+    config = app_module.config
+    if config["inference"]["backend"] == "onnx":
+        sys.exit("The pre-fork server does not support inference.backend 'onnx'; "
+                 "use 'eager' or 'int8', or run uvicorn --workers.")
+
+    workers = workers or config["serving"]["workers"] or os.cpu_count() or 1
+    torch_threads = config["serving"]["torch_threads"] or max(1, (os.cpu_count() or 1) // workers)
+
+    # Objects that exist now are never scanned by the GC again, so the
+    # workers do not dirty (and copy) the pages holding them
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind(host, port)
+    print(f"[INFO] Forking {workers} workers on {host}:{port} ({torch_threads} torch threads each)")
+    children = {_fork_worker(app_module.app, sock, torch_threads, log_level) for _ in range(workers)}
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Replace workers that die; forking from the loaded parent takes milliseconds
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Warning: Worker {pid} exited (status {status}). Starting a replacement.")
+            time.sleep(1.0)
+            children.add(_fork_worker(app_module.app, sock, torch_threads, log_level))
+
+    sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, help="Worker processes (default: serving.workers, else one per core)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    serve(host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
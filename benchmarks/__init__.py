@@ -0,0 +1,4 @@
+"""
+SecurePrompt benchmarks.
+Run a module with `python -m benchmarks.<name>` from the repository root.
+"""
@@ -0,0 +1,98 @@
+"""
+Compares src/utils/char_stats.py with the Counter-based statistics it
+replaced (StatisticalAnalyzer before the fused kernel), with and without
+the windowed (local) entropy.
+
+    python -m benchmarks.char_stats
+    python -m benchmarks.char_stats --lengths 300 100000 3500000 --window 64
+
+Columns: "counter" is the old entropy/length/word-count metrics,
+"stats" char_stats(window=None) (which adds the printable ratio, alphabet
+membership and character classes), "naive win" the old metrics plus one
+Counter per window, "stats win" char_stats(window=...). Expected shape:
+"stats" is at or below "counter" beyond a few hundred characters, and
+"stats win" stays linear in the length, well below "naive win".
+"""
+import argparse
+import math
+import random
+import string
+import time
+from collections import Counter
+
+from src.utils.char_stats import char_stats
+
+
+def counter_metrics(text):
+    """The metrics as StatisticalAnalyzer computed them before char_stats."""
+    counts = Counter(text)
+    entropy = 0.0
+    for count in counts.values():
+        p_x = count / len(text)
+        entropy += -p_x * math.log2(p_x)
+    return {"entropy": entropy, "length": len(text), "word_count": len(text.split())}
+
+
+def naive_windowed(text, window):
+    """counter_metrics() plus the max entropy of every window, one Counter each."""
+    metrics = counter_metrics(text)
+    step = max(1, window // 2)
+    best = 0.0
+    for offset in range(0, max(1, len(text) - step), step):
+        chunk = text[offset:offset + 2 * step]
+        best = max(best, math.log2(len(chunk)) - sum(c * math.log2(c) for c in Counter(chunk).values()) / len(chunk))
+    metrics["max_window_entropy"] = best
+    return metrics
+
+
+def make_text(length, rng):
+    """Prose-like filler with an occasional random (high-entropy) blob."""
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9))) for _ in range(500)]
+    chunks = []
+    size = 0
+    while size < length:
+        if rng.random() < 0.005:
+            chunk = "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(48))
+        else:
+            chunk = rng.choice(words)
+        chunks.append(chunk)
+        size += len(chunk) + 1
+    return " ".join(chunks)[:length]
+
+
+def per_call(fn, repeat, calls):
+    """Best-of-`repeat` milliseconds per call."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        timings.append((time.perf_counter() - start) / calls)
+    return min(timings) * 1000.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[100, 300, 1000, 10000, 100000, 1000000])
+    parser.add_argument("--window", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    print(f"{'chars':>8} | {'counter':>9} {'stats':>9} | {'naive win':>9} {'stats win':>9}   (ms per text)")
+
+    for length in args.lengths:
+        text = make_text(length, rng)
+        calls = max(1, 100000 // length)
+        row = [
+            per_call(lambda: counter_metrics(text), args.repeat, calls),
+            per_call(lambda: char_stats(text, window=None), args.repeat, calls),
+            per_call(lambda: naive_windowed(text, args.window), args.repeat, calls),
+            per_call(lambda: char_stats(text, window=args.window), args.repeat, calls),
+        ]
+        print(f"{length:>8} | {row[0]:>9.3f} {row[1]:>9.3f} | {row[2]:>9.3f} {row[3]:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
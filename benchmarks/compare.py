@@ -0,0 +1,82 @@
+"""
+Compares two benchmark result files written by benchmarks.run.
+
+    python -m benchmarks.compare results/base.json results/new.json --threshold 10
+
+Prints the relative change per layer. Exits with status 1 if any layer's
+p95 latency or throughput got worse by more than --threshold percent, so it
+can gate a CI job.
+"""
+import argparse
+import json
+import sys
+
+# metric -> True if larger is better
+METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "throughput_per_s": True,
+    "peak_rss_mb": False,
+}
+# Metrics that count towards the regression verdict
+GATED = ("p95_ms", "throughput_per_s")
+
+
+def change_percent(old, new):
+    if not old:
+        return 0.0
+    return (new - old) / old * 100.0
+
+
+def compare(base, new, threshold=10.0):
+    """Returns (rows, regressions). Each row is (layer, metric, old, new, pct, worse)."""
+    rows = []
+    regressions = []
+    for layer in base["results"]:
+        if layer not in new["results"]:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old_value = base["results"][layer][metric]
+            new_value = new["results"][layer][metric]
+            pct = change_percent(old_value, new_value)
+            worse = pct < -threshold if higher_is_better else pct > threshold
+            rows.append((layer, metric, old_value, new_value, pct, worse))
+            if worse and metric in GATED:
+                regressions.append((layer, metric, pct))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+    args = parser.parse_args(argv)
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"base: {base['meta'].get('git_commit')} ({base['meta']['timestamp']})")
+    print(f"new:  {new['meta'].get('git_commit')} ({new['meta']['timestamp']})\n")
+    if base["meta"]["n"] != new["meta"]["n"] or base["meta"]["seed"] != new["meta"]["seed"]:
+        print("[WARN] The runs used different corpora (n/seed); numbers are not directly comparable.\n")
+
+    rows, regressions = compare(base, new, args.threshold)
+    print(f"{'layer':<15} {'metric':<17} {'base':>10} {'new':>10} {'change':>9}")
+    for layer, metric, old_value, new_value, pct, worse in rows:
+        flag = "  <-- worse" if worse else ""
+        print(f"{layer:<15} {metric:<17} {old_value:>10.3f} {new_value:>10.3f} {pct:>+8.1f}%{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0f}%:")
+        for layer, metric, pct in regressions:
+            print(f"  {layer}.{metric}: {pct:+.1f}%")
+        sys.exit(1)
+    print("\nNo regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compares the compiled matchers (Aho-Corasick keywords, literal-anchored
+PatternSet for regexes) with the old one-search-per-rule loops.
+
+    python -m benchmarks.matcher
+    python -m benchmarks.matcher --rules 10 100 1000 5000 --lengths 1000 10000 100000
+
+Expected shape: the naive loops grow with rules x length, the compiled
+matchers grow with length only.
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+from src.filters.matcher import AhoCorasick, PatternSet
+
+
+def make_rules(count, rng):
+    """Random lowercase 2-4 word phrases standing in for a large blocklist."""
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 8))) for _ in range(2000)]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(2, 4))) for _ in range(count)]
+
+
+def make_text(length, rules, rng):
+    """Benign-looking filler with a few planted rule hits."""
+    chunks = []
+    size = 0
+    while size < length:
+        if rules and rng.random() < 0.01:
+            chunk = rng.choice(rules)
+        else:
+            chunk = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+        chunks.append(chunk)
+        size += len(chunk) + 1
+    return " ".join(chunks)[:length]
+
+
+def naive_keywords(rules, text):
+    lowered = text.lower()
+    return [rule for rule in rules if rule in lowered]
+
+
+def naive_regex(patterns, text):
+    return [pattern for pattern in patterns if re.search(pattern, text, re.IGNORECASE)]
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    print(f"{'rules':>6} {'chars':>8} | {'kw naive':>9} {'aho-cor.':>9} | {'re naive':>9} {'pat. set':>9}   (ms)")
+
+    for rule_count in args.rules:
+        rules = make_rules(rule_count, rng)
+        patterns = [re.escape(rule).replace(r"\ ", r"\s+") for rule in rules]
+
+        automaton = AhoCorasick(rules)
+        pattern_set = PatternSet(patterns, re.IGNORECASE)
+
+        for length in args.lengths:
+            text = make_text(length, rules, rng)
+            row = [
+                best_of(lambda: naive_keywords(rules, text), args.repeat),
+                best_of(lambda: automaton.find_all(text.lower()), args.repeat),
+                best_of(lambda: naive_regex(patterns, text), args.repeat),
+                best_of(lambda: pattern_set.find_all(text), args.repeat),
+            ]
+            print(f"{rule_count:>6} {length:>8} | {row[0]:>9.2f} {row[1]:>9.2f} | {row[2]:>9.2f} {row[3]:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Accuracy drift and speed of the inference backends against eager fp32.
+
+    python -m benchmarks.parity --backends eager int8 onnx --n 200
+    python -m benchmarks.parity --backends int8 --out results/parity.json
+
+Every backend scores the same seeded corpus (see benchmarks/corpus.py) with
+BERT and DistilGPT2. For each non-reference backend it reports how far
+bert_prob and perplexity move from the eager scores, how many BERT labels
+(prob >= 0.5) flip, the throughput of each model and which of its layers
+actually run in int8.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+from benchmarks.corpus import make_prompts, LENGTH_PROFILES
+from benchmarks.run import percentile
+
+REFERENCE = "eager"
+
+
+def score_backend(backend, prompts, batch_size, config):
+    """Loads both models on one backend and returns (bert_probs, perplexities, timings and int8 layers)."""
+    from src.analysis import PerplexityAnalyzer
+    from src.detection import BertDetector
+    from src.utils.backends import quantized_modules
+
+    settings = {"backend": backend, "onnx_dir": config["inference"]["onnx_dir"]}
+    with contextlib.redirect_stdout(io.StringIO()):
+        bert = BertDetector(**settings)
+        perplexity = PerplexityAnalyzer(**settings)
+
+        # Warm up (first calls allocate buffers / build ONNX graphs)
+        bert.predict_probabilities(prompts[:batch_size], batch_size=batch_size)
+        perplexity.calculate_scores(prompts[:batch_size], batch_size=batch_size)
+
+        started = time.perf_counter()
+        bert_probs = bert.predict_probabilities(prompts, batch_size=batch_size)
+        bert_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        ppls = perplexity.calculate_scores(prompts, batch_size=batch_size)
+        ppl_seconds = time.perf_counter() - started
+
+    timings = {
+        "bert_per_s": round(len(prompts) / bert_seconds, 2),
+        "perplexity_per_s": round(len(prompts) / ppl_seconds, 2),
+        "quantized_modules": {
+            "bert": quantized_modules(bert.model),
+            "perplexity": quantized_modules(perplexity.model)
+        }
+    }
+    return bert_probs, ppls, timings
+
+
+def drift(reference, values, relative=False):
+    """max / mean / p95 of |value - reference| (relative to the reference if asked)."""
+    diffs = []
+    for ref, value in zip(reference, values):
+        diff = abs(value - ref)
+        if relative:
+            diff = diff / ref if ref else 0.0
+        diffs.append(diff)
+    diffs.sort()
+    return {
+        "mean": round(sum(diffs) / len(diffs), 6) if diffs else 0.0,
+        "p95": round(percentile(diffs, 95), 6),
+        "max": round(diffs[-1], 6) if diffs else 0.0
+    }
+
+
+def run(backends, n=200, seed=0, length="mixed", batch_size=16, config_path=None):
+    from src.utils import load_config
+
+    config = load_config(config_path)
+    prompts = [prompt for prompt, _, _ in make_prompts(n, seed=seed, length_profile=length)]
+
+    order = [REFERENCE] + [backend for backend in backends if backend != REFERENCE]
+    scores = {}
+    for backend in order:
+        print(f"[INFO] Scoring {len(prompts)} prompts on '{backend}'...")
+        scores[backend] = score_backend(backend, prompts, batch_size, config)
+
+    ref_bert, ref_ppl, ref_timings = scores[REFERENCE]
+    results = {}
+    for backend in order:
+        bert_probs, ppls, timings = scores[backend]
+        results[backend] = {
+            **timings,
+            "bert_speedup": round(timings["bert_per_s"] / ref_timings["bert_per_s"], 2),
+            "perplexity_speedup": round(timings["perplexity_per_s"] / ref_timings["perplexity_per_s"], 2),
+            "bert_prob_abs_diff": drift(ref_bert, bert_probs),
+            "perplexity_rel_diff": drift(ref_ppl, ppls, relative=True),
+            "bert_label_flips": sum((a >= 0.5) != (b >= 0.5) for a, b in zip(ref_bert, bert_probs))
+        }
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "reference": REFERENCE,
+            "n": n,
+            "seed": seed,
+            "length_profile": length,
+            "batch_size": batch_size
+        },
+        "results": results
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=["eager", "int8", "onnx"], default=["int8", "onnx"])
+    parser.add_argument("--n", type=int, default=200, help="Prompts in the corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--length", choices=sorted(LENGTH_PROFILES), default="mixed")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--config", help="Path to config.yaml")
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    report = run(args.backends, n=args.n, seed=args.seed, length=args.length,
+                 batch_size=args.batch_size, config_path=args.config)
+
+    print(f"\n{'backend':<8} {'bert/s':>9} {'x':>5} {'ppl/s':>9} {'x':>5} "
+          f"{'bert max':>9} {'bert p95':>9} {'ppl max%':>9} {'ppl p95%':>9} {'flips':>6} {'int8 bert/ppl':>14}")
+    for backend, r in report["results"].items():
+        print(f"{backend:<8} {r['bert_per_s']:>9.1f} {r['bert_speedup']:>5.2f} "
+              f"{r['perplexity_per_s']:>9.1f} {r['perplexity_speedup']:>5.2f} "
+              f"{r['bert_prob_abs_diff']['max']:>9.4f} {r['bert_prob_abs_diff']['p95']:>9.4f} "
+              f"{r['perplexity_rel_diff']['max'] * 100:>9.2f} {r['perplexity_rel_diff']['p95'] * 100:>9.2f} "
+              f"{r['bert_label_flips']:>6} "
+              f"{len(r['quantized_modules']['bert']):>6}/{len(r['quantized_modules']['perplexity']):<7}")
+
+    if args.out:
+        directory = os.path.dirname(args.out)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
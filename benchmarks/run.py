@@ -0,0 +1,216 @@
+"""
+Latency / throughput benchmark for every detection layer and the full pipeline.
+
+    python -m benchmarks.run --n 500 --out results/base.json
+    python -m benchmarks.run --layers keyword regex encoding --length long
+    python -m benchmarks.compare results/base.json results/new.json
+
+Each layer is timed on the same seeded synthetic corpus (see
+benchmarks/corpus.py). Caches are disabled so every call does real work.
+Results (p50/p95/p99 latency, throughput, RSS) are printed and optionally
+written as JSON.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import time
+
+from benchmarks.corpus import make_prompts, make_outputs, LENGTH_PROFILES
+
+HEURISTIC_LAYERS = ["keyword", "regex", "encoding", "payloads", "statistical", "leakage", "output"]
+MODEL_LAYERS = ["perplexity", "bert", "pipeline", "pipeline_batch"]
+ALL_LAYERS = HEURISTIC_LAYERS + MODEL_LAYERS
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(q / 100.0 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(rank, 1)) - 1]
+
+
+def current_rss_mb():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def time_calls(fn, items, warmup=3):
+    """
+    Calls fn(item) for every item and returns per-call latencies (seconds)
+    plus the total wall time. Pipeline log lines are swallowed so printing
+    does not skew the numbers.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        for item in items[:warmup]:
+            fn(item)
+
+        latencies = []
+        started = time.perf_counter()
+        for item in items:
+            t0 = time.perf_counter()
+            fn(item)
+            latencies.append(time.perf_counter() - t0)
+        total = time.perf_counter() - started
+
+    return latencies, total
+
+
+def summarize(latencies, total, items_processed):
+    ordered = sorted(latencies)
+    return {
+        "calls": len(latencies),
+        "items": items_processed,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000.0, 4) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000.0, 4),
+        "p95_ms": round(percentile(ordered, 95) * 1000.0, 4),
+        "p99_ms": round(percentile(ordered, 99) * 1000.0, 4),
+        "throughput_per_s": round(items_processed / total, 2) if total > 0 else 0.0,
+        "rss_mb": round(current_rss_mb(), 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def build_pipeline(config_path, backend=None):
+    from src.monitors import SecurePromptPipeline
+    from src.utils import load_config
+
+    config = load_config(config_path)
+    # Measure real work, not cache hits
+    config["cache"]["verdicts"]["enabled"] = False
+    config["cache"]["scores"]["enabled"] = False
+    if backend:
+        config["inference"]["backend"] = backend
+    with contextlib.redirect_stdout(io.StringIO()):
+        return SecurePromptPipeline(config)
+
+
+def run(layers, n=300, seed=0, length="mixed", attack_ratio=0.2, batch_size=32, config_path=None, backend=None):
+    from src.filters import KeywordFilter, RegexRuleEngine, EncodingPatternDetector, EmbeddedPayloadScanner
+    from src.analysis import StatisticalAnalyzer
+    from src.monitors import LeakageMonitor, PolicyEnforcer, OutputScanner
+
+    corpus = make_prompts(n, seed=seed, length_profile=length, attack_ratio=attack_ratio)
+    prompts = [prompt for prompt, _, _ in corpus]
+    outputs = make_outputs(n, seed=seed)
+
+    results = {}
+    startup = None
+
+    def record(name, fn, items, items_per_call=1):
+        latencies, total = time_calls(fn, items)
+        results[name] = summarize(latencies, total, len(items) * items_per_call)
+        print(format_row(name, results[name]))
+
+    print(header())
+
+    # --- Heuristic layers (no models) ---
+    if "keyword" in layers:
+        record("keyword", KeywordFilter().scan_all, prompts)
+    if "regex" in layers:
+        record("regex", RegexRuleEngine().scan_all, prompts)
+    if "encoding" in layers:
+        record("encoding", EncodingPatternDetector().scan, prompts)
+    if "payloads" in layers:
+        record("payloads", EmbeddedPayloadScanner().scan, prompts)
+    if "statistical" in layers:
+        record("statistical", StatisticalAnalyzer().get_token_metrics, prompts)
+    if "leakage" in layers:
+        record("leakage", LeakageMonitor().check_output, outputs)
+    if "output" in layers:
+        record("output", OutputScanner(LeakageMonitor(), PolicyEnforcer()).scan, outputs)
+
+    # --- Model layers share one pipeline so the models load once ---
+    if any(layer in layers for layer in MODEL_LAYERS):
+        pipeline = build_pipeline(config_path, backend)
+        startup = pipeline.startup
+
+        if "perplexity" in layers:
+            record("perplexity", pipeline.perplexity.calculate_score, prompts)
+        if "bert" in layers:
+            record("bert", pipeline.bert.predict_probability, prompts)
+        if "pipeline" in layers:
+            record("pipeline", pipeline.scan_input, prompts)
+        if "pipeline_batch" in layers:
+            batches = [prompts[i:i + batch_size] for i in range(0, len(prompts), batch_size)]
+            latencies, total = time_calls(lambda batch: pipeline.scan_batch(batch, batch_size=batch_size), batches, warmup=1)
+            results["pipeline_batch"] = summarize(latencies, total, len(prompts))
+            print(format_row("pipeline_batch", results["pipeline_batch"]))
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "n": n,
+            "seed": seed,
+            "length_profile": length,
+            "attack_ratio": attack_ratio,
+            "batch_size": batch_size,
+            "backend": backend,
+            "startup": startup
+        },
+        "results": results
+    }
+
+
+def header():
+    return f"{'layer':<15} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'items/s':>10} {'rss MB':>8} {'peak MB':>8}"
+
+
+def format_row(name, r):
+    return (f"{name:<15} {r['p50_ms']:>9.3f} {r['p95_ms']:>9.3f} {r['p99_ms']:>9.3f} "
+            f"{r['throughput_per_s']:>10.1f} {r['rss_mb']:>8.1f} {r['peak_rss_mb']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--layers", nargs="+", choices=ALL_LAYERS, default=ALL_LAYERS)
+    parser.add_argument("--skip-models", action="store_true", help="Only run the heuristic layers")
+    parser.add_argument("--n", type=int, default=300, help="Prompts in the corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--length", choices=sorted(LENGTH_PROFILES), default="mixed")
+    parser.add_argument("--attack-ratio", type=float, default=0.2)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--config", help="Path to config.yaml")
+    parser.add_argument("--backend", choices=["eager", "int8", "onnx"], help="Override inference.backend")
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    layers = [layer for layer in args.layers if not (args.skip_models and layer in MODEL_LAYERS)]
+    report = run(layers, n=args.n, seed=args.seed, length=args.length,
+                 attack_ratio=args.attack_ratio, batch_size=args.batch_size, config_path=args.config,
+                 backend=args.backend)
+
+    if args.out:
+        directory = os.path.dirname(args.out)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
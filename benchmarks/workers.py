@@ -0,0 +1,147 @@
+"""
+Memory per API worker: `uvicorn --workers N` vs the pre-fork launcher.
+
+    python -m benchmarks.workers --workers 4
+    python -m benchmarks.workers --workers 2 4 8 --modes prefork --out results/workers.json
+
+Each mode is started on a free port and left to load its models (polls
+/health until models_ready), then every process of the server is measured
+from /proc/<pid>/smaps_rollup:
+
+    rss      resident memory, shared pages counted in every process
+    pss      proportional share: shared pages divided by the processes sharing them
+    shared   resident pages also mapped by another process
+    private  resident pages only this process has
+
+With uvicorn every worker holds its own copy of both models (high private).
+With pre-fork the weights are shared with the parent (high shared), so the
+total PSS, i.e. real memory use, grows far less with the worker count.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+MODES = {
+    "uvicorn": lambda port, workers: [sys.executable, "-m", "uvicorn", "api.app:app",
+                                      "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+    "prefork": lambda port, workers: [sys.executable, "-m", "api.server",
+                                      "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(port, workers, timeout):
+    """Polls /health until enough distinct workers report their models loaded."""
+    deadline = time.time() + timeout
+    ready = 0
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=2) as response:
+                if json.load(response).get("models_ready"):
+                    ready += 1
+                    # Requests are spread over the workers; a few in a row means all are up
+                    if ready >= workers * 3:
+                        return True
+        except OSError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def descendants(pid) -> list:
+    """pid and every process below it (from /proc/<pid>/task/*/children)."""
+    found = [pid]
+    for current in found:
+        task_dir = f"/proc/{current}/task"
+        try:
+            tasks = os.listdir(task_dir)
+        except FileNotFoundError:
+            continue
+        for task in tasks:
+            try:
+                with open(f"{task_dir}/{task}/children") as f:
+                    found.extend(int(child) for child in f.read().split())
+            except FileNotFoundError:
+                continue
+    return found
+
+
+def memory_mb(pid) -> dict:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1]) / 1024.0  # KiB -> MiB
+    shared = fields.get("Shared_Clean", 0.0) + fields.get("Shared_Dirty", 0.0)
+    private = fields.get("Private_Clean", 0.0) + fields.get("Private_Dirty", 0.0)
+    return {
+        "rss": round(fields.get("Rss", 0.0), 1),
+        "pss": round(fields.get("Pss", 0.0), 1),
+        "shared": round(shared, 1),
+        "private": round(private, 1)
+    }
+
+
+def measure(mode, workers, timeout=600):
+    port = free_port()
+    process = subprocess.Popen(MODES[mode](port, workers), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    try:
+        if not wait_ready(port, workers, timeout):
+            raise RuntimeError(f"{mode} with {workers} workers did not become ready in {timeout}s")
+        time.sleep(2.0)  # let the workers settle after their first requests
+
+        processes = {pid: memory_mb(pid) for pid in descendants(process.pid)}
+        return {
+            "processes": processes,
+            "total_rss": round(sum(p["rss"] for p in processes.values()), 1),
+            "total_pss": round(sum(p["pss"] for p in processes.values()), 1)
+        }
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[4])
+    parser.add_argument("--modes", nargs="+", choices=sorted(MODES), default=["uvicorn", "prefork"])
+    parser.add_argument("--timeout", type=int, default=600, help="Seconds to wait for the models to load")
+    parser.add_argument("--out", help="Write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'mode':<8} {'workers':>7} {'procs':>5} {'RSS MiB':>9} {'PSS MiB':>9} {'PSS/worker':>10}")
+    for mode in args.modes:
+        for workers in args.workers:
+            result = measure(mode, workers, timeout=args.timeout)
+            results[f"{mode}:{workers}"] = result
+            print(f"{mode:<8} {workers:>7} {len(result['processes']):>5} {result['total_rss']:>9.1f} "
+                  f"{result['total_pss']:>9.1f} {result['total_pss'] / workers:>10.1f}")
+
+    if args.out:
+        directory = os.path.dirname(args.out)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S")}, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
+import argparse
+import os
+import shutil
 import sys
+import time
 from src.monitors import SecurePromptPipeline
 
 
-def main():
+def interactive():
     print("========================================")
     print("   SecurePrompt - CLI Test Interface    ")
     print("========================================")
@@ -36,7 +40,7 @@ def main():
 
         print("-" * 50)
         if result["status"] == "BLOCK":
-            print(f"❌ BLOCKED (Risk Score: {risk:.4f} / Threshold: 0.5)")
+            print(f"❌ BLOCKED (Risk Score: {risk:.4f} / Threshold: {pipeline.BLOCKING_THRESHOLD})")
             print(f"   Reason: {result['reason']}")
         else:
             print(f"✅ PASSED (Risk Score: {risk:.4f})")
@@ -44,11 +48,180 @@ def main():
         # Show the "Why" (The Ensemble Voting)
         if breakdown:
             print(f"\n   📊 Model Voting Breakdown:")
-            print(f"      • Heuristic (Regex/Keys): {breakdown.get('heuristic_score', 0.0)} (Weight: 0.2)")
-            print(f"      • Perplexity (Gibberish): {breakdown.get('perplexity_norm', 0.0)} (Weight: 0.3)")
-            print(f"      • BERT AI (Semantic):     {breakdown.get('bert_prob', 0.0):.4f} (Weight: 0.5)")
+            weights = pipeline.weights
+            print(f"      • Heuristic (Regex/Keys): {breakdown.get('heuristic_score', 0.0)} (Weight: {weights['heuristic']:.2f})")
+            print(f"      • Perplexity (Gibberish): {breakdown.get('perplexity_norm', 0.0)} (Weight: {weights['perplexity']:.2f})")
+            bert_prob = breakdown.get('bert_prob')
+            bert_text = f"{bert_prob:.4f}" if bert_prob is not None else "skipped"
+            print(f"      • BERT AI (Semantic):     {bert_text} (Weight: {weights['bert']:.2f})")
+            if "similarity" in weights:
+                similarity = breakdown.get('similarity_norm')
+                similarity_text = f"{similarity:.4f}" if similarity is not None else "skipped"
+                print(f"      • Known Attacks (Nearest): {similarity_text} (Weight: {weights['similarity']:.2f})")
+            if "divergence" in weights:
+                divergence = breakdown.get('divergence_norm')
+                divergence_text = f"{divergence:.4f}" if divergence is not None else "skipped"
+                print(f"      • Divergence (Mutants):   {divergence_text} (Weight: {weights['divergence']:.2f})")
         print("-" * 50)
 
 
+def scan_file_command(args):
+    from src.tools.bulk_scan import scan_file
+
+    summary = scan_file(
+        args.input,
+        args.output,
+        fmt=args.format,
+        field=args.field,
+        id_field=args.id_field,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        resume=args.resume,
+        config_path=args.config,
+        torch_threads=args.threads
+    )
+    print(f"[INFO] Done: {summary}")
+
+
+def build_index_command(args):
+    from src.detection import BertDetector
+    from src.detection.attack_index import build_index
+    from src.utils import load_config
+
+    config = load_config(args.config)
+    settings = config["attack_index"]
+    index_path = args.index or settings["path"]
+    if not args.append and os.path.exists(index_path):
+        shutil.rmtree(index_path)
+
+    # Embed with the same backend the pipeline will query with
+    detector = BertDetector(backend=config["inference"]["backend"], onnx_dir=config["inference"]["onnx_dir"])
+    added = build_index(args.input, index_path, detector, fmt=args.format, field=args.field,
+                        batch_size=args.batch_size, dtype=settings["dtype"])
+    print(f"[INFO] Added {added} attack prompts to {index_path}")
+
+
+def serve_command(args):
+    from api.server import serve
+
+    serve(host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+
+
+def calibrate_command(args):
+    from src.tools.calibrate import calibrate
+
+    calibrate(
+        args.input,
+        cache_path=args.cache,
+        fmt=args.format,
+        field=args.field,
+        label_field=args.label_field,
+        batch_size=args.batch_size,
+        config_path=args.config,
+        rescore=args.rescore,
+        step=args.step,
+        bins=args.bins,
+        objective=args.objective,
+        fn_cost=args.fn_cost,
+        fp_cost=args.fp_cost,
+        max_fpr=args.max_fpr,
+        report_path=args.report,
+        write=args.write
+    )
+
+
+def audit_command(args):
+    from src.utils import load_config
+    from src.utils.audit import query, parse_time
+
+    path = args.path or load_config(args.config)["audit"]["path"]
+    rows = query(path, since=parse_time(args.since), until=parse_time(args.until), user=args.user,
+                 status=args.status, where=args.where, limit=args.limit)
+    if args.format == "jsonl":
+        print(rows.to_json(orient="records", lines=True), end="")
+        return
+    columns = ["ts", "user_id", "status", "total_risk", "heuristic_score", "perplexity_norm", "bert_prob",
+               "scan_ms", "reason", "prompt_sha256"]
+    rows = rows[columns].copy()
+    rows["ts"] = rows["ts"].map(lambda ts: time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts)))
+    print(rows.to_string(index=False))
+    print(f"[INFO] {len(rows)} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SecurePrompt - prompt injection scanner")
+    commands = parser.add_subparsers(dest="command")
+
+    scan = commands.add_parser("scan-file", help="Scan a JSONL/CSV corpus and write verdicts as JSONL")
+    scan.add_argument("input", help="Input .jsonl or .csv file")
+    scan.add_argument("-o", "--output", required=True, help="Output .jsonl file (checkpoint: <output>.ckpt)")
+    scan.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from extension)")
+    scan.add_argument("--field", default="prompt", help="Field/column holding the prompt")
+    scan.add_argument("--id-field", help="Field/column used as record id (default: record number)")
+    scan.add_argument("--workers", type=int, default=1, help="Worker processes (0 = run in this process)")
+    scan.add_argument("--batch-size", type=int, default=32, help="Prompts per model batch")
+    scan.add_argument("--threads", type=int, help="Torch threads per worker (default: cores / workers)")
+    scan.add_argument("--resume", action="store_true", help="Continue from the last checkpoint")
+    scan.add_argument("--config", help="Path to config.yaml")
+
+    index = commands.add_parser("build-index", help="Embed known attack prompts into the attack index")
+    index.add_argument("input", help="Input .jsonl or .csv file of attack prompts")
+    index.add_argument("--index", help="Index directory (default: attack_index.path from config.yaml)")
+    index.add_argument("--append", action="store_true", help="Add to an existing index instead of rebuilding it")
+    index.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from extension)")
+    index.add_argument("--field", default="prompt", help="Field/column holding the prompt")
+    index.add_argument("--batch-size", type=int, default=32, help="Prompts per BERT batch")
+    index.add_argument("--config", help="Path to config.yaml")
+
+    serve = commands.add_parser("serve", help="Run the API with the models loaded once and shared by forked workers")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--workers", type=int, help="Worker processes (default: serving.workers, else one per core)")
+    serve.add_argument("--log-level", default="info")
+
+    calibrate = commands.add_parser("calibrate", help="Tune weights, threshold and perplexity curve on a labelled corpus")
+    calibrate.add_argument("input", help="Labelled .jsonl or .csv file")
+    calibrate.add_argument("--cache", help="Score cache (default: <input>.scores.npz)")
+    calibrate.add_argument("--rescore", action="store_true", help="Score the corpus again even if cached")
+    calibrate.add_argument("--format", choices=["jsonl", "csv"], help="Input format (default: from extension)")
+    calibrate.add_argument("--field", default="prompt", help="Field/column holding the prompt")
+    calibrate.add_argument("--label-field", default="label", help="Field/column holding the label (1/0, attack/benign)")
+    calibrate.add_argument("--batch-size", type=int, default=32, help="Prompts per model batch")
+    calibrate.add_argument("--step", type=float, default=0.05, help="Weight grid step")
+    calibrate.add_argument("--bins", type=int, default=1000, help="Thresholds evaluated (k / bins)")
+    calibrate.add_argument("--objective", choices=["cost", "f1"], default="cost")
+    calibrate.add_argument("--fn-cost", type=float, default=1.0, help="Cost of a missed attack")
+    calibrate.add_argument("--fp-cost", type=float, default=1.0, help="Cost of a blocked benign prompt")
+    calibrate.add_argument("--max-fpr", type=float, help="Only consider settings with at most this false positive rate")
+    calibrate.add_argument("--report", help="Write the result with ROC/PR curves to this JSON file")
+    calibrate.add_argument("--write", action="store_true", help="Write the best settings into config.yaml")
+    calibrate.add_argument("--config", help="Path to config.yaml")
+
+    audit = commands.add_parser("audit", help="Query the audit log of scan verdicts")
+    audit.add_argument("--path", help="Audit directory (default: audit.path from config.yaml)")
+    audit.add_argument("--since", help="Start time: 7d, 12h, 30m, a Unix timestamp or an ISO date")
+    audit.add_argument("--until", help="End time (same formats as --since)")
+    audit.add_argument("--user", help="Only this user_id")
+    audit.add_argument("--status", choices=["PASS", "BLOCK"], help="Only this verdict")
+    audit.add_argument("--where", help='Extra pandas query over the columns, e.g. "bert_prob > 0.9"')
+    audit.add_argument("--limit", type=int, default=100, help="Newest N rows (0 = all)")
+    audit.add_argument("--format", choices=["table", "jsonl"], default="table")
+    audit.add_argument("--config", help="Path to config.yaml")
+
+    args = parser.parse_args()
+    if args.command == "scan-file":
+        scan_file_command(args)
+    elif args.command == "build-index":
+        build_index_command(args)
+    elif args.command == "serve":
+        serve_command(args)
+    elif args.command == "calibrate":
+        calibrate_command(args)
+    elif args.command == "audit":
+        audit_command(args)
+    else:
+        interactive()
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
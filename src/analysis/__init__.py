@@ -1,4 +1,11 @@
-from .perplexity import PerplexityAnalyzer
 from .statistical import StatisticalAnalyzer
 from .divergence import DivergenceAnalyzer
-from .drift_detector import DriftDetector
\ No newline at end of file
+from .drift_detector import DriftDetector, SessionDriftTracker
+
+
+def __getattr__(name):
+    # The perplexity model needs torch; the other analyzers do not
+    if name in ("PerplexityAnalyzer", "PerplexityContext"):
+        from . import perplexity
+        return getattr(perplexity, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
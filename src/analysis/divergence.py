@@ -1,45 +1,101 @@
-import random
+import hashlib
+
 import numpy as np
-from scipy.special import rel_entr
 
 
 class DivergenceAnalyzer:
-    def __init__(self, mutation_rate=0.1):
+    """
+    JailGuard-style divergence: a jailbreak tends to be brittle, so the
+    detector's verdicts on slightly mutated copies of it disagree more than
+    on a benign prompt. The spread is the mean pairwise KL divergence of
+    the classifier's distributions over the original and its mutants.
+
+    Mutations are reproducible: every prompt gets its own RNG seeded from
+    `seed` and the prompt text, so the same prompt always gets the same
+    mutants (and no global random state is shared between threads).
+    """
+
+    def __init__(self, mutation_rate=0.1, num_mutants=8, seed=0):
         self.mutation_rate = mutation_rate
+        self.num_mutants = num_mutants
+        self.seed = seed
+
+    def rng_for(self, text: str) -> np.random.Generator:
+        digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+        return np.random.default_rng([self.seed, int.from_bytes(digest, "little")])
 
-    def mutate_input(self, text: str) -> str:
+    def mutate_input(self, text: str, rng=None) -> str:
         """
         Applies JAILGUARD-style random mutations (Swap/Delete) to the input.
         Ref: Base Paper, Section 4.2.1 [cite: 363-366]
         """
-        chars = list(text)
-        num_mutations = max(1, int(len(chars) * self.mutation_rate))
+        return self.mutants(text, 1, rng)[0]
+
+    def mutants(self, text: str, k=None, rng=None) -> list:
+        """
+        `k` mutated copies of `text` (default num_mutants). Each one picks
+        mutation_rate * len positions at once; every position is either
+        swapped with the next character or deleted, applied as one index
+        array over the code points instead of edit-by-edit.
+        """
+        k = self.num_mutants if k is None else k
+        codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        n = len(codes)
+        if n < 2:
+            return [text] * k
+
+        rng = self.rng_for(text) if rng is None else rng
+        num_mutations = min(max(1, int(n * self.mutation_rate)), n - 1)
 
-        for _ in range(num_mutations):
-            if len(chars) < 2: break
-            idx = random.randint(0, len(chars) - 1)
-            op = random.choice(['swap', 'delete'])
+        results = []
+        for _ in range(k):
+            positions = np.sort(rng.choice(n - 1, size=num_mutations, replace=False))
+            is_swap = rng.random(num_mutations) < 0.5
 
-            if op == 'swap':
-                swap_idx = (idx + 1) % len(chars)
-                chars[idx], chars[swap_idx] = chars[swap_idx], chars[idx]
-            elif op == 'delete' and len(chars) > 5:
-                chars.pop(idx)
+            order = np.arange(n)
+            swaps = positions[is_swap]
+            # Adjacent swaps would overlap; keep every character moving at most once
+            if len(swaps) > 1:
+                swaps = swaps[np.concatenate(([True], np.diff(swaps) > 1))]
+            order[swaps], order[swaps + 1] = swaps + 1, swaps
 
-        return "".join(chars)
+            keep = np.ones(n, dtype=bool)
+            if n > 5:
+                keep[positions[~is_swap]] = False
+
+            results.append(codes[order[keep]].tobytes().decode("utf-32-le", "surrogatepass"))
+        return results
 
     def calculate_kl_divergence(self, probs_p, probs_q) -> float:
         """
         Calculates Kullback-Leibler Divergence between two probability distributions.
         Ref: Base Paper Eq (3) [cite: 233-234]
         """
+        return float(self.kl_matrix([probs_p, probs_q])[0, 1])
+
+    def kl_matrix(self, distributions) -> np.ndarray:
+        """
+        KL(P_i || P_j) for every pair of rows of `distributions` ([n, classes]):
+        sum(p_i * log p_i) - p_i . log p_j, as one matrix product.
+        """
         # Add epsilon to prevent log(0) errors
         epsilon = 1e-10
-        p = np.array(probs_p) + epsilon
-        q = np.array(probs_q) + epsilon
+        p = np.asarray(distributions, dtype=np.float64) + epsilon
 
         # Normalize
-        p /= p.sum()
-        q /= q.sum()
+        p /= p.sum(axis=1, keepdims=True)
 
-        return sum(rel_entr(p, q))
\ No newline at end of file
+        log_p = np.log(p)
+        return (p * log_p).sum(axis=1)[:, None] - p @ log_p.T
+
+    def spread(self, attack_probs) -> float:
+        """
+        Mean pairwise KL over binary classifier outputs (original first, then
+        its mutants), each given as P(attack).
+        """
+        probs = np.asarray(attack_probs, dtype=np.float64)
+        if len(probs) < 2:
+            return 0.0
+        kl = self.kl_matrix(np.stack([1.0 - probs, probs], axis=1))
+        n = len(probs)
+        return float((kl.sum() - np.trace(kl)) / (n * (n - 1)))
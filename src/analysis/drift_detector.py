@@ -1,31 +1,133 @@
-import numpy as np
+import math
+import threading
+from array import array
+
+# Scores needed before a z-score is trusted
+MIN_HISTORY = 5
+
+
+class RollingStats:
+    """
+    Mean and standard deviation of the last `window` values in O(1) per
+    update: a fixed ring buffer (unboxed doubles) plus running sums.
+    """
+
+    __slots__ = ("values", "pos", "count", "total", "total_sq")
+
+    def __init__(self, window):
+        self.values = array("d", bytes(8 * window))
+        self.pos = 0
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def push(self, value):
+        if self.count == len(self.values):
+            old = self.values[self.pos]
+            self.total -= old
+            self.total_sq -= old * old
+        else:
+            self.count += 1
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % len(self.values)
+        self.total += value
+        self.total_sq += value * value
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def std(self) -> float:
+        """Population standard deviation (same as np.std)."""
+        if not self.count:
+            return 0.0
+        mean = self.total / self.count
+        # Running sums can dip just below zero through rounding
+        return math.sqrt(max(0.0, self.total_sq / self.count - mean * mean))
+
+    def to_list(self) -> list:
+        """JSON-friendly state for a shared store."""
+        return [self.pos, self.count, self.total, self.total_sq, *self.values]
+
+    @classmethod
+    def from_list(cls, state):
+        stats = cls(len(state) - 4)
+        stats.pos, stats.count, stats.total, stats.total_sq = int(state[0]), int(state[1]), state[2], state[3]
+        stats.values = array("d", state[4:])
+        return stats
+
+
+def _check(stats, new_score, threshold_std, min_std=0.0, min_history=MIN_HISTORY) -> tuple:
+    """
+    Z-score of new_score against the history, then adds it to the history.
+    The std is floored at `min_std`: a nearly constant history would
+    otherwise turn any small change into a huge z-score.
+    """
+    is_anomaly = False
+    drift_score = 0.0
+
+    if stats.count >= min_history:
+        std = max(stats.std(), min_std, 1e-9)  # Avoid div by zero
+        drift_score = (new_score - stats.mean()) / std
+
+        if abs(drift_score) > threshold_std:
+            is_anomaly = True
+
+    stats.push(new_score)
+    return is_anomaly, drift_score
 
 
 class DriftDetector:
     def __init__(self, window_size=10, threshold_std=2.0):
-        self.history = []
         self.window_size = window_size
         self.threshold_std = threshold_std
+        self.stats = RollingStats(window_size)
 
     def update_and_check(self, new_score: float) -> tuple:
         """
         Adds new score to history and checks for Z-Score anomaly.
         Returns: (is_anomaly (bool), drift_score (float))
         """
-        is_anomaly = False
-        drift_score = 0.0
+        return _check(self.stats, new_score, self.threshold_std)
 
-        if len(self.history) >= 5:
-            mean = np.mean(self.history)
-            std = np.std(self.history) + 1e-9  # Avoid div by zero
 
-            drift_score = (new_score - mean) / std
+class SessionDriftTracker:
+    """
+    One DriftDetector-style window per user/session. Unlike DriftDetector,
+    a session is only judged once it has `min_history` scores, and its std
+    is floored at `min_std`.
+
+    States live in a cache-like store: an LRUCache (bounded entry count, idle
+    sessions expire after its TTL, every update refreshes it) or a
+    SqliteCache shared by several workers, where states are stored as JSON
+    lists. With a shared store two workers updating the same session at the
+    same moment can drop one score; drift is a soft signal, so that is
+    accepted instead of taking a cross-process lock.
+    """
+
+    def __init__(self, store, window_size=10, threshold_std=2.0, shared=False, min_std=0.05, min_history=10):
+        self.store = store
+        self.window_size = window_size
+        self.threshold_std = threshold_std
+        self.shared = shared
+        self.min_std = min_std
+        # Scores a session needs before it is judged (a full window at most)
+        self.min_history = max(MIN_HISTORY, min(min_history, window_size))
+        self._lock = threading.Lock()
 
-            if abs(drift_score) > self.threshold_std:
-                is_anomaly = True
+    def update_and_check(self, session_id, new_score: float) -> tuple:
+        """Same as DriftDetector.update_and_check, for one session's history."""
+        with self._lock:
+            state = self.store.get(session_id)
+            if state is None:
+                stats = RollingStats(self.window_size)
+            elif self.shared:
+                stats = RollingStats.from_list(state)
+            else:
+                stats = state
 
-        self.history.append(new_score)
-        if len(self.history) > self.window_size:
-            self.history.pop(0)
+            result = _check(stats, new_score, self.threshold_std, self.min_std, self.min_history)
+            self.store.put(session_id, stats.to_list() if self.shared else stats)
+        return result
 
-        return is_anomaly, drift_score
\ No newline at end of file
+    def stats(self) -> dict:
+        return self.store.stats()
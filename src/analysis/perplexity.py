@@ -1,11 +1,52 @@
 import torch
 import os
 import math
+import torch.nn.functional as F
 from transformers import GPT2LMHeadModel, GPT2TokenizerFast
+from src.utils.cache import content_key
+from src.utils.metrics import NULL_METRICS
+from src.utils.backends import load_model, supports_kv_cache
+
+
+class PerplexityContext:
+    """
+    Running state of a text scored piece by piece (e.g. a conversation):
+    the KV cache, the logits of its last token and its last tokens (to
+    rebuild the cache from). `window` caps the cached tokens below the
+    model's context, which bounds the memory of each context.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.past = None
+        self.cache_len = 0
+        self.last_logits = None
+        self.tail = []
+        self.tokens = 0
+
+    def push(self, ids, keep):
+        self.tail = (self.tail + list(ids))[-keep:] if keep > 0 else []
+        self.tokens += len(ids)
+
+    def release(self):
+        """Drops the KV cache; the next extend() rebuilds it from the last tokens."""
+        self.past = None
+        self.cache_len = 0
+        self.last_logits = None
+
+    @property
+    def cached(self) -> bool:
+        return self.past is not None
 
 
 class PerplexityAnalyzer:
-    def __init__(self, model_path='models/distilgpt2_finetuned'):
+    def __init__(self, model_path='models/distilgpt2_finetuned', cache=None,
+                 window=None, stride=256, long_text_score="max_window", metrics=None,
+                 backend="eager", onnx_dir="models/onnx"):
+        # Optional score cache (e.g. LRUCache): text hash -> perplexity
+        self.cache = cache
+        # Optional Metrics registry: tokenize / forward timings
+        self.metrics = metrics or NULL_METRICS
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
         # Check if local model exists, otherwise verify path
@@ -14,24 +55,260 @@ class PerplexityAnalyzer:
             model_path = 'distilgpt2'
         else:
             print(f"Loading Fine-Tuned GPT from {model_path}...")
+        self.model_path = model_path
 
         self.tokenizer = GPT2TokenizerFast.from_pretrained(model_path)
-        self.model = GPT2LMHeadModel.from_pretrained(model_path).to(self.device)
-        self.model.eval()
+        # GPT-2 ships without a pad token; padded positions are masked out of the loss anyway
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "right"
+
+        # eager fp32, int8-quantized or ONNX Runtime (see src/utils/backends.py)
+        self.backend = backend
+        self.model = load_model(GPT2LMHeadModel, model_path, backend=backend, device=self.device, onnx_dir=onnx_dir)
+
+        # Sliding-window settings for texts longer than the model context
+        max_positions = self.model.config.n_positions
+        self.window = min(window or max_positions, max_positions)
+        self.stride = max(1, min(stride, self.window // 2))
+        # "max_window": score long texts by their worst window (a gibberish
+        # suffix is not averaged away); "mean": perplexity over the whole text
+        self.long_text_score = long_text_score
 
     def calculate_score(self, text: str) -> float:
         """
         Calculates Perplexity (PPL). Lower = More natural. Higher = Anomalous.
         Formula: exp(CrossEntropyLoss)
         """
-        if not text or len(text.strip()) == 0:
-            return 0.0
+        return self.calculate_scores([text])[0]
+
+    def calculate_scores(self, texts, batch_size=16) -> list:
+        """
+        Batched version of calculate_score.
+        Texts are sorted by token length and padded per bucket, so each forward
+        pass wastes as little compute on padding as possible. The loss is
+        computed per sample with the attention mask, which gives the same
+        value as running every text on its own.
+        """
+        scores = [0.0] * len(texts)
 
-        encodings = self.tokenizer(text, return_tensors='pt').to(self.device)
+        # Group identical texts so each one is scored (or looked up) once
+        positions = {}
+        for i, text in enumerate(texts):
+            if not text or len(text.strip()) == 0:
+                continue
+            positions.setdefault(text, []).append(i)
+
+        uncached = []
+        for text, indices in positions.items():
+            if self.cache is not None:
+                cached = self.cache.get(content_key(text))
+                if cached is not None:
+                    for i in indices:
+                        scores[i] = cached
+                    continue
+            uncached.append(text)
+
+        # Tokenize once (no padding) to get lengths for bucketing; the fast
+        # tokenizer encodes the whole list in one call
+        if uncached:
+            with self.metrics.timer("perplexity.tokenize"):
+                encoded = self.tokenizer(uncached).input_ids
+        else:
+            encoded = []
+
+        pending = []
+        for text, ids in zip(uncached, encoded):
+            indices = positions[text]
+            # A single token has nothing to predict, so there is no loss to average
+            if len(ids) < 2:
+                continue
+
+            # Too long for one forward pass: score it window by window
+            if len(ids) > self.window:
+                with self.metrics.timer("perplexity.forward"):
+                    result = self._windowed(ids)
+                ppl = result["max_window"] if self.long_text_score == "max_window" else result["perplexity"]
+                if self.cache is not None:
+                    self.cache.put(content_key(text), ppl)
+                for i in indices:
+                    scores[i] = ppl
+                continue
+
+            pending.append((text, ids))
+
+        pending.sort(key=lambda item: len(item[1]))
+
+        for start in range(0, len(pending), batch_size):
+            bucket = pending[start:start + batch_size]
+            with self.metrics.timer("perplexity.forward"):
+                losses = self._batch_loss([ids for _, ids in bucket])
+            for (text, _), loss in zip(bucket, losses):
+                ppl = math.exp(loss)
+                if self.cache is not None:
+                    self.cache.put(content_key(text), ppl)
+                for i in positions[text]:
+                    scores[i] = ppl
+
+        return scores
+
+    def _batch_loss(self, batch_ids) -> list:
+        """Mean token cross-entropy for each (unpadded) sequence in the batch."""
+        encodings = self.tokenizer.pad({"input_ids": batch_ids}, return_tensors='pt').to(self.device)
         input_ids = encodings.input_ids
+        attention_mask = encodings.attention_mask
+
+        with torch.no_grad():
+            logits = self.model(input_ids, attention_mask=attention_mask).logits
+
+        # Shift so that tokens < n predict token n (same as the model's built-in loss)
+        shift_logits = logits[:, :-1, :].float()
+        shift_labels = input_ids[:, 1:]
+        shift_mask = attention_mask[:, 1:].float()
+
+        token_loss = F.cross_entropy(
+            shift_logits.transpose(1, 2), shift_labels, reduction='none'
+        )
+        sample_loss = (token_loss * shift_mask).sum(dim=1) / shift_mask.sum(dim=1)
+
+        return sample_loss.tolist()
+
+    def calculate_windowed(self, text: str) -> dict:
+        """
+        Strided sliding-window perplexity for texts of any length.
+        Returns the overall perplexity, the perplexity of every `stride`-token
+        window and the worst window, so an anomalous region inside a long
+        benign prompt stays visible.
+        """
+        ids = self.tokenizer(text).input_ids if text else []
+        if len(ids) < 2:
+            return {"perplexity": 0.0, "windows": [], "max_window": 0.0, "tokens": len(ids)}
+        return self._windowed(ids)
+
+    def _windowed(self, ids) -> dict:
+        """
+        Scores `stride` new tokens per forward pass (see _advance), so each
+        token is run through the model about once.
+        """
+        token_nll, windows = self._advance(PerplexityContext(), ids)
+        return self._window_summary(token_nll, windows, len(ids), max(1, min(self.stride, self.window // 2)))
+
+    def extend(self, context, text: str, separator="\n") -> float:
+        """
+        Perplexity of `text` given everything fed to `context` before it
+        (e.g. the earlier turns of a conversation), then appends it. Only
+        the new tokens go through the model: the KV cache in `context`
+        stands for the rest. Not cached, since the score depends on the context.
+        """
+        if not text:
+            return 0.0
+        with self.metrics.timer("perplexity.tokenize"):
+            ids = self.tokenizer((separator if context.tokens else "") + text).input_ids
+        with self.metrics.timer("perplexity.forward"):
+            token_nll, _ = self._advance(context, ids)
+        if not token_nll:
+            return 0.0
+        return math.exp(torch.cat(token_nll).mean().item())
+
+    def _advance(self, context, ids) -> tuple:
+        """
+        Feeds `ids` to `context` `stride` tokens at a time and returns
+        (per-chunk token NLL tensors, per-chunk perplexities).
+
+        With a KV cache (past_key_values) each step only runs the new tokens.
+        GPT-2 has absolute positions, so when the cache would exceed the
+        window it is rebuilt from the last window/2 tokens (the same happens
+        after context.release()). That keeps memory flat, and every token
+        still gets at least window/2 tokens of context.
+        """
+        window = min(context.window or self.window, self.window)
+        stride = max(1, min(self.stride, window // 2))
+        if not supports_kv_cache(self.model):
+            return self._advance_recompute(context, ids, window, stride)
+
+        keep = window // 2
+        token_nll = []
+        windows = []
 
         with torch.no_grad():
-            outputs = self.model(input_ids, labels=input_ids)
-            loss = outputs.loss
+            for start in range(0, len(ids), stride):
+                chunk = ids[start:start + stride]
+
+                if context.tail and (context.past is None or context.cache_len + len(chunk) > window):
+                    prefix = torch.tensor([context.tail[-keep:]], device=self.device)
+                    outputs = self.model(prefix, use_cache=True)
+                    context.past = outputs.past_key_values
+                    context.cache_len = prefix.shape[1]
+                    context.last_logits = outputs.logits[0, -1:]
+
+                outputs = self.model(
+                    torch.tensor([chunk], device=self.device),
+                    past_key_values=context.past,
+                    use_cache=True
+                )
+                logits = outputs.logits[0]
+                targets = torch.tensor(chunk, device=self.device)
+
+                # Token i is predicted by the logits at i-1 (the previous chunk's last step for i = 0)
+                if context.last_logits is not None:
+                    predictions = torch.cat([context.last_logits, logits[:-1]])
+                else:
+                    predictions, targets = logits[:-1], targets[1:]
+
+                if len(targets) > 0:
+                    nll = F.cross_entropy(predictions.float(), targets, reduction='none')
+                    token_nll.append(nll)
+                    windows.append(math.exp(nll.mean().item()))
+
+                context.past = outputs.past_key_values
+                context.cache_len += len(chunk)
+                context.last_logits = logits[-1:]
+                context.push(chunk, keep)
+
+        return token_nll, windows
+
+    def _advance_recompute(self, context, ids, window, stride) -> tuple:
+        """
+        _advance for backends without a KV cache (ONNX): every step re-runs
+        the `window - stride` tokens before the chunk as context. Costs more
+        compute per token, but gives each token at least as much context.
+        """
+        context_len = window - stride
+        token_nll = []
+        windows = []
+
+        with torch.no_grad():
+            for start in range(0, len(ids), stride):
+                chunk = ids[start:start + stride]
+                prefix = context.tail[-context_len:] if context_len > 0 else []
+                logits = self.model(torch.tensor([prefix + chunk], device=self.device)).logits[0]
+                targets = torch.tensor(chunk, device=self.device)
+
+                # Token i is predicted by the logits at i-1; the very first token has no prediction
+                offset = len(prefix)
+                if offset > 0:
+                    predictions = logits[offset - 1:offset - 1 + len(chunk)]
+                else:
+                    predictions, targets = logits[:-1], targets[1:]
+
+                if len(targets) > 0:
+                    nll = F.cross_entropy(predictions.float(), targets, reduction='none')
+                    token_nll.append(nll)
+                    windows.append(math.exp(nll.mean().item()))
+
+                context.push(chunk, context_len)
+
+        return token_nll, windows
 
-        return math.exp(loss.item())
\ No newline at end of file
+    @staticmethod
+    def _window_summary(token_nll, windows, tokens, stride) -> dict:
+        perplexity = math.exp(torch.cat(token_nll).mean().item())
+        if len(token_nll) > 1 and len(token_nll[-1]) < stride:
+            # A short last chunk (down to one token) would set max_window on its own: fold it into the previous window
+            windows = windows[:-2] + [math.exp(torch.cat(token_nll[-2:]).mean().item())]
+        return {
+            "perplexity": perplexity,
+            "windows": windows,
+            "max_window": max(windows),
+            "tokens": tokens
+        }
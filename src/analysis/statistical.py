@@ -1,8 +1,11 @@
-import math
-from collections import Counter
+from src.utils.char_stats import char_stats, char_stats_batch
 
 
 class StatisticalAnalyzer:
+    def __init__(self, window=64):
+        # Span (chars) of the local entropy window used to find embedded blobs
+        self.window = window
+
     def calculate_entropy(self, text: str) -> float:
         """
         Calculates Shannon Entropy.
@@ -10,21 +13,24 @@ class StatisticalAnalyzer:
         """
         if not text:
             return 0.0
-
-        counts = Counter(text)
-        total_len = len(text)
-        entropy = 0.0
-
-        for count in counts.values():
-            p_x = count / total_len
-            if p_x > 0:
-                entropy += -p_x * math.log2(p_x)
-
-        return entropy
+        return char_stats(text, window=None)["entropy"]
 
     def get_token_metrics(self, text: str) -> dict:
-        return {
-            "entropy": self.calculate_entropy(text),
-            "length": len(text),
-            "word_count": len(text.split())
-        }
\ No newline at end of file
+        return self.get_token_metrics_batch([text])[0]
+
+    def get_token_metrics_batch(self, texts) -> list:
+        """
+        Batched get_token_metrics: one fused pass (src/utils/char_stats.py)
+        gives entropy, length and word count plus printable ratio and the
+        highest local (windowed) entropy of every text.
+        """
+        return [
+            {
+                "entropy": stats["entropy"],
+                "length": stats["length"],
+                "word_count": stats["word_count"],
+                "printable_ratio": stats["printable_ratio"],
+                "max_window_entropy": stats["max_window_entropy"]
+            }
+            for stats in char_stats_batch(texts, window=self.window)
+        ]
\ No newline at end of file
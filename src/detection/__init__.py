@@ -1,2 +1,3 @@
 from .classifier import BertDetector
-from .semantic_drift import SemanticDriftCalculator
\ No newline at end of file
+from .semantic_drift import SemanticDriftCalculator
+from .attack_index import AttackIndex
\ No newline at end of file
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+# Rows multiplied per step when the matrix is stored as float16 (converted to float32 chunk by chunk)
+CHUNK_ROWS = 65536
+
+
+def l2_normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class AttackIndex:
+    """
+    Nearest-known-attack lookup over L2-normalized BERT [CLS] embeddings.
+
+    The index is a directory holding:
+        embeddings.bin   raw row-major float16/float32 matrix, memory-mapped
+        prompts.jsonl    one {"text": ...} record per row
+        meta.json        dim, dtype, row count and prompts.jsonl size
+    Appending writes new rows to the end of both files and then bumps the
+    sizes in meta.json, so readers never see a half-written row; anything
+    past the recorded sizes (a crashed append) is cut off by the next one.
+    """
+
+    def __init__(self, path, dim=768, dtype="float16"):
+        self.path = path
+        self._lock = threading.Lock()
+
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            dim, dtype = meta["dim"], meta["dtype"]
+            count, texts_bytes = meta["count"], meta["texts_bytes"]
+        else:
+            count, texts_bytes = 0, 0
+
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        self.count = count
+        self.texts_bytes = texts_bytes
+        self.texts = self._read_texts(count)
+        self.matrix = self._map(count)
+
+        # Running hashes of both files: appends only add to the end, so they are
+        # hashed once at load and then updated with the appended bytes
+        self._hashes = {
+            "embeddings.bin": self._hash_file("embeddings.bin", count * self.dim * self.dtype.itemsize),
+            "prompts.jsonl": self._hash_file("prompts.jsonl", texts_bytes)
+        }
+        self.digest = self._digest()
+
+    def __len__(self):
+        return self.count
+
+    def _hash_file(self, name, size):
+        """sha256 of the first `size` bytes of the file."""
+        digest = hashlib.sha256()
+        if size:
+            with open(os.path.join(self.path, name), "rb") as f:
+                while size > 0:
+                    chunk = f.read(min(size, 1 << 20))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size -= len(chunk)
+        return digest
+
+    def _digest(self) -> str:
+        """Identifies the index contents (not just its shape) for cache fingerprints."""
+        contents = hashlib.sha256(b"".join(h.digest() for h in self._hashes.values())).hexdigest()[:16]
+        return f"{self.count}x{self.dim}:{self.dtype.name}:{contents}"
+
+    def _map(self, count):
+        if count == 0:
+            return np.zeros((0, self.dim), dtype=self.dtype)
+        return np.memmap(os.path.join(self.path, "embeddings.bin"), dtype=self.dtype, mode="r",
+                         shape=(count, self.dim))
+
+    def _read_texts(self, count):
+        texts = []
+        prompts_path = os.path.join(self.path, "prompts.jsonl")
+        if count and os.path.exists(prompts_path):
+            with open(prompts_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if len(texts) == count:
+                        break
+                    texts.append(json.loads(line)["text"])
+        return texts
+
+    def append(self, texts, embeddings):
+        """Adds attack prompts with their [CLS] embeddings ([n, dim]) to the index."""
+        vectors = l2_normalize(embeddings)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding size {vectors.shape[1]} does not match the index ({self.dim})")
+        if len(texts) != len(vectors):
+            raise ValueError("append() needs one embedding per text")
+
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            lines = "".join(json.dumps({"text": text}, ensure_ascii=False) + "\n" for text in texts).encode("utf-8")
+            rows = vectors.astype(self.dtype).tobytes()
+            self._append_bytes("embeddings.bin", self.count * self.dim * self.dtype.itemsize, rows)
+            self._append_bytes("prompts.jsonl", self.texts_bytes, lines)
+
+            count = self.count + len(texts)
+            texts_bytes = self.texts_bytes + len(lines)
+            tmp = os.path.join(self.path, "meta.json.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype.name, "count": count, "texts_bytes": texts_bytes}, f)
+            os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+            self.texts = self.texts + list(texts)
+            self.matrix = self._map(count)
+            self.count, self.texts_bytes = count, texts_bytes
+            self._hashes["embeddings.bin"].update(rows)
+            self._hashes["prompts.jsonl"].update(lines)
+            self.digest = self._digest()
+
+    def _append_bytes(self, name, valid_size, data):
+        """Writes `data` right after the first `valid_size` bytes of the file."""
+        with open(os.path.join(self.path, name), "ab") as f:
+            f.truncate(valid_size)
+            f.write(data)
+
+    def query(self, embeddings, k=1) -> tuple:
+        """
+        Top-k most similar known attacks for every query embedding ([n, dim]).
+        Returns (similarities [n, k], row indices [n, k]), best first; the
+        cosine similarity of all queries against the whole index is one
+        matrix multiply (chunked when stored as float16).
+        """
+        queries = l2_normalize(embeddings)
+        matrix = self.matrix  # snapshot: a concurrent append swaps in a new map
+        n = len(queries)
+        if len(matrix) == 0:
+            return np.zeros((n, 0), dtype=np.float32), np.zeros((n, 0), dtype=np.int64)
+
+        if matrix.dtype == np.float32:
+            similarities = queries @ matrix.T
+        else:
+            similarities = np.empty((n, len(matrix)), dtype=np.float32)
+            for start in range(0, len(matrix), CHUNK_ROWS):
+                chunk = np.asarray(matrix[start:start + CHUNK_ROWS], dtype=np.float32)
+                similarities[:, start:start + len(chunk)] = queries @ chunk.T
+
+        k = min(k, len(matrix))
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+def build_index(input_path, index_path, detector, fmt=None, field="prompt", batch_size=32, dtype="float16"):
+    """
+    Embeds every prompt of a JSONL/CSV file with `detector` (a BertDetector)
+    and appends it to the index at `index_path` (created if missing).
+    Returns the number of prompts added.
+    """
+    from src.tools.bulk_scan import iter_records, batched
+
+    index = AttackIndex(index_path, dim=detector.model.config.hidden_size, dtype=dtype)
+    added = 0
+    for batch in batched(iter_records(input_path, fmt, field), batch_size * 8):
+        texts = [prompt for _, prompt in batch if prompt.strip()]
+        if not texts:
+            continue
+        _, embeddings = detector.predict_with_embeddings(texts, batch_size=batch_size)
+        index.append(texts, embeddings)
+        added += len(texts)
+    return added
@@ -1,11 +1,23 @@
+import numpy as np
 import torch
 import os
 import torch.nn.functional as F
-from transformers import BertTokenizer, BertForSequenceClassification
+from transformers import BertTokenizerFast, BertForSequenceClassification
+from src.utils.cache import content_key
+from src.utils.metrics import NULL_METRICS
+from src.utils.backends import load_model
 
 
 class BertDetector:
-    def __init__(self, model_path='models/bert_classifier'):
+    # Tokens per input; longer texts are truncated at the end
+    MAX_LENGTH = 128
+
+    def __init__(self, model_path='models/bert_classifier', cache=None, metrics=None,
+                 backend="eager", onnx_dir="models/onnx"):
+        # Optional score cache (e.g. LRUCache): text hash -> malicious probability
+        self.cache = cache
+        # Optional Metrics registry: tokenize / forward timings
+        self.metrics = metrics or NULL_METRICS
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
 
         if not os.path.exists(model_path):
@@ -13,43 +25,132 @@ class BertDetector:
             model_path = 'bert-base-uncased'
         else:
             print(f"Loading BERT Classifier from {model_path}...")
+        self.model_path = model_path
 
-        self.tokenizer = BertTokenizer.from_pretrained(model_path)
-        self.model = BertForSequenceClassification.from_pretrained(model_path).to(self.device)
-        self.model.eval()
+        # Rust tokenizer: a whole bucket is encoded in one call
+        self.tokenizer = BertTokenizerFast.from_pretrained(model_path)
+        # eager fp32, int8-quantized or ONNX Runtime (see src/utils/backends.py)
+        self.backend = backend
+        self.model = load_model(BertForSequenceClassification, model_path, backend=backend,
+                                device=self.device, onnx_dir=onnx_dir)
 
     def predict_probability(self, text):
         """
         Returns a float between 0.0 (Safe) and 1.0 (Malicious).
         Required for the Weighted Ensemble voting system.
         """
-        # Tokenize
-        inputs = self.tokenizer(
-            text,
-            return_tensors="pt",
-            truncation=True,
-            padding=True,
-            max_length=128
-        )
+        return self.predict_probabilities([text])[0]
+
+    def predict_probabilities(self, texts, batch_size=32) -> list:
+        """
+        Batched version of predict_probability.
+        Texts are grouped by length so each padded batch stays short.
+        """
+        scores = [0.0] * len(texts)
+
+        # Group identical texts so each one is scored (or looked up) once
+        positions = {}
+        for i, text in enumerate(texts):
+            positions.setdefault(text, []).append(i)
+
+        pending = []
+        for text, indices in positions.items():
+            if self.cache is not None:
+                cached = self.cache.get(content_key(text))
+                if cached is not None:
+                    for i in indices:
+                        scores[i] = cached
+                    continue
+            pending.append(text)
+
+        pending.sort(key=len)
+
+        for start in range(0, len(pending), batch_size):
+            bucket = pending[start:start + batch_size]
+
+            probs, _ = self._forward(bucket)
+            for text, malicious_score in zip(bucket, probs.tolist()):
+                if self.cache is not None:
+                    self.cache.put(content_key(text), malicious_score)
+                for i in positions[text]:
+                    scores[i] = malicious_score
+
+        return scores
+
+    def predict_with_embeddings(self, texts, batch_size=32) -> tuple:
+        """
+        Malicious probability and [CLS] embedding for every text from ONE
+        forward pass (the embedding is the last hidden state of the [CLS]
+        token, the same vector EmbeddingExtractor used to compute with a
+        second encoder pass).
+        Returns (probabilities (list), embeddings (np.ndarray [n, hidden])).
+        """
+        scores = [0.0] * len(texts)
+        embeddings = [None] * len(texts)
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            probs, cls = self._forward([texts[i] for i in indices], hidden=True)
+            for i, prob, vector in zip(indices, probs.tolist(), cls):
+                scores[i] = prob
+                embeddings[i] = vector
+                if self.cache is not None:
+                    self.cache.put(content_key(texts[i]), prob)
+
+        hidden = self.model.config.hidden_size
+        return scores, np.stack(embeddings) if embeddings else np.zeros((0, hidden), dtype=np.float32)
+
+    def keep_end(self, text: str) -> str:
+        """
+        The longest end of `text` that fits in one input. Truncation keeps
+        the start, so text whose end matters (context + the newest turn)
+        is trimmed from the front with this first.
+        """
+        budget = self.MAX_LENGTH - self.tokenizer.num_special_tokens_to_add()
+        offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True).offset_mapping
+        if len(offsets) <= budget:
+            return text
+        return text[offsets[-budget][0]:]
+
+    def _forward(self, bucket, hidden=False) -> tuple:
+        """
+        One padded forward pass. Returns (malicious probabilities tensor,
+        [CLS] embeddings as np.ndarray or None).
+        """
+        with self.metrics.timer("bert.tokenize"):
+            inputs = self.tokenizer(
+                bucket,
+                return_tensors="pt",
+                truncation=True,
+                padding=True,
+                max_length=self.MAX_LENGTH
+            )
         # Move to device (GPU/CPU)
         inputs = {k: v.to(self.device) for k, v in inputs.items()}
 
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            logits = outputs.logits
+        with self.metrics.timer("bert.forward"), torch.no_grad():
+            outputs = self.model(**inputs, output_hidden_states=hidden)
             # Apply Softmax to get probabilities (0.0 - 1.0)
-            probs = torch.softmax(logits, dim=1)
+            probs = torch.softmax(outputs.logits, dim=1)
 
-            # We assume Index 1 = "Malicious" (Check your training labels if unsure!)
-            malicious_score = probs[0][1].item()
+        cls = None
+        if hidden:
+            # ONNX exports return the [CLS] vector directly
+            if getattr(outputs, "cls_embedding", None) is not None:
+                cls = outputs.cls_embedding
+            else:
+                cls = outputs.hidden_states[-1][:, 0, :]
+            cls = cls.float().cpu().numpy()
 
-        return malicious_score
+        # We assume Index 1 = "Malicious" (Check your training labels if unsure!)
+        return probs[:, 1], cls
 
     def predict(self, text: str):
         """
         Returns: (is_malicious (bool), confidence_score (float))
         """
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=128).to(self.device)
+        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, max_length=self.MAX_LENGTH).to(self.device)
 
         with torch.no_grad():
             outputs = self.model(**inputs)
@@ -1,10 +1,12 @@
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
 from .embeddings import EmbeddingExtractor
+from .attack_index import l2_normalize
 
 
 class SemanticDriftCalculator:
     def __init__(self, detector_instance):
         self.extractor = EmbeddingExtractor(detector_instance)
+        self.detector = detector_instance
 
     def calculate_similarity(self, text1: str, text2: str) -> float:
         """
@@ -12,8 +14,19 @@ class SemanticDriftCalculator:
         Score close to 1.0 = Very Similar.
         Score close to 0.0 = High Drift / Different Meaning.
         """
-        vec1 = self.extractor.get_embedding(text1)
-        vec2 = self.extractor.get_embedding(text2)
+        return self.calculate_similarities([(text1, text2)])[0]
 
-        sim_score = cosine_similarity(vec1, vec2)[0][0]
-        return float(sim_score)
\ No newline at end of file
+    def calculate_similarities(self, pairs, batch_size=32) -> list:
+        """
+        Batched version of calculate_similarity for (text1, text2) pairs.
+        Every distinct text is embedded once, in batched forward passes, and
+        the cosines are one row-wise dot product of normalized vectors.
+        """
+        texts = list(dict.fromkeys(text for pair in pairs for text in pair))
+        _, embeddings = self.detector.predict_with_embeddings(texts, batch_size=batch_size)
+        vectors = l2_normalize(embeddings)
+        row = {text: i for i, text in enumerate(texts)}
+
+        left = vectors[[row[a] for a, _ in pairs]]
+        right = vectors[[row[b] for _, b in pairs]]
+        return np.einsum("ij,ij->i", left, right).astype(float).tolist()
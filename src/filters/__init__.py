@@ -1,3 +1,4 @@
 from .keyword_filter import KeywordFilter
 from .regexfilters import RegexRuleEngine
-from .encoding_check import EncodingPatternDetector
\ No newline at end of file
+from .encoding_check import EncodingPatternDetector
+from .payloads import EmbeddedPayloadScanner
\ No newline at end of file
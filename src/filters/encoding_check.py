@@ -1,5 +1,6 @@
 import base64
 import binascii
+from src.utils.char_stats import char_stats
 
 
 class EncodingPatternDetector:
@@ -15,10 +16,13 @@ class EncodingPatternDetector:
             return False, None, None
 
         cleaned_text = text.strip()
+        # One fused pass tells us which alphabets the text fits in
+        stats = char_stats(cleaned_text, window=None)
 
         # --- Check 1: Base64 ---
         # Base64 strings usually end with '=' or have lengths multiple of 4
-        if len(cleaned_text) % 4 == 0 or cleaned_text.endswith("="):
+        # (and anything outside the alphabet, e.g. a space, rules it out without decoding)
+        if stats["is_base64_alphabet"] and (len(cleaned_text) % 4 == 0 or cleaned_text.endswith("=")):
             try:
                 decoded_bytes = base64.b64decode(cleaned_text, validate=True)
                 decoded_text = decoded_bytes.decode('utf-8')
@@ -31,7 +35,7 @@ class EncodingPatternDetector:
 
         # --- Check 2: Hexadecimal ---
         # Hex strings are usually 0-9, A-F and even length
-        if self._is_hex(cleaned_text):
+        if stats["is_hex"]:
             try:
                 decoded_bytes = bytes.fromhex(cleaned_text)
                 decoded_text = decoded_bytes.decode('utf-8')
@@ -46,9 +50,8 @@ class EncodingPatternDetector:
     def _is_readable(self, text):
         """Helper to ensure we didn't just decode random binary garbage"""
         # We expect at least 70% of characters to be printable
-        printable_count = sum(1 for c in text if c.isprintable())
-        return printable_count / len(text) > 0.7 if len(text) > 0 else False
+        return char_stats(text, window=None)["printable_ratio"] > 0.7 if len(text) > 0 else False
 
     def _is_hex(self, s):
         """Fast check if string is potentially hex"""
-        return len(s) % 2 == 0 and all(c in '0123456789abcdefABCDEF' for c in s)
\ No newline at end of file
+        return char_stats(s, window=None)["is_hex"]
\ No newline at end of file
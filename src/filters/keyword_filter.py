@@ -1,5 +1,8 @@
+from .matcher import AhoCorasick
+
+
 class KeywordFilter:
-    def __init__(self):
+    def __init__(self, extra_keywords=None):
         self.blocklist = [
             "ignore previous instructions",
             "ignore all instructions",
@@ -14,9 +17,24 @@ class KeywordFilter:
             "admin access",
             "developer mode"
         ]
-    def scan(self,text):
-        text_lower = text.lower()
-        for keyword in self.blocklist:
-            if keyword in text_lower:
-                return True,keyword
-        return False,None
\ No newline at end of file
+        # Extra entries (e.g. filters.blocked_keywords in config.yaml), matched case-insensitively
+        for keyword in extra_keywords or []:
+            keyword = keyword.lower()
+            if keyword not in self.blocklist:
+                self.blocklist.append(keyword)
+
+        # One automaton for the whole blocklist: cost depends on text length, not list size
+        self.matcher = AhoCorasick(self.blocklist)
+
+    def scan(self, text):
+        matches = self.scan_all(text)
+        if matches:
+            return True, matches[0][2]
+        return False, None
+
+    def scan_all(self, text):
+        """
+        Every blocklist hit in the text.
+        Returns: list of (start, end, keyword), ordered by end offset
+        """
+        return self.matcher.find_all(text.lower())
@@ -0,0 +1,229 @@
+import re
+
+# Regex metacharacters that end a literal run
+_META = set(".^$*+?{}[]|()")
+
+# The only non-ASCII characters re.IGNORECASE matches to an ASCII letter
+# (checked over every code point) that str.lower() does not map to it:
+# long s, Kelvin sign, dotless i, dotted capital I. Folded before the
+# anchor scan so "ſystem prompt" still hits the "system prompt" anchor.
+_IGNORECASE_FOLDS = str.maketrans({
+    ch: letter
+    for ch in "\u017f\u212a\u0131\u0130"
+    for letter in "abcdefghijklmnopqrstuvwxyz"
+    if re.fullmatch(letter, ch, re.IGNORECASE)
+})
+
+
+class AhoCorasick:
+    """
+    Multi-literal matcher: finds every occurrence of every pattern in a single
+    left-to-right pass, in O(len(text) + matches) regardless of how many
+    patterns there are.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))  # dedupe, keep order
+
+        # Trie: goto[state] maps a character to the next state
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]  # pattern indices that end at each state
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] = self._out[state] + (index,)
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        """Breadth-first pass that links each state to its longest proper suffix state."""
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                link = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = link if link != nxt else 0
+                # Inherit matches that end at the suffix state
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def scan(self, text: str, state: int = 0, offset: int = 0) -> tuple:
+        """
+        Returns (matches, final_state). Each match is (start, end, pattern).
+        `state` and `offset` let a caller continue a previous scan, so
+        patterns that span two chunks of a stream are still found.
+        """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        patterns = self.patterns
+        matches = []
+
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = offset + pos + 1
+                for index in out[state]:
+                    pattern = patterns[index]
+                    matches.append((end - len(pattern), end, pattern))
+
+        return matches, state
+
+    def find_all(self, text: str) -> list:
+        """Every (start, end, pattern) occurrence, ordered by end offset."""
+        return self.scan(text)[0]
+
+    def __len__(self):
+        return len(self.patterns)
+
+
+def _has_alternation(pattern: str) -> bool:
+    """True if the pattern contains an unescaped '|' (conservative: ignores classes)."""
+    escaped = False
+    for ch in pattern:
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch == "|":
+            return True
+    return False
+
+
+def leading_literal(pattern: str) -> str:
+    r"""
+    The literal text every match of `pattern` must start with, e.g.
+    r"os\.system\(" -> "os.system(" and r"import\s+os" -> "import".
+    Returns "" when there is no such prefix (alternation, leading class, ...).
+    """
+    if _has_alternation(pattern):
+        return ""
+
+    literal = []
+    i = 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\":
+            if i + 1 >= len(pattern):
+                break
+            nxt = pattern[i + 1]
+            if nxt.isalnum():
+                # A leading \b is zero-width and can be checked by the verifier
+                if nxt == "b" and not literal:
+                    i += 2
+                    continue
+                break  # character class escape such as \s or \d
+            literal.append(nxt)
+            i += 2
+        elif ch in _META:
+            break
+        else:
+            literal.append(ch)
+            i += 1
+
+    # A quantifier that allows zero repetitions makes the last character optional
+    if literal and i < len(pattern) and pattern[i] in "?*{":
+        literal.pop()
+
+    return "".join(literal)
+
+
+class PatternSet:
+    """
+    Scans many regular expressions in one pass over the text.
+
+    Each pattern's required leading literal goes into one Aho-Corasick
+    automaton. The text is scanned once, and a pattern is only tried at
+    offsets where its literal occurs. Cost grows with text length and hits,
+    not with the number of rules. (A single big alternation does not work
+    here: backtracking engines try every alternative at every offset.)
+    Patterns with no leading literal fall back to their own search.
+    """
+
+    def __init__(self, patterns, flags=0):
+        self.patterns = list(dict.fromkeys(patterns))
+        self.flags = flags
+        self._compiled = [re.compile(pattern, flags) for pattern in self.patterns]
+        self._ignorecase = bool(flags & re.IGNORECASE)
+
+        self._by_anchor = {}  # literal -> pattern indices
+        self._residual = []   # patterns without a usable literal
+        for index, pattern in enumerate(self.patterns):
+            anchor = leading_literal(pattern)
+            if self._ignorecase:
+                anchor = anchor.lower()
+            if anchor:
+                self._by_anchor.setdefault(anchor, []).append(index)
+            else:
+                self._residual.append(index)
+
+        self._anchors = AhoCorasick(list(self._by_anchor))
+        # Non-ASCII anchors have case variants the ASCII fold table does not cover
+        self._ascii_anchors = all(anchor.isascii() for anchor in self._by_anchor)
+
+    def find_all(self, text: str) -> list:
+        """
+        Every (start, end, pattern) match, ordered by start offset: the
+        matches re.finditer gives for each pattern (non-overlapping per pattern).
+        """
+        haystack = text
+        if self._ignorecase:
+            if not text.isascii():
+                if not self._ascii_anchors:
+                    return sorted(self._search_each(text, range(len(self.patterns))))
+                haystack = text.translate(_IGNORECASE_FOLDS)
+            haystack = haystack.lower()
+        if len(haystack) != len(text):
+            # Rare unicode case where lowercasing changes length: offsets would not line up
+            return sorted(self._search_each(text, range(len(self.patterns))))
+
+        found = set()
+        for start, _, anchor in self._anchors.find_all(haystack):
+            for index in self._by_anchor[anchor]:
+                m = self._compiled[index].match(text, start)
+                if m:
+                    found.add((m.start(), m.end(), index))
+
+        # Like re.finditer, a pattern's next match starts after its previous one ends
+        results = []
+        resume_at = {}
+        for start, end, index in sorted(found):
+            if start < resume_at.get(index, 0):
+                continue
+            resume_at[index] = end
+            results.append((start, end, self.patterns[index]))
+        if self._residual:
+            results = sorted(results + self._search_each(text, self._residual))
+        return results
+
+    def search(self, text: str):
+        """First (start, end, pattern) match or None."""
+        matches = self.find_all(text)
+        return matches[0] if matches else None
+
+    def _search_each(self, text, indices) -> list:
+        return [
+            (m.start(), m.end(), self.patterns[index])
+            for index in indices
+            for m in self._compiled[index].finditer(text)
+        ]
+
+    def __len__(self):
+        return len(self.patterns)
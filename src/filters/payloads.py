@@ -0,0 +1,120 @@
+import base64
+import binascii
+import re
+from urllib.parse import unquote_to_bytes
+
+from src.utils.char_stats import char_stats
+
+# One compiled alternation finds every candidate run in a single left-to-right
+# pass. Each alternative only starts where a token starts (lookbehind), so a
+# long run that turns out not to match is tried once, not once per character.
+_SEGMENTS = re.compile(
+    # URL-encoding: a token with at least three %XX escapes
+    r"(?P<url>(?<![\w.~%+-])(?:[\w.~+-]*%[0-9A-Fa-f]{2}){3,}[\w.~+-]*)"
+    # \uXXXX / \xXX escape sequences
+    r"|(?P<escape>(?:\\u[0-9A-Fa-f]{4}|\\x[0-9A-Fa-f]{2}){4,})"
+    # Hex: a run that does not continue as Base64 (odd lengths are retried as Base64)
+    r"|(?P<hex>(?<![A-Za-z0-9+/=_-])[0-9A-Fa-f]{16,}(?![A-Za-z0-9+/=_-]))"
+    # Base64 (standard or URL-safe alphabet)
+    r"|(?P<base64>(?<![A-Za-z0-9+/=_-])[A-Za-z0-9+/_-]{16,}={0,2})"
+)
+
+METHOD_NAMES = {"url": "URL", "escape": "Escape", "hex": "Hex", "base64": "Base64"}
+
+
+class EmbeddedPayloadScanner:
+    """
+    Finds Base64, hex, URL-encoded and \\u/\\x-escaped segments anywhere in
+    a prompt (not only when the whole prompt is encoded), decodes them and
+    repeats on the decoded text up to `max_depth` levels.
+
+    Limits keep hostile input bounded: segments longer than
+    `max_segment_chars` are not decoded, and decoding stops once
+    `max_output_chars` of decoded text or `max_fragments` fragments have been
+    produced for one prompt.
+    """
+
+    def __init__(self, max_depth=3, max_output_chars=65536, max_fragments=32, max_segment_chars=1_000_000):
+        self.max_depth = max_depth
+        self.max_output_chars = max_output_chars
+        self.max_fragments = max_fragments
+        self.max_segment_chars = max_segment_chars
+
+    def scan(self, text: str) -> tuple:
+        """
+        Returns: (unwrapped_text (str), fragments (list of (method, decoded_text)))
+        `unwrapped_text` is the prompt with every decodable segment replaced
+        by its (recursively unwrapped) decoding. `method` names the encoding
+        chain, e.g. "Base64>Hex" for hex inside Base64.
+        """
+        fragments = []
+        budget = [self.max_output_chars]
+        if not text:
+            return text, fragments
+        unwrapped = self._unwrap(text, 1, "", fragments, budget)
+        return unwrapped, fragments
+
+    def _unwrap(self, text, depth, chain, fragments, budget) -> str:
+        parts = []
+        last = 0
+        for match in _SEGMENTS.finditer(text):
+            if len(fragments) >= self.max_fragments or budget[0] <= 0:
+                break
+
+            kind = match.lastgroup
+            segment = match.group()
+            if len(segment) > self.max_segment_chars:
+                continue
+            decoded = self._decode(kind, segment)
+            if decoded is None or len(decoded) > budget[0]:
+                continue
+            budget[0] -= len(decoded)
+
+            method = chain + METHOD_NAMES[kind]
+            if depth < self.max_depth:
+                decoded = self._unwrap(decoded, depth + 1, method + ">", fragments, budget)
+            fragments.append((method, decoded))
+
+            parts.append(text[last:match.start()])
+            parts.append(decoded)
+            last = match.end()
+
+        if not parts:
+            return text
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def _decode(self, kind, segment):
+        """Decoded text, or None if it does not decode to readable UTF-8."""
+        if kind == "hex" and len(segment) % 2:
+            kind = "base64"
+        try:
+            if kind == "base64":
+                body = segment.rstrip("=")
+                body += "=" * (-len(body) % 4)
+                altchars = b"-_" if ("-" in body or "_" in body) else None
+                raw = base64.b64decode(body, altchars=altchars, validate=True)
+            elif kind == "hex":
+                raw = bytes.fromhex(segment)
+            elif kind == "url":
+                raw = unquote_to_bytes(segment)
+            else:
+                decoded = segment.encode("ascii").decode("unicode_escape")
+                # \xNN runs are usually UTF-8 bytes written out one by one
+                try:
+                    decoded = decoded.encode("latin-1").decode("utf-8")
+                except (UnicodeEncodeError, UnicodeDecodeError):
+                    pass
+                return decoded if self._is_readable(decoded) else None
+            decoded = raw.decode("utf-8")
+        except (binascii.Error, ValueError, UnicodeDecodeError):
+            return None
+
+        if kind == "url" and decoded == segment:
+            return None
+        return decoded if self._is_readable(decoded) else None
+
+    def _is_readable(self, text):
+        """Helper to ensure we didn't just decode random binary garbage"""
+        # At least 70% printable, or it is binary noise rather than a payload
+        return len(text) > 0 and char_stats(text, window=None)["printable_ratio"] > 0.7
@@ -1,6 +1,9 @@
 import re
+from .matcher import PatternSet
+
+
 class RegexRuleEngine:
-    def __init__(self):
+    def __init__(self, extra_patterns=None):
         self.suspicious_patterns = [
             r"import\s+os",
             r"import\s+sys",
@@ -16,8 +19,22 @@ class RegexRuleEngine:
             r"\[System Mode\]",
             r"ADMIN_Override"
         ]
-    def scan(self,text):
-        for pattern in self.suspicious_patterns:
-            if re.search(pattern,text,re.IGNORECASE):
-                return True, f"Regex Match: Detected suspicious pattern '{pattern}'"
-        return False,None
\ No newline at end of file
+        for pattern in extra_patterns or []:
+            if pattern not in self.suspicious_patterns:
+                self.suspicious_patterns.append(pattern)
+
+        # All patterns compiled once; one anchored scan finds every match (see PatternSet)
+        self.matcher = PatternSet(self.suspicious_patterns, re.IGNORECASE)
+
+    def scan(self, text):
+        match = self.matcher.search(text)
+        if match:
+            return True, f"Regex Match: Detected suspicious pattern '{match[2]}'"
+        return False, None
+
+    def scan_all(self, text):
+        """
+        Every suspicious pattern match in the text.
+        Returns: list of (start, end, pattern), ordered by start offset
+        """
+        return self.matcher.find_all(text)
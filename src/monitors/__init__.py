@@ -1,3 +1,14 @@
-from .leakage import LeakageMonitor
+from .leakage import LeakageMonitor, CanaryRegistry, derive_canary
 from .policy import PolicyEnforcer
-from .integration import SecurePromptPipeline
\ No newline at end of file
+from .rules import RuleRegistry, RuleSet
+from .output_scanner import OutputScanner
+from .stream import OutputStreamScanner, OutputStreamRedactor
+from .conversation import ConversationStore, ConversationState
+
+
+def __getattr__(name):
+    # The pipeline needs torch and the models; the output-side monitors above do not
+    if name == "SecurePromptPipeline":
+        from .integration import SecurePromptPipeline
+        return SecurePromptPipeline
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
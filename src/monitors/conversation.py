@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict, deque
+
+from src.utils.cache import LRUCache
+
+
+class ConversationState:
+    """
+    What SecurePromptPipeline.scan_conversation keeps between the turns of
+    one conversation, so a turn is scanned without rescanning the history:
+
+    - the Aho-Corasick state of the keyword matcher after the last turn
+      (a keyword split across two turns still matches),
+    - the last `context_chars` characters (regexes across the boundary,
+      and the context BERT sees with each turn),
+    - the DistilGPT2 context (KV cache and last tokens, see PerplexityContext),
+    - the scores of the last `max_turns` turns.
+
+    Turns of one conversation are scanned one at a time (hold `lock`).
+    """
+
+    def __init__(self, max_turns=50):
+        self.lock = threading.Lock()
+        self.turns = 0
+        self.keyword_state = 0
+        self.rules_digest = None  # the keyword state belongs to this RuleSet's automaton
+        self.tail = ""
+        self.perplexity = None  # PerplexityContext, created on the first scored turn
+        self.history = deque(maxlen=max_turns)
+
+    def summary(self) -> dict:
+        bert = [turn["bert_prob"] for turn in self.history if turn["bert_prob"] is not None]
+        return {
+            "turns": self.turns,
+            "max_bert_prob": max(bert) if bert else None,
+            "blocked_turns": sum(turn["status"] == "BLOCK" for turn in self.history),
+            "context_tokens": self.perplexity.tokens if self.perplexity is not None else 0
+        }
+
+
+class ConversationStore:
+    """
+    Bounded store of ConversationStates. Conversations are forgotten after
+    `ttl_seconds` idle or when more than `max_conversations` are active
+    (least recently active first). KV caches are the expensive part, so
+    only the `max_kv_contexts` most recently scanned conversations keep
+    one; the others drop it and rebuild it from their last tokens (one
+    short forward pass) on their next turn.
+    """
+
+    def __init__(self, max_conversations=10000, ttl_seconds=3600, max_kv_contexts=32, max_turns=50,
+                 context_chars=512):
+        self.max_kv_contexts = max(1, int(max_kv_contexts))
+        self.max_turns = max_turns
+        self.context_chars = context_chars
+        self._states = LRUCache(max_conversations, ttl_seconds)
+        self._lock = threading.Lock()
+        self._with_kv = OrderedDict()  # conversation id -> state holding a KV cache
+
+        # --- Metrics ---
+        self.kv_releases = 0
+
+    def get(self, conversation_id) -> ConversationState:
+        """The state of the conversation (a new one if unknown or expired)."""
+        with self._lock:
+            state = self._states.get(conversation_id)
+            if state is None:
+                state = ConversationState(self.max_turns)
+                self._states.put(conversation_id, state)
+            return state
+
+    def end(self, conversation_id) -> bool:
+        """Forgets the conversation. Returns whether it was known."""
+        with self._lock:
+            self._with_kv.pop(conversation_id, None)
+            return self._states.delete(conversation_id)
+
+    def touch_kv(self, conversation_id, state):
+        """
+        Marks the conversation's KV cache as most recently used and releases
+        the oldest ones beyond max_kv_contexts. Called with `state.lock`
+        held; a conversation being scanned right now is skipped, not waited for.
+        """
+        with self._lock:
+            self._with_kv[conversation_id] = state
+            self._with_kv.move_to_end(conversation_id)
+            for oldest_id in list(self._with_kv)[:max(0, len(self._with_kv) - self.max_kv_contexts)]:
+                oldest = self._with_kv[oldest_id]
+                if oldest is state or not oldest.lock.acquire(blocking=False):
+                    continue
+                try:
+                    if oldest.perplexity is not None:
+                        oldest.perplexity.release()
+                        self.kv_releases += 1
+                finally:
+                    oldest.lock.release()
+                del self._with_kv[oldest_id]
+
+    def stats(self) -> dict:
+        return {
+            **self._states.stats(),
+            "kv_contexts": len(self._with_kv),
+            "max_kv_contexts": self.max_kv_contexts,
+            "kv_releases": self.kv_releases
+        }
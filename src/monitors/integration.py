@@ -1,104 +1,790 @@
+import copy
+import hashlib
+import json
+import math
+import threading
+import time
+
 # Import modules from ALL members
-from src.filters import RegexRuleEngine, KeywordFilter, EncodingPatternDetector  # Member 1
-from src.analysis import PerplexityAnalyzer, StatisticalAnalyzer, DriftDetector  # Member 2
-from src.detection import BertDetector, SemanticDriftCalculator  # Member 3
-from .leakage import LeakageMonitor  # Member 4
-from .policy import PolicyEnforcer  # Member 4
+from src.filters import EmbeddedPayloadScanner  # Member 1
+from src.analysis import (PerplexityAnalyzer, PerplexityContext, StatisticalAnalyzer, SessionDriftTracker,
+                          DivergenceAnalyzer)  # Member 2
+from src.detection import BertDetector, SemanticDriftCalculator, AttackIndex  # Member 3
+from .rules import RuleRegistry  # Member 1 & 4 rule lists (hot-reloadable)
+from .stream import OutputStreamScanner, OutputStreamRedactor  # Member 4 (streamed responses)
+from .output_scanner import verdict, redact
+from .conversation import ConversationStore  # multi-turn state
+from src.utils import load_config
+from src.utils.cache import LRUCache, SqliteCache, VerdictCache, content_key
+from src.utils.metrics import Metrics, NULL_METRICS
+from src.utils.audit import AuditLog
+
+
+def _reason_label(decision) -> str:
+    """Low-cardinality reason for the BLOCK/PASS counters (the reason text embeds the risk)."""
+    if decision["breakdown"].get("heuristic_only"):
+        return "heuristic_only"
+    if decision["status"] != "BLOCK":
+        return "safe"
+    if (decision.get("reason") or "").startswith("Conversation Drift"):
+        return "drift"
+    return "hidden_intent" if "Hidden Intent" in (decision.get("reason") or "") else "high_risk"
 
 
 class SecurePromptPipeline:
-    def __init__(self):
+    def __init__(self, config=None, lazy=False):
+        """
+        With lazy=True the models load on a background thread and the
+        constructor returns as soon as the heuristic layers are ready.
+        Until then scans get heuristic-only verdicts (see models_ready).
+        """
+        started = time.perf_counter()
         print("Initializing SecurePrompt Pipeline (Weighted Ensemble Mode)...")
+        self.config = config if config is not None else load_config()
+        cache_config = self.config["cache"]
+
+        # Per-stage timers and counters (a no-op registry when disabled)
+        metrics_config = self.config["metrics"]
+        self.metrics = Metrics() if metrics_config["enabled"] else NULL_METRICS
+        self.request_timings = metrics_config["enabled"] and metrics_config["request_timings"]
 
         # --- Layer 1: Heuristics (Member 1) ---
-        self.regex = RegexRuleEngine()
-        self.keyword = KeywordFilter()
-        self.encoding = EncodingPatternDetector()
+        # Keyword/regex rules (and the output rules of Layer 4) live in a
+        # registry that can recompile them without reloading the models
+        self.rules = RuleRegistry(self.config)
+        # Encoded segments anywhere in the prompt (nested ones too) are decoded
+        self.payloads = EmbeddedPayloadScanner(**self.config["payloads"])
 
         # --- Layer 2: Analysis (Member 2) ---
-        self.perplexity = PerplexityAnalyzer()  # Loads DistilGPT2
         self.stats = StatisticalAnalyzer()
-        self.drift = DriftDetector()
+        # Per-user risk history (None when drift tracking is off)
+        self.drift = self._build_drift_tracker(self.config["drift"])
 
-        # --- Layer 3: Deep Detection (Member 3) ---
-        self.bert = BertDetector()  # Loads BERT
+        # --- Layers 2 & 3: DistilGPT2 and BERT (see _load_models) ---
+        self.perplexity = None
+        self.bert = None
+        self.attack_index = None  # known-jailbreak embeddings (optional)
+        self.load_error = None
+        self._models_ready = threading.Event()
+        self.startup = {"lazy": bool(lazy), "heuristics_seconds": round(time.perf_counter() - started, 3)}
 
         # --- Layer 4: Output Monitoring (Member 4) ---
-        self.leakage = LeakageMonitor()
-        self.policy = PolicyEnforcer()
+        # self.leakage and self.policy come from self.rules (see properties below)
 
         # --- CONFIGURATION: Weighted Ensemble ---
-        # Adjust these weights based on which module you trust most
-        self.weights = {
-            "heuristic": 0.2,  # Regex/Keywords (Low trust, high false positives)
-            "perplexity": 0.3,  # Gibberish/Obfuscation (Medium trust)
-            "bert": 0.5  # Semantic Understanding (High trust)
+        # Weights and thresholds come from config.yaml (tune them with `python main.py calibrate`)
+        self.weights = {name: float(self.config["weights"][name]) for name in ("heuristic", "perplexity", "bert")}
+        thresholds = self.config["thresholds"]
+        self.perplexity_limit = float(thresholds["perplexity_limit"])
+        self.perplexity_curve = thresholds["perplexity_curve"]
+        if self.perplexity_curve not in ("linear", "log"):
+            raise ValueError(f"thresholds.perplexity_curve must be 'linear' or 'log', not {self.perplexity_curve!r}")
+
+        # Mutation divergence (optional): scored in the same BERT pass as the prompts
+        divergence_config = self.config["divergence"]
+        self.divergence = None
+        self._bert_seconds_per_text = None  # running estimate for the divergence latency budget
+        if divergence_config["enabled"]:
+            self.divergence = DivergenceAnalyzer(
+                mutation_rate=divergence_config["mutation_rate"],
+                num_mutants=divergence_config["mutants"],
+                seed=divergence_config["seed"]
+            )
+            share = divergence_config["weight"]
+            self.weights = {name: weight * (1.0 - share) for name, weight in self.weights.items()}
+            self.weights["divergence"] = share
+
+        # If the weighted sum >= thresholds.blocking, the prompt is BLOCKED.
+        self.BLOCKING_THRESHOLD = float(thresholds["blocking"])
+
+        # Cascade mode: skip model stages that can no longer change the verdict
+        self.cascade = self.config["pipeline"]["cascade"]
+
+        # Every verdict to the append-only audit log (written on a background thread)
+        audit_config = self.config["audit"]
+        self.audit = AuditLog(
+            audit_config["path"],
+            flush_rows=audit_config["flush_rows"],
+            flush_seconds=audit_config["flush_seconds"],
+            rotate_rows=audit_config["rotate_rows"],
+            rotate_seconds=audit_config["rotate_seconds"],
+            max_queue=audit_config["max_queue"]
+        ) if audit_config["enabled"] else None
+
+        # Per-conversation state for scan_conversation (bounded; idle conversations are evicted)
+        conversation_config = self.config["conversations"]
+        self.conversations = ConversationStore(
+            max_conversations=conversation_config["max_conversations"],
+            ttl_seconds=conversation_config["ttl_seconds"],
+            max_kv_contexts=conversation_config["max_kv_contexts"],
+            max_turns=conversation_config["max_turns"],
+            context_chars=conversation_config["context_chars"]
+        )
+
+        # Repeated prompts (retries, templates, copy-pasted jailbreaks) reuse the verdict
+        self.verdict_cache = self._build_verdict_cache(cache_config["verdicts"])
+
+        if lazy:
+            threading.Thread(target=self._load_models, args=(started,), daemon=True,
+                             name="secureprompt-models").start()
+        else:
+            self._load_models(started)
+            if self.load_error is not None:
+                raise self.load_error
+
+    def _load_models(self, started):
+        """Loads DistilGPT2 and BERT, records how long each took, then flips models_ready."""
+        cache_config = self.config["cache"]
+        ppl_config = self.config["perplexity"]
+        inference_config = self.config["inference"]
+        try:
+            t0 = time.perf_counter()
+            perplexity = PerplexityAnalyzer(  # Loads DistilGPT2
+                cache=self._build_score_cache(cache_config["scores"]),
+                window=ppl_config["window"],
+                stride=ppl_config["stride"],
+                long_text_score=ppl_config["long_text_score"],
+                metrics=self.metrics,
+                backend=inference_config["backend"],
+                onnx_dir=inference_config["onnx_dir"]
+            )
+            t1 = time.perf_counter()
+            bert = BertDetector(  # Loads BERT
+                cache=self._build_score_cache(cache_config["scores"]),
+                metrics=self.metrics,
+                backend=inference_config["backend"],
+                onnx_dir=inference_config["onnx_dir"]
+            )
+            t2 = time.perf_counter()
+            attack_index = self._load_attack_index(bert)
+        except Exception as e:
+            self.load_error = e
+            print(f"[ERROR] Model loading failed: {e}")
+            return
+
+        self.perplexity, self.bert = perplexity, bert
+        if attack_index is not None:
+            # Similarity joins the ensemble; the other weights shrink so they still sum to 1
+            share = self.config["attack_index"]["weight"]
+            self.weights = {name: weight * (1.0 - share) for name, weight in self.weights.items()}
+            self.weights["similarity"] = share
+            self.attack_index = attack_index
+        self.startup.update({
+            "perplexity_seconds": round(t1 - t0, 3),
+            "bert_seconds": round(t2 - t1, 3),
+            "total_seconds": round(t2 - started, 3)
+        })
+        for stage in ("heuristics", "perplexity", "bert", "total"):
+            self.metrics.set_gauge("startup_seconds", self.startup[f"{stage}_seconds"], stage=stage)
+        self._models_ready.set()
+        print(f"[INFO] Models ready in {self.startup['total_seconds']:.1f}s "
+              f"(DistilGPT2 {self.startup['perplexity_seconds']:.1f}s, BERT {self.startup['bert_seconds']:.1f}s)")
+
+    def _load_attack_index(self, bert):
+        settings = self.config["attack_index"]
+        if not settings["enabled"]:
+            return None
+        index = AttackIndex(settings["path"], dim=bert.model.config.hidden_size, dtype=settings["dtype"])
+        if len(index) == 0:
+            print(f"Warning: Attack index at {settings['path']} is empty. Similarity signal disabled.")
+            return None
+        print(f"Loaded attack index ({len(index)} prompts) from {settings['path']}")
+        return index
+
+    def normalize_similarity(self, similarity):
+        """Maps the cosine to the nearest known attack onto 0.0 - 1.0 (min_similarity -> 0)."""
+        floor = self.config["attack_index"]["min_similarity"]
+        return min(1.0, max(0.0, (similarity - floor) / (1.0 - floor)))
+
+    def normalize_divergence(self, spread):
+        """Maps the mean pairwise KL onto 0.0 - 1.0 (divergence.kl_scale and above -> 1)."""
+        return min(1.0, spread / self.config["divergence"]["kl_scale"])
+
+    @property
+    def models_ready(self) -> bool:
+        return self._models_ready.is_set()
+
+    def wait_until_ready(self, timeout=None) -> bool:
+        """Blocks until the models are loaded (or the timeout runs out)."""
+        return self._models_ready.wait(timeout)
+
+    # The rule-based layers always point at the registry's current RuleSet
+    @property
+    def keyword(self):
+        return self.rules.current.keyword
+
+    @property
+    def regex(self):
+        return self.rules.current.regex
+
+    @property
+    def leakage(self):
+        return self.rules.current.leakage
+
+    @property
+    def policy(self):
+        return self.rules.current.policy
+
+    def _build_score_cache(self, settings):
+        """Per-model score cache (decoded payloads reuse plaintext scores)."""
+        if not settings["enabled"]:
+            return None
+        return LRUCache(max_entries=settings["max_entries"], ttl_seconds=settings["ttl_seconds"])
+
+    def _build_verdict_cache(self, settings):
+        if not settings["enabled"]:
+            return None
+        memory = LRUCache(max_entries=settings["max_entries"], ttl_seconds=settings["ttl_seconds"])
+        shared = None
+        if settings["shared_path"]:
+            shared = SqliteCache(
+                settings["shared_path"],
+                max_entries=settings["shared_max_entries"],
+                ttl_seconds=settings["ttl_seconds"]
+            )
+        return VerdictCache(memory, shared)
+
+    def _build_drift_tracker(self, settings):
+        if not settings["enabled"]:
+            return None
+        if settings["shared_path"]:
+            store = SqliteCache(settings["shared_path"], max_entries=settings["max_sessions"],
+                                ttl_seconds=settings["idle_ttl_seconds"])
+        else:
+            store = LRUCache(max_entries=settings["max_sessions"], ttl_seconds=settings["idle_ttl_seconds"])
+        return SessionDriftTracker(store, window_size=settings["window"], threshold_std=settings["threshold_std"],
+                                   shared=bool(settings["shared_path"]), min_std=settings["min_std"],
+                                   min_history=settings["min_history"])
+
+    def close(self):
+        """Flushes the audit log (call on shutdown)."""
+        if self.audit is not None:
+            self.audit.close()
+
+    def cache_stats(self) -> dict:
+        """Hit/miss counters of the verdict cache and the per-model score caches."""
+        def score_stats(model):
+            return model.cache.stats() if model is not None and model.cache is not None else None
+
+        return {
+            "verdicts": self.verdict_cache.stats() if self.verdict_cache is not None else None,
+            "perplexity_scores": score_stats(self.perplexity),
+            "bert_scores": score_stats(self.bert),
+            "drift_sessions": self.drift.stats() if self.drift is not None else None,
+            "conversations": self.conversations.stats()
         }
 
-        # If the weighted sum >= 0.5, the prompt is BLOCKED.
-        self.BLOCKING_THRESHOLD = 0.5
+    def _fingerprint(self, cascade, rules) -> str:
+        """
+        Identifies everything that can change a verdict for the same prompt.
+        Changing a model, a weight or the threshold gives new cache keys, so
+        stale verdicts are never served.
+        """
+        settings = {
+            "version": str(self.config["system"]["version"]),
+            "perplexity_model": self.perplexity.model_path,
+            "perplexity_window": [self.perplexity.window, self.perplexity.stride, self.perplexity.long_text_score],
+            "bert_model": self.bert.model_path,
+            "attack_index": [self.attack_index.digest, self.config["attack_index"]["min_similarity"],
+                             self.config["attack_index"]["top_k"]] if self.attack_index is not None else None,
+            "payloads": self.config["payloads"],
+            "divergence": self.config["divergence"] if self.divergence is not None else None,
+            # int8 / ONNX scores drift slightly from fp32
+            "backends": [self.perplexity.backend, self.bert.backend],
+            "weights": self.weights,
+            "threshold": self.BLOCKING_THRESHOLD,
+            "perplexity_curve": [self.perplexity_curve, self.perplexity_limit],
+            "cascade": bool(cascade),
+            "rules": rules.digest
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
 
     def normalize_perplexity(self, ppl_value):
         """
         Squashes perplexity (0 to infinity) into a 0.0 - 1.0 score.
-        Logic: If PPL > 100, we consider it 'fully suspicious' (1.0).
+        Logic: If PPL > thresholds.perplexity_limit, we consider it 'fully suspicious' (1.0).
+        The "log" curve rises faster for low perplexities (same curves as src/tools/calibrate.py).
         """
-        if ppl_value > 100.0:
+        if ppl_value > self.perplexity_limit:
             return 1.0
-        else:
-            return ppl_value / 100.0
+        if self.perplexity_curve == "log":
+            return math.log1p(ppl_value) / math.log1p(self.perplexity_limit)
+        return ppl_value / self.perplexity_limit
 
-    def scan_input(self, user_prompt: str) -> dict:
+    def scan_input(self, user_prompt: str, cascade=None, user_id=None) -> dict:
         """
         Runs the pipeline. If encoding is detected, it decodes the text
         BEFORE sending it to Perplexity and BERT.
         """
-        decision = {
-            "status": "PASS",
-            "reason": "Safe",
-            "total_risk": 0.0,
-            "breakdown": {}
-        }
+        return self.scan_batch([user_prompt], cascade=cascade, user_ids=[user_id])[0]
+
+    def scan_batch(self, prompts: list, batch_size: int = 32, cascade=None, user_ids=None) -> list:
+        """
+        Scans many prompts at once. The heuristic layer runs per prompt, then
+        DistilGPT2 and BERT each get the whole batch in padded, length-bucketed
+        forward passes instead of one pass per prompt.
+
+        In cascade mode the stages run cheapest first, and a prompt only goes
+        to the next model if that model's weight could still move its risk
+        across BLOCKING_THRESHOLD.
+        Returns one decision per prompt, in the same order as the input.
+        With `metrics.request_timings` on, every decision also carries the
+        stage timings of the call that produced it (`timings_ms`).
+        `user_ids` (one per prompt) turns on per-user drift tracking.
+        """
+        cascade = self.cascade if cascade is None else cascade
+        if not self.metrics.enabled:
+            decisions = self._apply_drift(self._scan_cached(prompts, batch_size, cascade), user_ids)
+            if self.audit is not None:
+                self.audit.record_batch(prompts, decisions, user_ids)
+            return decisions
+
+        with self.metrics.collect() as timings, self.metrics.timer("scan"):
+            decisions = self._apply_drift(self._scan_cached(prompts, batch_size, cascade), user_ids)
+
+        for decision in decisions:
+            self.metrics.inc("scans_total", status=decision["status"], reason=_reason_label(decision))
+        timings_ms = {stage: round(seconds * 1000.0, 3) for stage, seconds in timings.items()}
+        timings_ms["batch_size"] = len(prompts)
+        if self.request_timings:
+            for decision in decisions:
+                decision["timings_ms"] = dict(timings_ms)
+        if self.audit is not None:
+            self.audit.record_batch(prompts, decisions, user_ids, timings_ms)
+        return decisions
+
+    def scan_conversation(self, conversation_id, message: str, user_id=None) -> dict:
+        """
+        Scans the next turn of a conversation in the context of the earlier
+        turns, without rescanning them (see ConversationState):
+        keywords and regexes also match across the turn boundary, DistilGPT2
+        scores the turn's tokens given the conversation so far from its KV
+        cache, and BERT scores the turn on its own and joined to the end of
+        the previous text (an attack split over turns), keeping the higher
+        score. A turn costs about as much as its own tokens.
+        Divergence mutants are not used on conversation turns.
+        The breakdown carries a "conversation" summary (turn, max BERT score so far, ...).
+        """
+        state = self.conversations.get(conversation_id)
+        with state.lock, self.metrics.timer("conversation"):
+            rules = self.rules.current
+            with self.metrics.timer("heuristic"):
+                heuristic = self._heuristic_layer(message, rules)
+                score_heuristic, text, is_encoded, fragments = heuristic
+                cross_turn = self._cross_turn_match(state, text, rules)
+            if cross_turn:
+                self.metrics.inc("heuristic_hits_total", layer="cross_turn")
+                heuristic = (1.0, text, is_encoded, fragments)
+                score_heuristic = 1.0
+
+            previous_tail = state.tail
+            joined = (" " if state.turns else "") + text
+            state.tail = (state.tail + joined)[-self.conversations.context_chars:]
+            state.turns += 1
 
+            if not self.models_ready:
+                # The perplexity context misses this turn; later turns are still scored against the rest
+                decision = self._heuristic_only(message, rules, heuristic=heuristic)
+            else:
+                decision = self._score_turn(conversation_id, state, heuristic, previous_tail + joined
+                                            if previous_tail else None)
+
+            decision["breakdown"]["cross_turn_match"] = cross_turn
+            state.history.append({
+                "turn": state.turns,
+                "status": decision["status"],
+                "total_risk": decision["total_risk"],
+                "bert_prob": decision["breakdown"]["bert_prob"]
+            })
+            decision["breakdown"]["conversation"] = {"id": conversation_id, **state.summary()}
+
+        decision = self._apply_drift([decision], [user_id])[0]
+        self.metrics.inc("scans_total", status=decision["status"], reason=_reason_label(decision))
+        if self.audit is not None:
+            self.audit.record(message, decision, user_id)
+        return decision
+
+    def end_conversation(self, conversation_id) -> bool:
+        """Drops a conversation's state. Returns whether it was known."""
+        return self.conversations.end(conversation_id)
+
+    def _cross_turn_match(self, state, text, rules) -> bool:
+        """
+        Whether a keyword or regex match starts in an earlier turn and ends
+        in this one. Advances the conversation's keyword matcher state.
+        """
+        matcher = rules.keyword.matcher
+        if state.rules_digest != rules.digest:
+            # Rules were reloaded: replay the kept tail through the new automaton
+            state.keyword_state = matcher.scan(state.tail.lower())[1]
+            state.rules_digest = rules.digest
+
+        joined = (" " if state.turns else "") + text
+        matches, state.keyword_state = matcher.scan(joined.lower(), state.keyword_state)
+        # Offsets are relative to this turn, so a match that began earlier starts below 0
+        if any(start < 0 for start, _, _ in matches):
+            return True
+
+        boundary = len(state.tail)
+        return any(start < boundary < end for start, end, _ in rules.regex.scan_all(state.tail + joined))
+
+    def _score_turn(self, conversation_id, state, heuristic, context_text) -> dict:
+        """Model layers of one conversation turn; `context_text` is the previous text's end plus the turn."""
+        score_heuristic, text, is_encoded, fragments = heuristic
+
+        if state.perplexity is None:
+            state.perplexity = PerplexityContext(window=self.config["conversations"]["context_tokens"])
+        with self.metrics.timer("perplexity"):
+            raw_ppl = self.perplexity.extend(state.perplexity, text)
+        if state.perplexity.cached:
+            self.conversations.touch_kv(conversation_id, state)
+
+        # BERT truncates at the end, so trim the context from the front to keep the whole new turn
+        if context_text:
+            context_text = self.bert.keep_end(context_text)
+        bert_texts = list(dict.fromkeys([text] + [fragment for _, fragment in fragments] +
+                                        ([context_text] if context_text else [])))
+        nearest = None
+        with self.metrics.timer("bert"):
+            if self.attack_index is not None:
+                scores, embeddings = self.bert.predict_with_embeddings(bert_texts, batch_size=len(bert_texts))
+                similarities, rows = self.attack_index.query(embeddings[:1], k=self.config["attack_index"]["top_k"])
+                nearest = [(self.attack_index.texts[row], float(similarity))
+                           for row, similarity in zip(rows[0], similarities[0])]
+            else:
+                scores = self.bert.predict_probabilities(bert_texts, batch_size=len(bert_texts))
+
+        decision = self._build_decision(score_heuristic, raw_ppl, max(scores), text, is_encoded, nearest, mutants=0)
+        if fragments:
+            decision["breakdown"]["decoded_fragments"] = [method for method, _ in fragments]
+        return decision
+
+    def _apply_drift(self, decisions: list, user_ids) -> list:
+        """
+        Checks each verdict's risk against that user's recent risks. Runs
+        after the verdict cache, since the same prompt can be normal for one
+        user and a sudden escalation for another.
+        """
+        if self.drift is None or user_ids is None:
+            return decisions
+
+        settings = self.config["drift"]
+        for decision, user_id in zip(decisions, user_ids):
+            # Heuristic-only verdicts (models loading, overload) are on another scale; keep them out of the history
+            if user_id is None or user_id in settings["ignore_users"] or decision["breakdown"].get("heuristic_only"):
+                continue
+
+            risk = decision["total_risk"]
+            is_anomaly, drift_score = self.drift.update_and_check(user_id, risk)
+            decision["breakdown"]["drift_z"] = round(drift_score, 4)
+            decision["breakdown"]["drift_anomaly"] = is_anomaly
+            if not is_anomaly:
+                continue
+
+            self.metrics.inc("drift_anomalies_total")
+            if (settings["action"] == "block" and decision["status"] == "PASS"
+                    and drift_score > 0 and risk >= settings["min_risk"]):
+                decision["status"] = "BLOCK"
+                decision["reason"] = f"Conversation Drift (risk {risk:.2f}, z={drift_score:.1f})"
+
+        return decisions
+
+    def _scan_cached(self, prompts: list, batch_size: int, cascade: bool) -> list:
+        """Serves what it can from the verdict cache and scans the rest."""
+        # One rules snapshot per call: a concurrent reload cannot mix versions
+        rules = self.rules.current
+        if not self.models_ready:
+            # Still loading (lazy start): answer from the heuristics, never cache it
+            return [self._heuristic_only(prompt, rules) for prompt in prompts]
+        if self.verdict_cache is None:
+            return self._scan_uncached(prompts, batch_size, cascade, rules)
+
+        fingerprint = self._fingerprint(cascade, rules)
+        keys = [content_key(prompt, fingerprint) for prompt in prompts]
+
+        decisions = [None] * len(prompts)
+        misses = []
+        with self.metrics.timer("verdict_cache"):
+            for i, key in enumerate(keys):
+                cached = self.verdict_cache.get(key)
+                if cached is not None:
+                    decisions[i] = copy.deepcopy(cached)
+                else:
+                    misses.append(i)
+        self.metrics.inc("verdict_cache_total", len(prompts) - len(misses), result="hit")
+        self.metrics.inc("verdict_cache_total", len(misses), result="miss")
+
+        if misses:
+            computed = self._scan_uncached([prompts[i] for i in misses], batch_size, cascade, rules)
+            for i, decision in zip(misses, computed):
+                decisions[i] = decision
+                # Divergence cut by the latency budget depends on load, not on the prompt: never cache it
+                used = decision["breakdown"].get("divergence_mutants")
+                if used is not None and used < self.divergence.num_mutants:
+                    continue
+                self.verdict_cache.put(keys[i], copy.deepcopy(decision))
+
+        return decisions
+
+    def _scan_uncached(self, prompts: list, batch_size: int, cascade: bool, rules) -> list:
+        """Runs every layer on the prompts (no verdict cache lookup)."""
         # --- 1. Heuristic Layer & Decoding ---
-        # We assume self.encoding.scan returns (is_encoded, decoded_text, method_name)
-        is_encoded, decoded_text, encoding_method = self.encoding.scan(user_prompt)
+        with self.metrics.timer("heuristic"):
+            heuristics = [self._heuristic_layer(prompt, rules) for prompt in prompts]
+        texts = [text for _, text, _, _ in heuristics]
+
+        raw_ppls = [None] * len(prompts)
+        bert_scores = [None] * len(prompts)
+        nearest = [None] * len(prompts)
+        # BERT and the attack-index lookup share one forward pass, so they are one cascade stage
+        model_weight = self.weights["bert"] + self.weights.get("similarity", 0.0) + self.weights.get("divergence", 0.0)
+        skipped = [[] for _ in prompts] if cascade else None
+        partial_risk = [score_heuristic * self.weights["heuristic"] for score_heuristic, _, _, _ in heuristics]
+
+        # --- 2. Statistical Analysis (Member 2) ---
+        # Analyze the DECODED text (or original if no encoding)
+        todo = self._undecided(partial_risk, self.weights["perplexity"] + model_weight, skipped, "perplexity")
+        with self.metrics.timer("perplexity"):
+            scores = self.perplexity.calculate_scores([texts[i] for i in todo], batch_size=batch_size)
+        for i, raw_ppl in zip(todo, scores):
+            raw_ppls[i] = raw_ppl
+            partial_risk[i] += self.normalize_perplexity(raw_ppl) * self.weights["perplexity"]
+
+        # --- 3. Transformer Detection (Member 3) ---
+        # Analyze the DECODED text, plus every decoded fragment on its own,
+        # all in one batch; a prompt scores as its most malicious piece
+        todo = self._undecided(partial_risk, model_weight, skipped, "bert")
+        bert_texts, owners, first_rows = [], [], []
+        for i in todo:
+            first_rows.append(len(bert_texts))
+            for text in dict.fromkeys([texts[i]] + [fragment for _, fragment in heuristics[i][3]]):
+                bert_texts.append(text)
+                owners.append(i)
+
+        # Mutants of each prompt ride along in the same pass (owner None: not a verdict input)
+        mutant_rows = self._add_mutants(todo, texts, bert_texts, owners, skipped)
+
+        started = time.perf_counter()
+        with self.metrics.timer("bert"):
+            if self.attack_index is not None:
+                scores, embeddings = self.bert.predict_with_embeddings(bert_texts, batch_size=batch_size)
+                embeddings = embeddings[first_rows]
+            else:
+                scores = self.bert.predict_probabilities(bert_texts, batch_size=batch_size)
+        self._observe_bert_rate(len(bert_texts), time.perf_counter() - started)
+        for i, score_bert in zip(owners, scores):
+            if i is not None:
+                bert_scores[i] = score_bert if bert_scores[i] is None else max(bert_scores[i], score_bert)
+
+        # --- 3a. Mutation divergence: spread of BERT's verdicts over each prompt's mutants ---
+        divergences = [None] * len(prompts)
+        mutants = [None] * len(prompts)  # None: divergence off or skipped by the cascade
+        if self.divergence is not None:
+            for i in todo:
+                start, end = mutant_rows.get(i, (0, 0))
+                mutants[i] = end - start
+        if mutant_rows:
+            with self.metrics.timer("divergence"):
+                for j, i in enumerate(todo):
+                    start, end = mutant_rows[i]
+                    divergences[i] = self.divergence.spread([scores[first_rows[j]]] + list(scores[start:end]))
+
+        # --- 3b. Nearest known attacks (one matrix multiply for the whole batch) ---
+        if self.attack_index is not None and todo:
+            with self.metrics.timer("attack_index"):
+                similarities, rows = self.attack_index.query(embeddings, k=self.config["attack_index"]["top_k"])
+            for j, i in enumerate(todo):
+                nearest[i] = [
+                    (self.attack_index.texts[row], float(similarity))
+                    for row, similarity in zip(rows[j], similarities[j])
+                ]
+
+        # --- 4 & 5. Weighted Calculation and Final Decision ---
+        decisions = []
+        # Character statistics for the whole batch in one fused pass
+        text_stats = self.stats.get_token_metrics_batch(texts)
+        for i, (score_heuristic, text, is_encoded, fragments) in enumerate(heuristics):
+            decision = self._build_decision(score_heuristic, raw_ppls[i], bert_scores[i], text, is_encoded, nearest[i],
+                                            divergences[i], mutants[i])
+            if fragments:
+                decision["breakdown"]["decoded_fragments"] = [method for method, _ in fragments]
+            decision["breakdown"]["entropy"] = round(text_stats[i]["entropy"], 4)
+            decision["breakdown"]["max_window_entropy"] = round(text_stats[i]["max_window_entropy"], 4)
+            if cascade:
+                decision["breakdown"]["skipped_stages"] = skipped[i]
+            decisions.append(decision)
+
+        return decisions
+
+    def _add_mutants(self, todo, texts, bert_texts, owners, skipped) -> dict:
+        """
+        Appends the divergence mutants of every prompt in `todo` to the BERT
+        batch. Returns {prompt index: (first row, end row)} of its mutants.
+        Mutants are cut (or skipped, below 2 per prompt) when the estimated
+        BERT time for them would exceed divergence.budget_ms.
+        """
+        if self.divergence is None or not todo:
+            return {}
+
+        k = self.divergence.num_mutants
+        budget = self.config["divergence"]["budget_ms"]
+        if budget is not None and self._bert_seconds_per_text is not None:
+            affordable = budget / 1000.0 / self._bert_seconds_per_text
+            k = min(k, int(affordable // len(todo)))
+        if k < 2:
+            self.metrics.inc("divergence_skips_total", len(todo))
+            if skipped is not None:
+                for i in todo:
+                    skipped[i].append("divergence")
+            return {}
+
+        rows = {}
+        for i in todo:
+            mutants = self.divergence.mutants(texts[i], k)
+            rows[i] = (len(bert_texts), len(bert_texts) + len(mutants))
+            bert_texts.extend(mutants)
+            owners.extend([None] * len(mutants))
+        return rows
+
+    def _observe_bert_rate(self, count, seconds):
+        """Running average of BERT seconds per text (score-cache hits included)."""
+        if count == 0:
+            return
+        rate = seconds / count
+        previous = self._bert_seconds_per_text
+        self._bert_seconds_per_text = rate if previous is None else 0.8 * previous + 0.2 * rate
+
+    def _undecided(self, partial_risk, remaining_weight, skipped, stage) -> list:
+        """
+        Indices of prompts whose verdict can still change.
+        Every layer score is in [0, 1], so the final risk lies somewhere in
+        [partial, partial + remaining_weight]. If that whole range is on one
+        side of the threshold, running the stage cannot change the verdict.
+        Without cascade (skipped is None) every prompt runs every stage.
+        """
+        if skipped is None:
+            return list(range(len(partial_risk)))
+
+        todo = []
+        for i, partial in enumerate(partial_risk):
+            if partial >= self.BLOCKING_THRESHOLD or partial + remaining_weight < self.BLOCKING_THRESHOLD:
+                skipped[i].append(stage)
+            else:
+                todo.append(i)
+        self.metrics.inc("cascade_skips_total", len(partial_risk) - len(todo), stage=stage)
+        return todo
+
+    def _heuristic_layer(self, user_prompt: str, rules) -> tuple:
+        """
+        Runs the cheap filters and decodes hidden payloads.
+        Returns: (score_heuristic (float), text_to_analyze (str), is_encoded (bool),
+                  fragments (list of (method, decoded_text)))
+        """
+        # Every encoded segment is replaced by its decoding in unwrapped_text
+        unwrapped_text, fragments = self.payloads.scan(user_prompt)
+        is_encoded = bool(fragments)
 
         # KEY LOGIC CHANGE:
         # If we successfully decoded it, we analyze the HIDDEN message.
         # If not, we analyze the original user input.
-        if is_encoded and decoded_text:
-            print(f"[INFO] Decoding Detected ({encoding_method}). Analyzing hidden content...")
-            text_to_analyze = decoded_text
+        if is_encoded:
+            methods = ", ".join(dict.fromkeys(method for method, _ in fragments))
+            print(f"[INFO] Decoding Detected ({methods}). Analyzing hidden content...")
+            self.metrics.inc("heuristic_hits_total", layer="encoding")
+            text_to_analyze = unwrapped_text
             # We still penalize them for trying to hide it!
             score_heuristic = 1.0
         else:
             text_to_analyze = user_prompt
 
             # Check other heuristics on the original text
-            is_keyword_blocked, _ = self.keyword.scan(user_prompt)
-            is_regex_sus, _ = self.regex.scan(user_prompt)
+            is_keyword_blocked, _ = rules.keyword.scan(user_prompt)
+            is_regex_sus, _ = rules.regex.scan(user_prompt)
+
+            if is_keyword_blocked:
+                self.metrics.inc("heuristic_hits_total", layer="keyword")
+            if is_regex_sus:
+                self.metrics.inc("heuristic_hits_total", layer="regex")
 
             if is_keyword_blocked or is_regex_sus:
                 score_heuristic = 1.0
             else:
                 score_heuristic = 0.0
 
-        # --- 2. Statistical Analysis (Member 2) ---
-        # Analyze the DECODED text (or original if no encoding)
-        raw_ppl = self.perplexity.calculate_score(text_to_analyze)
-        score_ppl = self.normalize_perplexity(raw_ppl)
+        return score_heuristic, text_to_analyze, is_encoded, fragments
 
-        # --- 3. Transformer Detection (Member 3) ---
-        # Analyze the DECODED text
-        score_bert = self.bert.predict_probability(text_to_analyze)
+    def scan_heuristics(self, prompts: list, note="overloaded", user_ids=None) -> list:
+        """
+        Heuristic-only verdicts without touching the models: the degraded
+        answer when the model queue is full. `note` ends up in the reason.
+        Never cached and never added to the drift history, but audited
+        (flagged heuristic_only) like any other verdict.
+        """
+        rules = self.rules.current
+        decisions = [self._heuristic_only(prompt, rules, note) for prompt in prompts]
+        for decision in decisions:
+            self.metrics.inc("scans_total", status=decision["status"], reason=_reason_label(decision))
+        if self.audit is not None:
+            self.audit.record_batch(prompts, decisions, user_ids)
+        return decisions
+
+    def _heuristic_only(self, user_prompt: str, rules, note="models loading", heuristic=None) -> dict:
+        """
+        Verdict from the heuristic layer alone, used while the models load (or under overload).
+        `heuristic` is an already computed _heuristic_layer result.
+        """
+        if heuristic is None:
+            with self.metrics.timer("heuristic"):
+                heuristic = self._heuristic_layer(user_prompt, rules)
+        score_heuristic, text_to_analyze, _, _ = heuristic
+
+        blocked = score_heuristic >= 1.0
+        return {
+            "status": "BLOCK" if blocked else "PASS",
+            "reason": f"Heuristic Match ({note})" if blocked else f"Safe (heuristics only, {note})",
+            "total_risk": score_heuristic,
+            "breakdown": {
+                "heuristic_score": score_heuristic,
+                "perplexity_norm": None,
+                "bert_prob": None,
+                "analyzed_content": text_to_analyze[:50] + "...",
+                "models_ready": self.models_ready,
+                "heuristic_only": True
+            }
+        }
+
+    def _build_decision(self, score_heuristic, raw_ppl, score_bert, text_to_analyze, is_encoded, nearest=None,
+                        divergence=None, mutants=None) -> dict:
+        """
+        Combines the layer scores into the final weighted verdict.
+        `nearest` is [(attack text, cosine), ...] from the attack index, best first.
+        `divergence` is the mean pairwise KL over the prompt's `mutants`
+        mutated copies; mutants=0 means divergence did not run (latency
+        budget), and the risk is then weighted over the layers that did.
+        """
+        decision = {
+            "status": "PASS",
+            "reason": "Safe",
+            "total_risk": 0.0,
+            "breakdown": {}
+        }
+
+        # A skipped stage (cascade mode) is None and contributes nothing
+        score_ppl = self.normalize_perplexity(raw_ppl) if raw_ppl is not None else None
+        score_similarity = self.normalize_similarity(nearest[0][1]) if nearest else None
+        score_divergence = self.normalize_divergence(divergence) if divergence is not None else None
 
         # --- 4. Weighted Calculation ---
         total_risk = (
                 (score_heuristic * self.weights["heuristic"]) +
-                (score_ppl * self.weights["perplexity"]) +
-                (score_bert * self.weights["bert"])
+                ((score_ppl or 0.0) * self.weights["perplexity"]) +
+                ((score_bert or 0.0) * self.weights["bert"]) +
+                ((score_similarity or 0.0) * self.weights.get("similarity", 0.0)) +
+                ((score_divergence or 0.0) * self.weights.get("divergence", 0.0))
         )
+        divergence_weight = self.weights.get("divergence", 0.0)
+        if mutants == 0 and 0.0 < divergence_weight < 1.0:
+            total_risk /= 1.0 - divergence_weight
 
         # --- 5. Final Decision ---
         if total_risk >= self.BLOCKING_THRESHOLD:
@@ -109,32 +795,87 @@ class SecurePromptPipeline:
         decision["total_risk"] = round(total_risk, 4)
         decision["breakdown"] = {
             "heuristic_score": score_heuristic,
-            "perplexity_norm": round(score_ppl, 2),
-            "bert_prob": round(score_bert, 4),
+            "perplexity_norm": round(score_ppl, 2) if score_ppl is not None else None,
+            "perplexity": round(raw_ppl, 4) if raw_ppl is not None else None,
+            "bert_prob": round(score_bert, 4) if score_bert is not None else None,
             "analyzed_content": text_to_analyze[:50] + "..."  # Log what we actually read
         }
+        if self.divergence is not None:
+            decision["breakdown"]["divergence_kl"] = round(divergence, 4) if divergence is not None else None
+            decision["breakdown"]["divergence_norm"] = round(score_divergence, 4) if score_divergence is not None else None
+            decision["breakdown"]["divergence_mutants"] = mutants
+        if self.attack_index is not None:
+            decision["breakdown"]["similarity_norm"] = round(score_similarity, 4) if score_similarity is not None else None
+            decision["breakdown"]["nearest_attacks"] = [
+                {"text": text[:50] + "...", "similarity": round(similarity, 4)} for text, similarity in nearest or []
+            ]
 
         return decision
 
-    def scan_output(self, llm_response: str) -> dict:
+    def canary_for(self, scope="default") -> str:
+        """Canary token to put in the system prompt of `scope` (tenant, session, ...)."""
+        return self.rules.canaries.token_for(scope)
+
+    def scan_output(self, llm_response: str, scope=None) -> dict:
         """
         Scans the LLM output for leakage or policy violations.
-        (Kept mainly as Member 4 implemented it)
+        Canaries, PII and banned phrases are found in one pass, and every
+        finding (category, type, offsets) is listed under "findings".
+        `scope` is the tenant/session whose canary must be recognized.
         """
-        decision = {"status": "PASS", "reason": None}
+        with self.metrics.timer("output"):
+            decision, check = self._scan_output(llm_response, scope)
+        self.metrics.inc("output_scans_total", status=decision["status"], reason=check)
+        return decision
 
-        # Check Leakage
-        is_leaked, reason = self.leakage.check_output(llm_response)
-        if is_leaked:
-            decision["status"] = "BLOCK"
-            decision["reason"] = reason
-            return decision
+    def _scan_output(self, llm_response: str, scope=None) -> tuple:
+        """Returns (decision, name of the check that decided it)."""
+        rules = self.rules.current
+        findings = rules.output.scan(llm_response, scopes=(scope,) if scope is not None else ())
 
-        # Check Policy
-        is_violation, reason = self.policy.validate_response(llm_response)
-        if is_violation:
-            decision["status"] = "BLOCK"
-            decision["reason"] = reason
-            return decision
+        check, reason = verdict(findings)
+        decision = {"status": "PASS" if check == "safe" else "BLOCK", "reason": reason, "findings": findings}
+        return decision, check
 
-        return decision
\ No newline at end of file
+    def redact_output(self, llm_response: str, scope=None) -> dict:
+        """
+        Redaction mode of scan_output: canaries and PII (redaction.categories)
+        are replaced by typed placeholders such as [EMAIL] instead of
+        blocking the whole response, so it does not have to be regenerated.
+        Other findings (banned phrases) still BLOCK. Status is "PASS",
+        "REDACTED" or "BLOCK"; "response" is the redacted text (None when
+        blocked) and "findings" lists every span found, in the original
+        response's offsets. One scan plus one pass to rebuild the text.
+        """
+        categories = self.config["redaction"]["categories"]
+        with self.metrics.timer("output"):
+            findings = self.rules.current.output.scan(llm_response, scopes=(scope,) if scope is not None else ())
+            check, reason = verdict([finding for finding in findings if finding["category"] not in categories])
+            if check != "safe":
+                decision = {"status": "BLOCK", "reason": reason, "response": None, "findings": findings}
+            else:
+                redactable = [finding for finding in findings if finding["category"] in categories]
+                decision = {
+                    "status": "REDACTED" if redactable else "PASS",
+                    "reason": f"Redacted {len(redactable)} span(s)" if redactable else None,
+                    "response": redact(llm_response, redactable),
+                    "findings": findings
+                }
+        self.metrics.inc("output_scans_total", status=decision["status"], reason=check)
+        return decision
+
+    def stream_redactor(self, overlap=None, scope=None) -> OutputStreamRedactor:
+        """Incremental redact_output: .feed() returns the redacted text that is safe to forward."""
+        if overlap is None:
+            overlap = self.config["output_stream"]["overlap_chars"]
+        return OutputStreamRedactor(self.rules.current, overlap=overlap, scopes=(scope,) if scope is not None else (),
+                                    categories=self.config["redaction"]["categories"])
+
+    def stream_scanner(self, overlap=None, scope=None) -> OutputStreamScanner:
+        """
+        Incremental scan_output for token-by-token responses.
+        Feed chunks with .feed(); forward only what it returns.
+        """
+        if overlap is None:
+            overlap = self.config["output_stream"]["overlap_chars"]
+        return OutputStreamScanner(self.rules.current, overlap=overlap, scopes=(scope,) if scope is not None else ())
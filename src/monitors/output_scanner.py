@@ -0,0 +1,142 @@
+import re
+
+from src.filters.matcher import AhoCorasick, leading_literal
+from .leakage import CANARY_PREFIX, CANARY_PATTERN
+
+# Which finding decides the verdict when there are several (Layer 4 order)
+CATEGORY_ORDER = ("canary", "pii", "policy")
+
+
+def _lower_same_length(text: str) -> str:
+    """text.lower(), except characters whose lowercase is longer stay as they are (offsets line up)."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(ch if len(ch.lower()) != 1 else ch.lower() for ch in text)
+
+
+class OutputScanner:
+    """
+    Canaries, PII regexes and banned phrases checked in one pass.
+
+    Banned phrases, the canary prefix and the leading literal of every PII
+    pattern go into a single Aho-Corasick automaton over the lowercased
+    response. A hit on a phrase is a finding; a hit on the canary prefix or
+    a PII literal is confirmed with that regex anchored at the hit. Canary
+    tokens are looked up in the CanaryRegistry, so thousands of tenant or
+    session canaries cost one dict lookup each, not one pattern each.
+    PII patterns without a leading literal (email, phone, ...) each run
+    their own search (one alternation would drop overlapping findings).
+
+    Findings are dicts: category ("canary", "pii", "policy"), type (e.g.
+    "email", "banned_phrase"), start, end, rule, and the scope for canaries.
+    """
+
+    def __init__(self, leakage, policy):
+        self.leakage = leakage
+        self.canaries = leakage.canaries
+
+        # literal (lowercased) -> [(kind, reference)]
+        self._literals = {}
+        for phrase in policy.banned_output_keywords:
+            self._literals.setdefault(phrase.lower(), []).append(("policy", phrase))
+        self._literals.setdefault(CANARY_PREFIX.lower(), []).append(("canary", None))
+
+        self._pii = [re.compile(pattern) for pattern in leakage.pii_patterns]
+        residual = []
+        for index, pattern in enumerate(leakage.pii_patterns):
+            anchor = leading_literal(pattern).lower()
+            if anchor:
+                self._literals.setdefault(anchor, []).append(("pii", index))
+            else:
+                residual.append(index)
+
+        self._automaton = AhoCorasick(list(self._literals))
+        self._residual = residual
+
+        # Longest literal we look for (stream scanners hold back at least this much)
+        self.longest_literal = max([len(phrase) for phrase in policy.banned_output_keywords] +
+                                   [len(CANARY_PREFIX) + 33])
+
+    def _pii_finding(self, index, start, end) -> dict:
+        return {"category": "pii", "type": self.leakage.pii_types[index], "start": start, "end": end,
+                "rule": self.leakage.pii_patterns[index]}
+
+    def scan(self, text: str, scopes=()) -> list:
+        """
+        Every finding in `text`, ordered by start offset.
+        `scopes` are tenants/sessions whose derived canaries must be
+        recognized even if this process never issued them.
+        """
+        for scope in scopes:
+            self.canaries.expect(scope)
+
+        findings = []
+        for start, end, literal in self._automaton.find_all(_lower_same_length(text)):
+            for kind, reference in self._literals[literal]:
+                if kind == "policy":
+                    findings.append({"category": "policy", "type": "banned_phrase", "start": start, "end": end,
+                                     "rule": reference})
+                elif kind == "canary":
+                    match = CANARY_PATTERN.match(text, start)
+                    scope = self.canaries.scope_of(match.group()) if match else None
+                    if scope is not None:
+                        findings.append({"category": "canary", "type": "canary", "start": start,
+                                         "end": match.end(), "rule": match.group(), "scope": scope})
+                else:
+                    match = self._pii[reference].match(text, start)
+                    if match:
+                        findings.append(self._pii_finding(reference, match.start(), match.end()))
+
+        for index in self._residual:
+            for match in self._pii[index].finditer(text):
+                findings.append(self._pii_finding(index, match.start(), match.end()))
+
+        findings.sort(key=lambda finding: (finding["start"], finding["end"]))
+        return findings
+
+
+def verdict(findings) -> tuple:
+    """
+    (check, reason) for a list of findings: the check is "leakage",
+    "policy" or "safe", the reason the same text LeakageMonitor and
+    PolicyEnforcer give (canaries first, then PII, then phrases).
+    """
+    for category in CATEGORY_ORDER:
+        for finding in findings:
+            if finding["category"] != category:
+                continue
+            if category == "canary":
+                return "leakage", f"CRITICAL: Canary Token Leaked! ({finding['rule']})"
+            if category == "pii":
+                return "leakage", "CRITICAL: PII/Secret Pattern Detected in Output"
+            return "policy", f"Policy Violation: Response contained banned phrase '{finding['rule']}'"
+    return "safe", None
+
+
+def placeholder(finding) -> str:
+    """Typed placeholder for a redacted span, e.g. [EMAIL] or [CANARY]."""
+    return f"[{finding['type'].upper()}]"
+
+
+def redact(text: str, findings, offset=0) -> str:
+    """
+    `text` with every finding's span replaced by its placeholder, in one
+    pass over the (start-ordered) findings. Findings are in the coordinates
+    of a larger text that `text` starts at `offset` of; overlapping spans
+    collapse into the first placeholder.
+    """
+    parts = []
+    last = 0
+    for finding in findings:
+        start, end = finding["start"] - offset, finding["end"] - offset
+        if start < last:
+            last = max(last, end)
+            continue
+        parts.append(text[last:start])
+        parts.append(placeholder(finding))
+        last = end
+    if not parts:
+        return text
+    parts.append(text[last:])
+    return "".join(parts)
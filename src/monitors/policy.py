@@ -1,5 +1,8 @@
+from src.filters.matcher import AhoCorasick
+
+
 class PolicyEnforcer:
-    def __init__(self):
+    def __init__(self, extra_phrases=None):
         # Report Ref: "Output Policy Enforcer" [cite: 1666]
         # These are words the LLM should NEVER output in a secured environment.
         self.banned_output_keywords = [
@@ -10,16 +13,22 @@ class PolicyEnforcer:
             "unfiltered response",
             "DAN mode enabled"
         ]
+        for phrase in extra_phrases or []:
+            if phrase not in self.banned_output_keywords:
+                self.banned_output_keywords.append(phrase)
+
+        # Case-insensitive: match lowercased phrases, report the original spelling
+        self._original = {phrase.lower(): phrase for phrase in self.banned_output_keywords}
+        self.matcher = AhoCorasick(list(self._original))
 
     def validate_response(self, text: str) -> tuple:
         """
         Checks if the response violates safety policies.
         Returns: (is_violation (bool), reason (str))
         """
-        text_lower = text.lower()
-
-        for phrase in self.banned_output_keywords:
-            if phrase.lower() in text_lower:
-                return True, f"Policy Violation: Response contained banned phrase '{phrase}'"
+        matches = self.matcher.find_all(text.lower())
+        if matches:
+            phrase = self._original[matches[0][2]]
+            return True, f"Policy Violation: Response contained banned phrase '{phrase}'"
 
         return False, None
\ No newline at end of file
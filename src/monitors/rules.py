@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import yaml
+
+from src.filters import KeywordFilter, RegexRuleEngine
+from src.utils import load_config
+from .leakage import LeakageMonitor, CanaryRegistry
+from .policy import PolicyEnforcer
+from .output_scanner import OutputScanner
+
+# Rule lists that can be set in config.yaml (`filters:`) or in a rules file
+RULE_KEYS = ("blocked_keywords", "suspicious_patterns", "banned_output_phrases", "pii_patterns")
+
+
+class RuleSet:
+    """
+    One compiled, read-only version of every rule list.
+    Scans grab a RuleSet once and use it to the end, so a reload never
+    changes the rules halfway through a scan.
+    """
+
+    def __init__(self, rules: dict, version: int, canary_token=None, canaries=None):
+        started = time.perf_counter()
+
+        self.keyword = KeywordFilter(rules["blocked_keywords"])
+        self.regex = RegexRuleEngine(rules["suspicious_patterns"])
+        self.policy = PolicyEnforcer(rules["banned_output_phrases"])
+        self.leakage = LeakageMonitor(rules["pii_patterns"], canary_token=canary_token, canaries=canaries)
+        # Canaries, PII and banned phrases in one pass (what scan_output uses)
+        self.output = OutputScanner(self.leakage, self.policy)
+
+        self.version = version
+        self.compile_seconds = time.perf_counter() - started
+        self.loaded_at = time.time()
+        # Content hash: identical rules give the same digest in every worker
+        self.digest = hashlib.sha256(json.dumps(rules, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "digest": self.digest,
+            "compile_ms": round(self.compile_seconds * 1000.0, 3),
+            "loaded_at": self.loaded_at,
+            "counts": {
+                "blocked_keywords": len(self.keyword.blocklist),
+                "suspicious_patterns": len(self.regex.suspicious_patterns),
+                "banned_output_phrases": len(self.policy.banned_output_keywords),
+                "pii_patterns": len(self.leakage.pii_patterns)
+            }
+        }
+
+
+class RuleRegistry:
+    """
+    Loads rule lists from config.yaml (and an optional rules file), compiles
+    them into a RuleSet and swaps in a new RuleSet atomically on reload().
+    The model server keeps running; only the matchers are rebuilt.
+    """
+
+    def __init__(self, config: dict, config_path=None):
+        self.config_path = config_path or os.environ.get("SECUREPROMPT_CONFIG", "config.yaml")
+        self.rules_path = config["rules"]["path"]
+        self.poll_seconds = config["rules"]["poll_seconds"]
+
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._mtimes = self._read_mtimes()
+
+        # Canary tokens outlive rule reloads; with a key every worker derives the same ones
+        canary_config = config["canaries"]
+        canary_key = canary_config["key"] or os.environ.get("SECUREPROMPT_CANARY_KEY")
+        self.canaries = CanaryRegistry(key=canary_key, length=canary_config["length"],
+                                       max_scopes=canary_config["max_scopes"])
+
+        self._current = RuleSet(self._collect(config), version=1, canaries=self.canaries)
+        self.last_error = None
+
+    @property
+    def current(self) -> RuleSet:
+        return self._current
+
+    def _collect(self, config: dict) -> dict:
+        """Merges filters.* from config with the rules file (if any)."""
+        filters = config.get("filters", {})
+        rules = {key: list(filters.get(key) or []) for key in RULE_KEYS}
+
+        if self.rules_path and os.path.exists(self.rules_path):
+            with open(self.rules_path, "r", encoding="utf-8") as f:
+                extra = yaml.safe_load(f) or {}
+            for key in RULE_KEYS:
+                rules[key].extend(extra.get(key) or [])
+
+        return rules
+
+    def reload(self) -> RuleSet:
+        """
+        Re-reads the config and rules file, compiles a new RuleSet and swaps
+        it in. If compiling fails (e.g. a bad regex) the old rules stay active
+        and the error is raised.
+        """
+        with self._lock:
+            try:
+                config = load_config(self.config_path)
+                self.rules_path = config["rules"]["path"]
+                rules = self._collect(config)
+                new_rules = RuleSet(
+                    rules,
+                    version=self._current.version + 1,
+                    canary_token=self._current.leakage.canary_token,
+                    canaries=self.canaries
+                )
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            finally:
+                # The watcher only retries after the next edit, not on every poll
+                self._mtimes = self._read_mtimes()
+
+            self.last_error = None
+            # A single attribute assignment: readers see either the old or the new set
+            self._current = new_rules
+            return new_rules
+
+    def _read_mtimes(self) -> tuple:
+        paths = (self.config_path, self.rules_path)
+        return tuple(os.path.getmtime(p) if p and os.path.exists(p) else None for p in paths)
+
+    def start_watching(self):
+        """Polls the config and rules file and reloads when either changes."""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="secureprompt-rules", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is None:
+            return
+        self._stop.set()
+        self._watcher.join()
+        self._watcher = None
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_seconds):
+            if self._read_mtimes() == self._mtimes:
+                continue
+            try:
+                rules = self.reload()
+                print(f"[INFO] Rules reloaded (version {rules.version}, {rules.compile_seconds * 1000:.1f} ms)")
+            except Exception as e:
+                print(f"[WARN] Rule reload failed, keeping version {self._current.version}: {e}")
+
+    def info(self) -> dict:
+        return {
+            **self._current.info(),
+            "config_path": self.config_path,
+            "rules_path": self.rules_path,
+            "watching": self._watcher is not None,
+            "last_error": self.last_error
+        }
@@ -0,0 +1,159 @@
+from .output_scanner import verdict, redact
+
+
+class OutputStreamScanner:
+    """
+    Incremental version of SecurePromptPipeline.scan_output for streamed LLM
+    responses.
+
+    Every chunk is checked together with the unreleased tail of the previous
+    chunks, so canaries, PII and banned phrases that straddle a chunk boundary
+    are still caught. Only text that can no longer be part of a match is
+    released: the last `overlap` characters are held back until more text
+    arrives (or the stream closes). Memory stays bounded by the overlap window
+    no matter how long the response is.
+    """
+
+    def __init__(self, rules, overlap=256, scopes=()):
+        self.output = rules.output
+        self.scopes = tuple(scopes)
+
+        # The window must at least hold the longest literal we look for
+        self.overlap = max(int(overlap), self.output.longest_literal)
+
+        self._tail = ""
+        self.released = 0  # number of characters handed back to the caller
+        self.status = "PASS"
+        self.reason = None
+
+    @property
+    def stopped(self) -> bool:
+        return self.status == "BLOCK"
+
+    def feed(self, chunk: str) -> str:
+        """
+        Scans the next chunk. Returns the text that is safe to forward now
+        (possibly ""). After a violation nothing more is released.
+        """
+        if self.stopped or not chunk:
+            return ""
+
+        window = self._tail + chunk
+        if self._check(window):
+            self._tail = ""
+            return ""
+
+        split = self._split_point(window)
+        safe, self._tail = window[:split], window[split:]
+        self.released += len(safe)
+        return safe
+
+    def close(self) -> str:
+        """Ends the stream and releases the (already checked) held-back tail."""
+        if self.stopped:
+            return ""
+        safe, self._tail = self._tail, ""
+        self.released += len(safe)
+        return safe
+
+    def result(self) -> dict:
+        """Same shape as scan_output, plus how much text was let through."""
+        return {"status": self.status, "reason": self.reason, "released_chars": self.released}
+
+    def _check(self, window: str) -> bool:
+        check, reason = verdict(self.output.scan(window, self.scopes))
+        if check == "safe":
+            return False
+
+        self.status = "BLOCK"
+        self.reason = reason
+        return True
+
+    def _split_point(self, window: str) -> int:
+        """
+        Where to cut between released text and held-back tail.
+        Prefer a whitespace boundary so the next window does not start in the
+        middle of a word or number (which could fake a \\b match), but never
+        hold back more than twice the overlap.
+        """
+        limit = len(window) - self.overlap
+        if limit <= 0:
+            return 0
+
+        lowest = max(limit - self.overlap, 0)
+        cut = max(window.rfind(" ", lowest, limit), window.rfind("\n", lowest, limit))
+        return cut + 1 if cut >= 0 else limit
+
+
+class OutputStreamRedactor(OutputStreamScanner):
+    """
+    Streaming redaction: like OutputStreamScanner, but canaries and PII
+    (`categories`) are replaced by typed placeholders as the text is
+    released instead of stopping the stream. Other findings (banned
+    phrases) still stop it. Only the held-back window is ever buffered,
+    and a span is never split between two released pieces.
+    `findings` collects every redacted span with offsets in the original
+    (unredacted) response.
+    """
+
+    def __init__(self, rules, overlap=256, scopes=(), categories=("canary", "pii")):
+        super().__init__(rules, overlap=overlap, scopes=scopes)
+        self.categories = frozenset(categories)
+        self.findings = []
+        self._consumed = 0  # characters of the original response before self._tail
+
+    def feed(self, chunk: str) -> str:
+        if self.stopped or not chunk:
+            return ""
+
+        window = self._tail + chunk
+        findings = self.output.scan(window, self.scopes)
+        if self._block(findings):
+            self._tail = ""
+            return ""
+
+        # Move the cut back until it does not fall inside a span
+        split = self._split_point(window)
+        moved = True
+        while moved:
+            moved = False
+            for finding in findings:
+                if finding["start"] < split < finding["end"]:
+                    split = finding["start"]
+                    moved = True
+
+        return self._release(window, split, [finding for finding in findings if finding["end"] <= split])
+
+    def close(self) -> str:
+        """Ends the stream and releases the held-back tail, redacted."""
+        if self.stopped or not self._tail:
+            return ""
+        window = self._tail
+        findings = self.output.scan(window, self.scopes)
+        if self._block(findings):
+            self._tail = ""
+            return ""
+        return self._release(window, len(window), findings)
+
+    def _block(self, findings) -> bool:
+        check, reason = verdict([finding for finding in findings if finding["category"] not in self.categories])
+        if check == "safe":
+            return False
+        self.status = "BLOCK"
+        self.reason = reason
+        return True
+
+    def _release(self, window, split, findings) -> str:
+        for finding in findings:
+            self.findings.append({**finding, "start": finding["start"] + self._consumed,
+                                  "end": finding["end"] + self._consumed})
+        safe = redact(window[:split], findings)
+        self._tail = window[split:]
+        self._consumed += split
+        self.released += len(safe)
+        if findings and self.status == "PASS":
+            self.status = "REDACTED"
+        return safe
+
+    def result(self) -> dict:
+        return {**super().result(), "findings": self.findings}
@@ -0,0 +1,3 @@
+"""
+Offline tools (bulk scanning, calibration) built on top of the pipeline.
+"""
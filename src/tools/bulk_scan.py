@@ -0,0 +1,176 @@
+"""
+Offline bulk scanning of JSONL/CSV prompt corpora.
+
+    python main.py scan-file prompts.jsonl -o verdicts.jsonl --workers 4
+
+Records are streamed from disk, grouped into batches and fanned out to a
+process pool; every worker loads the models once. Verdicts are written as
+JSONL in input order. A checkpoint file next to the output records progress,
+so `--resume` continues where an interrupted run stopped. Only a bounded
+number of batches is in flight at any time, so memory does not grow with
+the corpus size.
+"""
+import csv
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from tqdm import tqdm
+
+# Set in each worker process by _init_worker()
+_pipeline = None
+
+
+def iter_records(path, fmt=None, field="prompt", id_field=None):
+    """
+    Yields (record_id, prompt) one at a time from a JSONL or CSV file.
+    Without an id field, the 1-based record number is used as the id.
+    """
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for number, row in enumerate(rows, start=1):
+            record_id = row.get(id_field, number) if id_field else number
+            yield record_id, str(row.get(field) or "")
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _init_worker(config_path, torch_threads):
+    """Runs once per worker process: pin torch threads and load the models."""
+    global _pipeline
+    import torch
+    from src.monitors import SecurePromptPipeline
+    from src.utils import load_config
+
+    torch.set_num_threads(torch_threads)
+    _pipeline = SecurePromptPipeline(load_config(config_path))
+
+
+def _scan_batch(batch, batch_size):
+    decisions = _pipeline.scan_batch([prompt for _, prompt in batch], batch_size=batch_size)
+    return [
+        {
+            "id": record_id,
+            "status": decision["status"],
+            "reason": decision["reason"],
+            "total_risk": decision["total_risk"],
+            "breakdown": decision["breakdown"]
+        }
+        for (record_id, _), decision in zip(batch, decisions)
+    ]
+
+
+def _read_checkpoint(path):
+    if not os.path.exists(path):
+        return {"records_done": 0, "output_bytes": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_checkpoint(path, records_done, output_bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"records_done": records_done, "output_bytes": output_bytes}, f)
+    os.replace(tmp, path)  # atomic: a crash never leaves a half-written checkpoint
+
+
+def scan_file(input_path, output_path, fmt=None, field="prompt", id_field=None,
+              workers=1, batch_size=32, resume=False, config_path=None, torch_threads=None):
+    """
+    Scans every record of `input_path` and writes one verdict per line to
+    `output_path`. Returns a summary dict (records, blocked, seconds, rate).
+    workers=0 runs in this process (useful for debugging).
+    """
+    checkpoint_path = output_path + ".ckpt"
+    checkpoint = _read_checkpoint(checkpoint_path) if resume else {"records_done": 0, "output_bytes": 0}
+    output_size = os.path.getsize(output_path) if os.path.exists(output_path) else None
+    if checkpoint["records_done"] and (output_size is None or output_size < checkpoint["output_bytes"]):
+        # The verdicts the checkpoint counts are gone; padding the file would leave NUL bytes in their place
+        print(f"Warning: {output_path} is missing or shorter than its checkpoint. Restarting from the first record.")
+        checkpoint = {"records_done": 0, "output_bytes": 0}
+    skip = checkpoint["records_done"]
+
+    # Drop anything written after the last checkpoint (e.g. a partial batch before a crash)
+    mode = "r+b" if skip and output_size is not None else "wb"
+    out = open(output_path, mode)
+    out.truncate(checkpoint["output_bytes"])
+    out.seek(checkpoint["output_bytes"])
+
+    records = iter_records(input_path, fmt, field, id_field)
+    for _ in range(skip):
+        next(records, None)
+    batches = batched(records, batch_size)
+
+    if torch_threads is None:
+        torch_threads = max(1, (os.cpu_count() or 1) // max(workers, 1))
+
+    pool = None
+    if workers > 0:
+        # spawn: workers start clean instead of inheriting torch's thread state via fork
+        context = multiprocessing.get_context("spawn")
+        pool = context.Pool(workers, initializer=_init_worker, initargs=(config_path, torch_threads))
+    else:
+        _init_worker(config_path, torch_threads)
+
+    done = skip
+    blocked = 0
+    started = time.perf_counter()
+    progress = tqdm(initial=skip, unit="prompt", desc="scan-file", smoothing=0.1)
+
+    def write(results):
+        nonlocal done, blocked
+        for result in results:
+            out.write((json.dumps(result, ensure_ascii=False) + "\n").encode("utf-8"))
+            blocked += result["status"] == "BLOCK"
+        out.flush()
+        done += len(results)
+        _write_checkpoint(checkpoint_path, done, out.tell())
+        progress.update(len(results))
+
+    try:
+        if pool is None:
+            for batch in batches:
+                write(_scan_batch(batch, batch_size))
+        else:
+            # Keep a bounded number of batches in flight, collect them in input order
+            in_flight = deque()
+            max_in_flight = workers * 2
+            for batch in batches:
+                in_flight.append(pool.apply_async(_scan_batch, (batch, batch_size)))
+                if len(in_flight) >= max_in_flight:
+                    write(in_flight.popleft().get())
+            while in_flight:
+                write(in_flight.popleft().get())
+    finally:
+        progress.close()
+        out.close()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    seconds = time.perf_counter() - started
+    scanned = done - skip
+    return {
+        "records": done,
+        "scanned_this_run": scanned,
+        "blocked_this_run": blocked,
+        "seconds": round(seconds, 2),
+        "prompts_per_second": round(scanned / seconds, 2) if seconds > 0 else 0.0
+    }
@@ -0,0 +1,372 @@
+"""
+Offline calibration of the ensemble weights, the blocking threshold and the
+perplexity normalization curve against a labelled corpus.
+
+    python main.py calibrate labelled.jsonl --fn-cost 5 --write
+
+Every record is scored by the pipeline exactly once (no cascade), and the
+raw per-layer scores are cached in a NumPy file next to the corpus, so
+later runs only repeat the sweep. The sweep itself never touches a model:
+for every perplexity curve the layer scores are normalized once, every
+weight combination on a simplex grid is applied with one matrix product,
+and every threshold is evaluated at once from per-combination histograms
+of the risk (thresholds are the `bins` + 1 points k / bins). Millions of
+configurations take seconds.
+
+The best configuration (lowest expected cost, or highest F1) is printed
+with its ROC/PR summary; --report writes the full curves as JSON and
+--write puts the settings back into config.yaml.
+"""
+import csv
+import hashlib
+import json
+import os
+
+import numpy as np
+from tqdm import tqdm
+
+# Columns of the score cache (raw, before normalization)
+LAYERS = ("heuristic", "perplexity", "bert", "similarity", "divergence")
+PERPLEXITY_CURVES = ("linear", "log")
+PERPLEXITY_LIMITS = (20.0, 30.0, 50.0, 75.0, 100.0, 150.0, 200.0, 300.0, 500.0, 1000.0)
+
+POSITIVE_LABELS = {"1", "true", "attack", "jailbreak", "injection", "malicious", "block"}
+NEGATIVE_LABELS = {"0", "false", "benign", "safe", "pass"}
+
+
+def parse_label(value) -> int:
+    """1 for an attack, 0 for a benign prompt (numbers, booleans or names)."""
+    label = str(value).strip().lower()
+    if label in POSITIVE_LABELS:
+        return 1
+    if label in NEGATIVE_LABELS:
+        return 0
+    raise ValueError(f"Unknown label {value!r}")
+
+
+def iter_labelled(path, fmt=None, field="prompt", label_field="label"):
+    """Yields (prompt, label) from a JSONL or CSV file."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        rows = csv.DictReader(f) if fmt == "csv" else (json.loads(line) for line in f if line.strip())
+        for number, row in enumerate(rows, start=1):
+            try:
+                yield str(row.get(field) or ""), parse_label(row[label_field])
+            except (KeyError, ValueError) as e:
+                raise ValueError(f"{path}, record {number}: {e}") from None
+
+
+def _file_digest(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _layer_scores(decision) -> list:
+    """Raw layer scores from a decision breakdown (NaN where a layer did not run)."""
+    breakdown = decision["breakdown"]
+    nearest = breakdown.get("nearest_attacks")
+    values = [
+        breakdown.get("heuristic_score"),
+        breakdown.get("perplexity"),
+        breakdown.get("bert_prob"),
+        nearest[0]["similarity"] if nearest else None,
+        breakdown.get("divergence_kl")
+    ]
+    return [np.nan if value is None else value for value in values]
+
+
+def score_corpus(input_path, cache_path=None, fmt=None, field="prompt", label_field="label", batch_size=32,
+                 config_path=None, rescore=False):
+    """
+    Raw layer scores [n, len(LAYERS)] and labels [n] of the corpus, from
+    the cache file when it was made from the same corpus and models.
+    """
+    from src.utils import load_config
+
+    config = load_config(config_path)
+    cache_path = cache_path or input_path + ".scores.npz"
+    meta = {
+        "corpus": _file_digest(input_path),
+        "field": field,
+        "label_field": label_field,
+        "models": [config.get("paths"), config["inference"]["backend"]],
+        "perplexity_window": [config["perplexity"]["window"], config["perplexity"]["stride"]],
+        "attack_index": config["attack_index"]["path"] if config["attack_index"]["enabled"] else None,
+        "divergence": config["divergence"] if config["divergence"]["enabled"] else None
+    }
+
+    if not rescore and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if json.loads(str(cached["meta"])) == meta:
+                print(f"[INFO] Using cached scores from {cache_path}")
+                return cached["scores"], cached["labels"]
+        print(f"[INFO] {cache_path} is from another corpus or model; rescoring")
+
+    from src.monitors import SecurePromptPipeline
+
+    # Every layer on every record, nothing stored besides the cache file
+    config["audit"]["enabled"] = False
+    config["cache"]["verdicts"]["enabled"] = False
+    config["divergence"]["budget_ms"] = None
+    pipeline = SecurePromptPipeline(config)
+
+    records = list(iter_labelled(input_path, fmt, field, label_field))
+    scores = np.empty((len(records), len(LAYERS)), dtype=np.float32)
+    for start in tqdm(range(0, len(records), batch_size), desc="Scoring", unit="batch"):
+        prompts = [prompt for prompt, _ in records[start:start + batch_size]]
+        decisions = pipeline.scan_batch(prompts, batch_size=batch_size, cascade=False)
+        scores[start:start + len(prompts)] = [_layer_scores(decision) for decision in decisions]
+    labels = np.array([label for _, label in records], dtype=np.int8)
+
+    np.savez_compressed(cache_path, scores=scores, labels=labels, meta=np.array(json.dumps(meta)))
+    print(f"[INFO] Cached {len(records)} scored records in {cache_path}")
+    return scores, labels
+
+
+def perplexity_curve(ppl, limit, curve="linear"):
+    """Vectorized SecurePromptPipeline.normalize_perplexity."""
+    ppl = np.asarray(ppl, dtype=np.float64)
+    if curve == "log":
+        normalized = np.log1p(ppl) / np.log1p(limit)
+    else:
+        normalized = ppl / limit
+    return np.minimum(normalized, 1.0)
+
+
+def active_layers(scores) -> list:
+    """Layers that were scored for at least one record."""
+    return [layer for j, layer in enumerate(LAYERS) if not np.isnan(scores[:, j]).all()]
+
+
+def normalized_features(scores, layers, config, limit, curve) -> np.ndarray:
+    """[n, len(layers)] layer scores on the 0 - 1 scale the pipeline weights."""
+    columns = []
+    for layer in layers:
+        raw = np.nan_to_num(scores[:, LAYERS.index(layer)].astype(np.float64))
+        if layer == "perplexity":
+            raw = perplexity_curve(raw, limit, curve)
+        elif layer == "similarity":
+            floor = config["attack_index"]["min_similarity"]
+            raw = np.clip((raw - floor) / (1.0 - floor), 0.0, 1.0)
+        elif layer == "divergence":
+            raw = np.minimum(raw / config["divergence"]["kl_scale"], 1.0)
+        columns.append(raw)
+    return np.stack(columns, axis=1)
+
+
+def weight_grid(num_layers, step=0.05) -> np.ndarray:
+    """Every weight vector on the simplex with entries that are multiples of `step` ([m, num_layers])."""
+    units = int(round(1.0 / step))
+
+    def compositions(total, parts):
+        if parts == 1:
+            return [[total]]
+        return [[first] + rest for first in range(total + 1) for rest in compositions(total - first, parts - 1)]
+
+    return np.array(compositions(units, num_layers), dtype=np.float64) / units
+
+
+def threshold_counts(features, labels, weights, bins=1000, max_cells=4_000_000) -> tuple:
+    """
+    True and false positives of every weight vector at every threshold
+    k / bins (k = 0 .. bins), as two [m, bins + 1] arrays: risk >= k / bins
+    exactly when floor(risk * bins) >= k, so one histogram of floor(risk * bins)
+    per weight vector, summed from the top, gives all the thresholds at once.
+    """
+    positives = labels.astype(bool)
+    m = len(weights)
+    tp = np.empty((m, bins + 1), dtype=np.int64)
+    fp = np.empty((m, bins + 1), dtype=np.int64)
+
+    chunk = max(1, max_cells // max(len(features), 1))
+    for start in range(0, m, chunk):
+        block = weights[start:start + chunk]
+        risk = features @ block.T  # [n, chunk]
+        # The epsilon keeps risks that land exactly on a threshold (0.2 + 0.3 = 0.5) on its blocking side
+        cells = np.minimum((risk * bins + 1e-9).astype(np.int64), bins)
+        cells += np.arange(len(block)) * (bins + 1)
+        size = len(block) * (bins + 1)
+        for target, mask in ((tp, positives), (fp, ~positives)):
+            histogram = np.bincount(cells[mask].ravel(), minlength=size).reshape(len(block), bins + 1)
+            target[start:start + len(block)] = np.cumsum(histogram[:, ::-1], axis=1)[:, ::-1]
+    return tp, fp
+
+
+def curve_metrics(tp, fp, positives, negatives, fn_cost=1.0, fp_cost=1.0) -> dict:
+    """Rates, precision, F1, expected cost per record and ROC/PR AUC from threshold counts."""
+    fn = positives - tp
+    tpr = tp / max(positives, 1)
+    fpr = fp / max(negatives, 1)
+    precision = np.divide(tp, tp + fp, out=np.ones(tp.shape), where=(tp + fp) > 0)
+    f1 = np.divide(2 * precision * tpr, precision + tpr, out=np.zeros(tp.shape), where=(precision + tpr) > 0)
+    cost = (fn_cost * fn + fp_cost * fp) / max(positives + negatives, 1)
+
+    # Thresholds rise with k, so both rates fall; close each curve at (0, 0)
+    zeros = np.zeros(tp.shape[:-1] + (1,))
+    tpr_closed = np.concatenate([tpr, zeros], axis=-1)
+    fpr_closed = np.concatenate([fpr, zeros], axis=-1)
+    roc_auc = ((fpr_closed[..., :-1] - fpr_closed[..., 1:]) * (tpr_closed[..., :-1] + tpr_closed[..., 1:]) / 2).sum(-1)
+    pr_auc = ((tpr_closed[..., :-1] - tpr_closed[..., 1:]) * precision).sum(-1)
+
+    return {"tpr": tpr, "fpr": fpr, "precision": precision, "f1": f1, "cost": cost,
+            "roc_auc": roc_auc, "pr_auc": pr_auc}
+
+
+def sweep(scores, labels, config, step=0.05, bins=1000, curves=PERPLEXITY_CURVES, limits=PERPLEXITY_LIMITS,
+          objective="cost", fn_cost=1.0, fp_cost=1.0, max_fpr=None) -> dict:
+    """
+    Best (curve, limit, weights, threshold) over the whole grid, with its
+    metrics and ROC/PR curves, plus the current config evaluated the same way.
+    """
+    labels = np.asarray(labels)
+    positives, negatives = int(labels.sum()), int(len(labels) - labels.sum())
+    layers = active_layers(scores)
+    weights = weight_grid(len(layers), step)
+    thresholds = np.arange(bins + 1) / bins
+
+    best = None
+    for curve in curves:
+        for limit in limits:
+            features = normalized_features(scores, layers, config, limit, curve)
+            tp, fp = threshold_counts(features, labels, weights, bins)
+            metrics = curve_metrics(tp, fp, positives, negatives, fn_cost, fp_cost)
+
+            loss = metrics["cost"] if objective == "cost" else -metrics["f1"]
+            if max_fpr is not None:
+                loss = np.where(metrics["fpr"] <= max_fpr, loss, np.inf)
+            row, k = np.unravel_index(np.argmin(loss), loss.shape)
+            if best is None or loss[row, k] < best["loss"]:
+                best = {
+                    "loss": float(loss[row, k]),
+                    "perplexity_curve": curve,
+                    "perplexity_limit": float(limit),
+                    "weights": {layer: round(float(w), 4) for layer, w in zip(layers, weights[row])},
+                    "threshold": float(thresholds[k]),
+                    "tpr": float(metrics["tpr"][row, k]),
+                    "fpr": float(metrics["fpr"][row, k]),
+                    "precision": float(metrics["precision"][row, k]),
+                    "f1": float(metrics["f1"][row, k]),
+                    "cost": float(metrics["cost"][row, k]),
+                    "roc_auc": float(metrics["roc_auc"][row]),
+                    "pr_auc": float(metrics["pr_auc"][row]),
+                    "curves": {
+                        "threshold": thresholds.tolist(),
+                        "tpr": metrics["tpr"][row].tolist(),
+                        "fpr": metrics["fpr"][row].tolist(),
+                        "precision": metrics["precision"][row].tolist()
+                    }
+                }
+
+    if not np.isfinite(best["loss"]):
+        raise ValueError(f"No setting keeps the false positive rate at or below {max_fpr}")
+    return {
+        "records": len(labels),
+        "positives": positives,
+        "negatives": negatives,
+        "layers": layers,
+        "configurations": len(curves) * len(limits) * len(weights) * (bins + 1),
+        "best": best,
+        "current": evaluate_current(scores, labels, config, fn_cost, fp_cost)
+    }
+
+
+def current_weights(config, layers) -> dict:
+    """Effective ensemble weights of `config`, as SecurePromptPipeline derives them."""
+    weights = {name: float(config["weights"][name]) for name in ("heuristic", "perplexity", "bert")}
+    for layer, section in (("divergence", "divergence"), ("similarity", "attack_index")):
+        if layer in layers:
+            share = config[section]["weight"]
+            weights = {name: weight * (1.0 - share) for name, weight in weights.items()}
+            weights[layer] = share
+    return weights
+
+
+def evaluate_current(scores, labels, config, fn_cost=1.0, fp_cost=1.0) -> dict:
+    """Metrics of the settings in `config` on the cached scores."""
+    layers = active_layers(scores)
+    thresholds = config["thresholds"]
+    weights = current_weights(config, layers)
+    features = normalized_features(scores, layers, config, thresholds["perplexity_limit"],
+                                   thresholds["perplexity_curve"])
+    risk = features @ np.array([weights[layer] for layer in layers])
+    blocked = risk + 1e-9 >= thresholds["blocking"]
+
+    labels = np.asarray(labels).astype(bool)
+    tp, fp = int((blocked & labels).sum()), int((blocked & ~labels).sum())
+    metrics = curve_metrics(np.array([tp]), np.array([fp]), int(labels.sum()), int((~labels).sum()),
+                            fn_cost, fp_cost)
+    return {
+        "perplexity_curve": thresholds["perplexity_curve"],
+        "perplexity_limit": float(thresholds["perplexity_limit"]),
+        "weights": {layer: round(weight, 4) for layer, weight in weights.items()},
+        "threshold": float(thresholds["blocking"]),
+        **{name: float(metrics[name][0]) for name in ("tpr", "fpr", "precision", "f1", "cost")}
+    }
+
+
+def config_updates(best) -> dict:
+    """
+    The config.yaml values that reproduce `best`. The pipeline scales the
+    base weights by (1 - share) for divergence and then for similarity, so
+    the shares are unwound in reverse.
+    """
+    weights = dict(best["weights"])
+    updates = {
+        "thresholds": {
+            "blocking": round(best["threshold"], 4),
+            "perplexity_limit": best["perplexity_limit"],
+            "perplexity_curve": best["perplexity_curve"]
+        }
+    }
+    scale = 1.0
+    if "similarity" in weights:
+        share = weights.pop("similarity")
+        updates["attack_index"] = {"weight": round(share, 4)}
+        scale *= 1.0 - share
+    if "divergence" in weights:
+        share = weights.pop("divergence") / scale if scale > 0 else 0.0
+        updates["divergence"] = {"weight": round(share, 4)}
+        scale *= 1.0 - share
+    updates["weights"] = {name: round(weight / scale, 4) if scale > 0 else 0.0 for name, weight in weights.items()}
+    return updates
+
+
+def calibrate(input_path, cache_path=None, fmt=None, field="prompt", label_field="label", batch_size=32,
+              config_path=None, rescore=False, step=0.05, bins=1000, objective="cost", fn_cost=1.0, fp_cost=1.0,
+              max_fpr=None, report_path=None, write=False) -> dict:
+    """Scores (or loads) the corpus, sweeps, prints the result and optionally writes it back."""
+    import time
+    from src.utils import load_config
+    from src.utils.config import update_config
+
+    config = load_config(config_path)
+    scores, labels = score_corpus(input_path, cache_path, fmt, field, label_field, batch_size, config_path, rescore)
+
+    started = time.perf_counter()
+    result = sweep(scores, labels, config, step=step, bins=bins, objective=objective, fn_cost=fn_cost,
+                   fp_cost=fp_cost, max_fpr=max_fpr)
+    result["sweep_seconds"] = round(time.perf_counter() - started, 3)
+
+    best, current = result["best"], result["current"]
+    print(f"[INFO] {result['configurations']:,} configurations over {result['records']} records "
+          f"({result['positives']} attacks) in {result['sweep_seconds']:.2f}s")
+    for name, settings in (("current", current), ("best", best)):
+        print(f"  {name:8s} weights={settings['weights']} threshold={settings['threshold']:.3f} "
+              f"ppl={settings['perplexity_curve']}/{settings['perplexity_limit']:g} | "
+              f"TPR {settings['tpr']:.3f} FPR {settings['fpr']:.3f} precision {settings['precision']:.3f} "
+              f"F1 {settings['f1']:.3f} cost {settings['cost']:.4f}")
+    print(f"  best ROC AUC {best['roc_auc']:.4f}, PR AUC {best['pr_auc']:.4f}")
+
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"[INFO] Report written to {report_path}")
+    if write:
+        path = config_path or os.environ.get("SECUREPROMPT_CONFIG", "config.yaml")
+        update_config(path, config_updates(best))
+        print(f"[INFO] Calibrated settings written to {path}")
+    return result
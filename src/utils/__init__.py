@@ -0,0 +1 @@
+from .config import load_config
@@ -0,0 +1,320 @@
+"""
+Append-only audit log of scan verdicts, for incident response.
+
+    python main.py audit --user alice --status BLOCK --since 7d --where "bert_prob > 0.9"
+
+Every verdict becomes one row: time, user, a SHA-256 of the prompt (never the
+prompt itself), status and reason, every stage score and the stage timings.
+record() only puts the rows on a bounded queue; a background thread batches
+them into Parquet row groups, so a scan never waits on disk (a full queue
+drops rows and counts them instead of blocking).
+
+Files rotate by row count and age. When a segment is closed its time range
+and user set are appended to manifest.jsonl; queries use that index to skip
+whole segments, and the Parquet row-group statistics to skip the rest.
+Needs pyarrow (and pandas for queries).
+"""
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+# Column order of every segment
+COLUMNS = (
+    "ts", "user_id", "prompt_sha256", "prompt_chars", "status", "reason", "total_risk",
+    "heuristic_score", "perplexity_norm", "bert_prob", "similarity_norm", "divergence_norm",
+    "drift_z", "heuristic_only", "scan_ms", "timings_ms"
+)
+MANIFEST = "manifest.jsonl"
+
+# Segments with more distinct users than this are indexed as "any user"
+MAX_INDEXED_USERS = 1000
+
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("ts", pa.float64()),
+        ("user_id", pa.string()),
+        ("prompt_sha256", pa.string()),
+        ("prompt_chars", pa.int64()),
+        ("status", pa.string()),
+        ("reason", pa.string()),
+        ("total_risk", pa.float64()),
+        ("heuristic_score", pa.float64()),
+        ("perplexity_norm", pa.float64()),
+        ("bert_prob", pa.float64()),
+        ("similarity_norm", pa.float64()),
+        ("divergence_norm", pa.float64()),
+        ("drift_z", pa.float64()),
+        ("heuristic_only", pa.bool_()),
+        ("scan_ms", pa.float64()),
+        ("timings_ms", pa.string())
+    ])
+
+
+def audit_row(prompt, decision, user_id=None, timings_ms=None, ts=None) -> dict:
+    """One audit row from a pipeline decision."""
+    breakdown = decision.get("breakdown", {})
+    timings_ms = timings_ms if timings_ms is not None else decision.get("timings_ms")
+    return {
+        "ts": ts if ts is not None else time.time(),
+        "user_id": user_id,
+        "prompt_sha256": hashlib.sha256(prompt.encode("utf-8", "surrogatepass")).hexdigest(),
+        "prompt_chars": len(prompt),
+        "status": decision["status"],
+        "reason": decision.get("reason"),
+        "total_risk": decision.get("total_risk"),
+        "heuristic_score": breakdown.get("heuristic_score"),
+        "perplexity_norm": breakdown.get("perplexity_norm"),
+        "bert_prob": breakdown.get("bert_prob"),
+        "similarity_norm": breakdown.get("similarity_norm"),
+        "divergence_norm": breakdown.get("divergence_norm"),
+        "drift_z": breakdown.get("drift_z"),
+        "heuristic_only": bool(breakdown.get("heuristic_only", False)),
+        "scan_ms": (timings_ms or {}).get("scan"),
+        "timings_ms": json.dumps(timings_ms) if timings_ms else None
+    }
+
+
+class AuditLog:
+    """
+    Background Parquet writer. record()/record_batch() never block; rows
+    are written every `flush_rows` rows or `flush_seconds`, whichever comes
+    first, and a segment is closed after `rotate_rows` rows or
+    `rotate_seconds`. The writer thread starts on first use in each process,
+    so forked API workers each write their own segments.
+    """
+
+    def __init__(self, path, flush_rows=512, flush_seconds=1.0, rotate_rows=500000, rotate_seconds=3600,
+                 max_queue=100000):
+        self.path = path
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_seconds = flush_seconds
+        self.rotate_rows = max(1, int(rotate_rows))
+        self.rotate_seconds = rotate_seconds
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        # --- Metrics ---
+        self.written = 0
+        self.dropped = 0
+        self.segments = 0
+
+    def record(self, prompt, decision, user_id=None, timings_ms=None):
+        self.record_batch([prompt], [decision], [user_id], timings_ms)
+
+    def record_batch(self, prompts, decisions, user_ids=None, timings_ms=None):
+        """
+        Queues one row per verdict (computed here; written later).
+        `timings_ms` are the stage timings of the call that produced them.
+        """
+        self._ensure_started()
+        user_ids = user_ids or [None] * len(prompts)
+        now = time.time()
+        for prompt, decision, user_id in zip(prompts, decisions, user_ids):
+            try:
+                self._queue.put_nowait(audit_row(prompt, decision, user_id, timings_ms, ts=now))
+            except queue.Full:
+                self.dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked child: the parent's queued rows and thread are not ours
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._stop = threading.Event()
+            os.makedirs(self.path, exist_ok=True)
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="secureprompt-audit", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self):
+        """Writes everything still queued and closes the open segment."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        segment = None
+        rows = []
+        last_flush = time.monotonic()
+
+        while True:
+            stopping = self._stop.is_set()
+            try:
+                rows.append(self._queue.get(timeout=0.1))
+                # Take whatever else is waiting without sleeping again
+                while len(rows) < self.flush_rows:
+                    rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            due = len(rows) >= self.flush_rows or time.monotonic() - last_flush >= self.flush_seconds
+            if rows and (due or stopping):
+                try:
+                    segment = segment or _Segment(self.path, self.segments)
+                    segment.write(rows)
+                    self.written += len(rows)
+                except Exception as e:
+                    print(f"Warning: Audit write failed, {len(rows)} rows lost: {e}")
+                    self.dropped += len(rows)
+                rows = []
+                last_flush = time.monotonic()
+
+            drained = stopping and self._queue.empty()
+            if segment is not None and (drained or segment.rows >= self.rotate_rows
+                                        or time.time() - segment.opened_at >= self.rotate_seconds):
+                segment.close()
+                self.segments += 1
+                segment = None
+
+            if drained:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "segments": self.segments
+        }
+
+
+class _Segment:
+    """One open Parquet file; every write() is a row group."""
+
+    def __init__(self, path, sequence):
+        import pyarrow.parquet as pq
+
+        self.opened_at = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(self.opened_at))
+        self.name = f"audit-{stamp}-{os.getpid()}-{sequence}.parquet"
+        self.schema = _schema()
+        # Written under a temporary name: readers only ever see closed segments
+        self._tmp = os.path.join(path, self.name + ".tmp")
+        self._final = os.path.join(path, self.name)
+        self._writer = pq.ParquetWriter(self._tmp, self.schema, compression="zstd")
+        self._manifest = os.path.join(path, MANIFEST)
+
+        self.rows = 0
+        self.min_ts = None
+        self.max_ts = None
+        self.users = set()
+
+    def write(self, rows):
+        import pyarrow as pa
+
+        table = pa.Table.from_pydict({column: [row[column] for row in rows] for column in COLUMNS},
+                                     schema=self.schema)
+        self._writer.write_table(table)
+
+        timestamps = [row["ts"] for row in rows]
+        self.min_ts = min([self.min_ts] + timestamps) if self.min_ts is not None else min(timestamps)
+        self.max_ts = max([self.max_ts] + timestamps) if self.max_ts is not None else max(timestamps)
+        if self.users is not None:
+            self.users.update(row["user_id"] for row in rows)
+            if len(self.users) > MAX_INDEXED_USERS:
+                self.users = None
+        self.rows += len(rows)
+
+    def close(self):
+        self._writer.close()
+        os.replace(self._tmp, self._final)
+        entry = {
+            "file": self.name,
+            "rows": self.rows,
+            "min_ts": self.min_ts,
+            "max_ts": self.max_ts,
+            "users": sorted(user for user in self.users if user is not None) if self.users is not None else None
+        }
+        with open(self._manifest, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def _segments(path, since=None, until=None, user=None) -> list:
+    """Closed segment files that can hold matching rows (from the manifest index)."""
+    manifest = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest):
+        return []
+
+    files = []
+    with open(manifest, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if since is not None and entry["max_ts"] < since:
+                continue
+            if until is not None and entry["min_ts"] > until:
+                continue
+            if user is not None and entry["users"] is not None and user not in entry["users"]:
+                continue
+            files.append(os.path.join(path, entry["file"]))
+    return files
+
+
+def query(path, since=None, until=None, user=None, status=None, where=None, limit=None):
+    """
+    Audit rows as a pandas DataFrame, newest first.
+    `since`/`until` are Unix timestamps, `where` a DataFrame.query()
+    expression over the columns (e.g. "bert_prob > 0.9").
+    """
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    filters = []
+    if since is not None:
+        filters.append(("ts", ">=", since))
+    if until is not None:
+        filters.append(("ts", "<=", until))
+    if user is not None:
+        filters.append(("user_id", "==", user))
+    if status is not None:
+        filters.append(("status", "==", status))
+
+    frames = [
+        pq.read_table(file, filters=filters or None).to_pandas()
+        for file in _segments(path, since, until, user)
+    ]
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame(columns=list(COLUMNS))
+
+    result = pd.concat(frames, ignore_index=True)
+    if where:
+        result = result.query(where)
+    result = result.sort_values("ts", ascending=False)
+    return result.head(limit) if limit else result
+
+
+def parse_time(value, now=None):
+    """'7d', '12h', '30m', '45s' (that long ago), a Unix timestamp, or an ISO date/time."""
+    if value is None:
+        return None
+    now = time.time() if now is None else now
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+    if value[-1:] in units and value[:-1].replace(".", "", 1).isdigit():
+        return now - float(value[:-1]) * units[value[-1]]
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    from datetime import datetime
+
+    parsed = datetime.fromisoformat(value)
+    return parsed.timestamp()
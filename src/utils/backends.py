@@ -0,0 +1,194 @@
+"""
+Inference backends for the transformer models.
+
+    eager  fp32 PyTorch (the default)
+    int8   PyTorch with every projection dynamically quantized to int8 (CPU);
+           GPT-2's Conv1D layers are converted to nn.Linear first
+    onnx   ONNX Runtime session exported from the same checkpoint
+
+load_model() returns something that is called like the Hugging Face model
+(`model(input_ids, attention_mask=...)` -> object with `.logits`), so the
+detectors do not care which backend is behind it.
+"""
+import os
+import types
+
+import torch
+
+BACKENDS = ("eager", "int8", "onnx")
+
+# Intra-op threads for ONNX Runtime sessions (None = one per core), see set_threads()
+_intra_op_threads = None
+
+
+def set_threads(intra_op):
+    """
+    Caps the threads one forward pass may use (torch and ONNX Runtime
+    sessions created afterwards). Several workers or executor threads each
+    using every core just fight over them. None keeps the library defaults.
+    """
+    global _intra_op_threads
+    if intra_op is None:
+        return
+    _intra_op_threads = max(1, int(intra_op))
+    torch.set_num_threads(_intra_op_threads)
+
+
+def load_model(model_cls, model_path, backend="eager", device="cpu", onnx_dir="models/onnx"):
+    """Loads `model_cls` from `model_path` on the requested backend."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+
+    model = model_cls.from_pretrained(model_path)
+    model.eval()
+
+    if backend == "onnx":
+        path = export_onnx(model, model_path, onnx_dir)
+        return OnnxModel(path, model.config)
+
+    if backend == "int8":
+        if device != "cpu":
+            print(f"Warning: int8 dynamic quantization only runs on CPU. Using fp32 on {device}.")
+        else:
+            model = torch.quantization.quantize_dynamic(_conv1d_to_linear(model), {torch.nn.Linear},
+                                                        dtype=torch.qint8)
+            print(f"[INFO] {model_path}: {len(quantized_modules(model))} layers quantized to int8")
+
+    return model.to(device)
+
+
+def _conv1d_to_linear(model):
+    """
+    GPT-2 style models implement their attention and MLP projections with
+    transformers' Conv1D (a Linear with a transposed weight), which
+    quantize_dynamic does not know. They are replaced in place by
+    equivalent nn.Linear layers so that they get quantized too.
+    """
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if not isinstance(child, Conv1D):
+                continue
+            in_features, out_features = child.weight.shape
+            linear = torch.nn.Linear(in_features, out_features)
+            with torch.no_grad():
+                linear.weight.copy_(child.weight.t())
+                linear.bias.copy_(child.bias)
+            setattr(parent, name, linear)
+    return model
+
+
+def quantized_modules(model) -> list:
+    """Names of the submodules that run in int8 (none for eager and ONNX models)."""
+    if not isinstance(model, torch.nn.Module):
+        return []
+    return [
+        name for name, module in model.named_modules()
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear)
+    ]
+
+
+def supports_kv_cache(model) -> bool:
+    """Whether the model accepts past_key_values (ONNX exports do not)."""
+    return not isinstance(model, OnnxModel)
+
+
+class _ExportWrapper(torch.nn.Module):
+    """
+    Export wrapper: plain tensors in, tensors out (no KV cache, no dict outputs).
+    Language models return logits; classifiers also return the [CLS] vector
+    of the last hidden layer.
+    """
+
+    def __init__(self, model, input_names, causal):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+        self.causal = causal
+
+    def forward(self, *inputs):
+        kwargs = dict(zip(self.input_names, inputs))
+        if self.causal:
+            return self.model(**kwargs, use_cache=False).logits
+        outputs = self.model(**kwargs, output_hidden_states=True)
+        return outputs.logits, outputs.hidden_states[-1][:, 0, :]
+
+
+def _input_names(model):
+    names = ["input_ids", "attention_mask"]
+    if getattr(model.config, "type_vocab_size", 0):
+        names.append("token_type_ids")
+    return names
+
+
+def export_onnx(model, model_path, onnx_dir) -> str:
+    """
+    Exports the model to `<onnx_dir>/<checkpoint name>/model.onnx` once and
+    reuses the file afterwards (delete it to re-export after retraining).
+    """
+    target_dir = os.path.join(onnx_dir, os.path.basename(os.path.normpath(model_path)))
+    path = os.path.join(target_dir, "model.onnx")
+    if os.path.exists(path):
+        return path
+
+    print(f"Exporting {model_path} to ONNX ({path})...")
+    os.makedirs(target_dir, exist_ok=True)
+
+    # Language models return logits per position, classifiers one row per text
+    causal = model.can_generate()
+    names = _input_names(model)
+    dummy = tuple(torch.ones((1, 8), dtype=torch.long) for _ in names)
+    axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    if causal:
+        outputs = ["logits"]
+        axes["logits"] = {0: "batch", 1: "sequence"}
+    else:
+        outputs = ["logits", "cls_embedding"]
+        axes["logits"] = axes["cls_embedding"] = {0: "batch"}
+
+    torch.onnx.export(
+        _ExportWrapper(model, names, causal),
+        dummy,
+        path,
+        input_names=names,
+        output_names=outputs,
+        dynamic_axes=axes,
+        opset_version=14
+    )
+    return path
+
+
+class OnnxModel:
+    """
+    ONNX Runtime session with the call signature of the Hugging Face model.
+    Inputs the export does not know about (past_key_values, use_cache, ...)
+    must not be passed; check supports_kv_cache() first.
+    """
+
+    def __init__(self, path, config):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if _intra_op_threads is not None:
+            options.intra_op_num_threads = _intra_op_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.output_names = [o.name for o in self.session.get_outputs()]
+        self.config = config
+        self.path = path
+
+    def __call__(self, input_ids=None, attention_mask=None, token_type_ids=None, output_hidden_states=False):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        if token_type_ids is None:
+            token_type_ids = torch.zeros_like(input_ids)
+        given = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+
+        feeds = {name: given[name].cpu().numpy() for name in self.input_names}
+        # Every exported output is returned (classifiers also carry cls_embedding)
+        results = self.session.run(self.output_names, feeds)
+        return types.SimpleNamespace(**{
+            name: torch.from_numpy(value) for name, value in zip(self.output_names, results)
+        })
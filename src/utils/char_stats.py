@@ -0,0 +1,210 @@
+"""
+Fused character statistics: entropy, printable ratio, hex/Base64 alphabet
+membership, character-class counts, word count and windowed (local) entropy
+of a text from one symbol histogram.
+
+For very short texts a collections.Counter histogram (plus one Counter per
+window) beats NumPy's per-call overhead. Longer texts use a NumPy
+view of the text: np.bincount gives the global histogram, and windowed
+entropy is derived from runs of equal (symbol, block) pairs after a stable
+(radix) sort, so time and memory stay linear in the text length and never
+grow with blocks x alphabet.
+"""
+import math
+import string
+from collections import Counter
+
+import numpy as np
+
+HEX_CHARS = frozenset("0123456789abcdefABCDEF")
+BASE64_CHARS = frozenset(string.ascii_letters + string.digits + "+/=-_")
+CLASSES = ("lower", "upper", "digit", "space", "punct", "other")
+
+# Texts up to this many characters take the pure-Python path (the crossover
+# measured by benchmarks/char_stats.py)
+SHORT_TEXT = 256
+
+# Long texts get their windowed entropy this many characters at a time
+WINDOW_CHUNK = 1 << 16
+
+# Local entropy is computed over at most this many distinct symbols
+MAX_WINDOW_SYMBOLS = 256
+
+# c * log2(c) for every count a short text can hold
+_CLOGC = [count * math.log2(count) if count else 0.0 for count in range(SHORT_TEXT + 1)]
+
+
+def _char_class(char) -> int:
+    if char.islower() and char.isascii():
+        return 0
+    if char.isupper() and char.isascii():
+        return 1
+    if char.isdigit() and char.isascii():
+        return 2
+    if char.isspace():
+        return 3
+    if char in string.punctuation:
+        return 4
+    return 5
+
+
+def _stats(length, symbols, word_count, window_max, window_offset) -> dict:
+    """The result dict from (char, count) pairs of the whole text."""
+    printable = hex_count = b64_count = 0
+    classes = [0] * len(CLASSES)
+    sum_clogc = 0.0
+    for char, count in symbols:
+        sum_clogc += count * math.log2(count)
+        if char.isprintable():
+            printable += count
+        if char in HEX_CHARS:
+            hex_count += count
+        if char in BASE64_CHARS:
+            b64_count += count
+        classes[_char_class(char)] += count
+
+    safe_length = max(length, 1)
+    return {
+        "entropy": max(0.0, math.log2(length) - sum_clogc / length) if length else 0.0,
+        "length": length,
+        "word_count": word_count,
+        "printable_ratio": printable / safe_length,
+        "hex_ratio": hex_count / safe_length,
+        "base64_ratio": b64_count / safe_length,
+        "is_hex": bool(length and length % 2 == 0 and hex_count == length),
+        "is_base64_alphabet": bool(length and b64_count == length),
+        "classes": dict(zip(CLASSES, classes)),
+        "max_window_entropy": window_max,
+        "max_window_offset": window_offset
+    }
+
+
+def _short_windowed_entropy(text, step):
+    """_windowed_entropy() with one Counter per window, for short texts."""
+    span = 2 * step
+    clogc = _CLOGC.__getitem__ if span <= SHORT_TEXT else (lambda count: count * math.log2(count))
+    offsets = range(0, (-(-len(text) // step) - 1) * step, step) if len(text) > span else (0,)
+    best, best_offset = -1.0, 0
+    for offset in offsets:
+        chunk = text[offset:offset + span]
+        size = len(chunk)
+        entropy = math.log2(size) - sum(map(clogc, Counter(chunk).values())) / size if size else 0.0
+        if entropy > best:
+            best, best_offset = entropy, offset
+    return max(best, 0.0), best_offset
+
+
+def _short_stats(text, window) -> dict:
+    """Pure-Python path: one Counter for the text, one per window."""
+    window_max, window_offset = (None, None) if window is None else \
+        _short_windowed_entropy(text, max(1, window // 2))
+    return _stats(len(text), Counter(text).items(), len(text.split()), window_max, window_offset)
+
+
+def _codes(text):
+    """Code points of the text as an integer array (a byte view for ASCII)."""
+    if text.isascii():
+        return np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+    return np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+
+
+def _clogc(counts):
+    counts = counts.astype(np.float64)
+    return counts * np.log2(counts)
+
+
+def _window_entropies(ids, step):
+    """
+    Entropy of every span of two adjacent `step`-char blocks of `ids` (a
+    text longer than one block), step `step`.
+
+    With ids stably sorted, every run of equal (symbol, block) is one
+    nonzero histogram entry. A window's sum of c*log2(c) is that of its two
+    blocks, corrected for the symbols present in both (consecutive runs).
+    """
+    length = len(ids)
+    blocks = -(-length // step)
+
+    order = np.argsort(ids, kind="stable")
+    symbol = ids[order]
+    block = order // step
+    starts = np.flatnonzero(np.concatenate(([True], (symbol[1:] != symbol[:-1]) | (block[1:] != block[:-1]))))
+    counts = np.diff(np.append(starts, length))
+    run_symbol = symbol[starts]
+    run_block = block[starts]
+
+    block_sums = np.bincount(run_block, weights=_clogc(counts), minlength=blocks)
+    shared = (run_symbol[1:] == run_symbol[:-1]) & (run_block[1:] == run_block[:-1] + 1)
+    left, right = counts[:-1][shared], counts[1:][shared]
+    correction = np.bincount(run_block[:-1][shared], weights=_clogc(left + right) - _clogc(left) - _clogc(right),
+                             minlength=blocks)
+
+    sums = block_sums[:-1] + block_sums[1:] + correction[:-1]
+    sizes = np.full(blocks - 1, 2.0 * step)
+    sizes[-1] = length - (blocks - 2) * step
+    return np.log2(sizes) - sums / sizes
+
+
+def _windowed_entropy(ids, step):
+    """
+    Max entropy over `2 * step`-char spans (step `step`) and where that span
+    starts, for a text longer than two blocks. The text is processed
+    WINDOW_CHUNK characters at a time, so memory does not grow with it.
+    """
+    chunk = max(1, WINDOW_CHUNK // step) * step
+    best, best_offset = -1.0, 0
+    for start in range(0, len(ids) - step, chunk):
+        entropies = _window_entropies(ids[start:start + chunk + step], step)
+        i = int(np.argmax(entropies))
+        if entropies[i] > best:
+            best, best_offset = float(entropies[i]), start + i * step
+    return max(best, 0.0), best_offset
+
+
+def _long_stats(text, window) -> dict:
+    """NumPy path: bincount histogram, run-based windowed entropy."""
+    length = len(text)
+    codes = _codes(text)
+    hist = np.bincount(codes)
+    alphabet = np.flatnonzero(hist)
+    counts = hist[alphabet]
+
+    window_max = window_offset = None
+    if window is not None:
+        step = max(1, window // 2)
+        if length <= 2 * step:
+            window_max, window_offset = _short_windowed_entropy(text, step)
+        else:
+            if len(alphabet) <= MAX_WINDOW_SYMBOLS:
+                lookup = np.zeros(len(hist), dtype=np.uint8)
+                lookup[alphabet] = np.arange(len(alphabet), dtype=np.uint8)
+                ids = codes if codes.dtype == np.uint8 else lookup[codes]
+            else:
+                # Many distinct symbols (CJK, emoji) are folded into buckets,
+                # which can only lower the local entropy slightly
+                ids = (codes % MAX_WINDOW_SYMBOLS).astype(np.uint8)
+            window_max, window_offset = _windowed_entropy(ids, step)
+
+    symbols = zip(map(chr, alphabet.tolist()), counts.tolist())
+    return _stats(length, symbols, len(text.split()), window_max, window_offset)
+
+
+def char_stats_batch(texts, window=64) -> list:
+    """
+    Statistics for every text. Each result holds:
+        entropy, length, word_count, printable_ratio, hex_ratio, base64_ratio,
+        is_hex (hex alphabet, even length), is_base64_alphabet,
+        classes ({class: count}),
+        max_window_entropy / max_window_offset (None when window is None):
+        the highest entropy of any `window`-char span (step window/2) and
+        where it starts, to find random-looking blobs inside normal text.
+    """
+    return [
+        _short_stats(text, window) if len(text) <= SHORT_TEXT else _long_stats(text, window)
+        for text in texts
+    ]
+
+
+def char_stats(text: str, window=64) -> dict:
+    """char_stats_batch() for a single text."""
+    return char_stats_batch([text], window=window)[0]
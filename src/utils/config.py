@@ -0,0 +1,232 @@
+import copy
+import json
+import os
+import re
+import yaml
+
+# Values used when config.yaml is missing or leaves a key out.
+DEFAULT_CONFIG = {
+    "system": {
+        "name": "SecurePrompt",
+        "version": "0.2"
+    },
+    "thresholds": {
+        "blocking": 0.5,
+        "perplexity_limit": 100.0,
+        "perplexity_curve": "linear",
+        "bert_confidence_limit": 0.80,
+        "entropy_limit": 4.5
+    },
+    "weights": {
+        "heuristic": 0.2,
+        "perplexity": 0.3,
+        "bert": 0.5
+    },
+    "filters": {
+        "blocked_keywords": [],
+        "suspicious_patterns": [],
+        "banned_output_phrases": [],
+        "pii_patterns": []
+    },
+    "rules": {
+        "path": None,
+        "watch": False,
+        "poll_seconds": 2.0
+    },
+    "payloads": {
+        "max_depth": 3,
+        "max_output_chars": 65536,
+        "max_fragments": 32,
+        "max_segment_chars": 1000000
+    },
+    "inference": {
+        "backend": "eager",
+        "onnx_dir": "models/onnx"
+    },
+    "attack_index": {
+        "enabled": False,
+        "path": "models/attack_index",
+        "dtype": "float16",
+        "top_k": 3,
+        "weight": 0.2,
+        "min_similarity": 0.80
+    },
+    "divergence": {
+        "enabled": False,
+        "mutants": 8,
+        "mutation_rate": 0.1,
+        "seed": 0,
+        "weight": 0.15,
+        "kl_scale": 0.5,
+        "budget_ms": 50
+    },
+    "drift": {
+        "enabled": True,
+        "window": 10,
+        "threshold_std": 2.0,
+        "min_std": 0.05,
+        "min_history": 10,
+        "action": "flag",
+        "min_risk": 0.3,
+        "max_sessions": 100000,
+        "idle_ttl_seconds": 1800,
+        "shared_path": None,
+        "ignore_users": ["anonymous"]
+    },
+    "pipeline": {
+        "cascade": False
+    },
+    "perplexity": {
+        "window": 1024,
+        "stride": 256,
+        "long_text_score": "max_window"
+    },
+    "cache": {
+        "verdicts": {
+            "enabled": True,
+            "max_entries": 10000,
+            "ttl_seconds": 3600,
+            "shared_path": None,
+            "shared_max_entries": 100000
+        },
+        "scores": {
+            "enabled": True,
+            "max_entries": 20000,
+            "ttl_seconds": None
+        }
+    },
+    "conversations": {
+        "max_conversations": 10000,
+        "ttl_seconds": 3600,
+        "max_kv_contexts": 32,
+        "context_tokens": 256,
+        "max_turns": 50,
+        "context_chars": 512
+    },
+    "audit": {
+        "enabled": False,
+        "path": "logs/audit",
+        "flush_rows": 512,
+        "flush_seconds": 1.0,
+        "rotate_rows": 500000,
+        "rotate_seconds": 300,
+        "max_queue": 100000
+    },
+    "metrics": {
+        "enabled": True,
+        "request_timings": False
+    },
+    "canaries": {
+        "key": None,
+        "length": 16,
+        "max_scopes": 100000
+    },
+    "redaction": {
+        "categories": ["canary", "pii"]
+    },
+    "output_stream": {
+        "overlap_chars": 256
+    },
+    "serving": {
+        "lazy_models": False,
+        "torch_threads": None,
+        "workers": None,
+        "executor": {
+            "max_workers": 1,
+            "max_pending": 64,
+            "timeout_seconds": 10.0,
+            "retry_after_seconds": 1,
+            "degraded": False
+        },
+        "batching": {
+            "enabled": True,
+            "max_wait_ms": 5.0,
+            "max_batch_size": 32
+        }
+    }
+}
+
+
+def _merge(base: dict, override: dict) -> dict:
+    """Recursively overlays `override` on top of `base` (returns a new dict)."""
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_config(path=None) -> dict:
+    """
+    Loads config.yaml (or the file in $SECUREPROMPT_CONFIG) merged over the defaults.
+    A missing file is not an error: the defaults are returned.
+    """
+    path = path or os.environ.get("SECUREPROMPT_CONFIG", "config.yaml")
+
+    user_config = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            user_config = yaml.safe_load(f) or {}
+
+    return _merge(DEFAULT_CONFIG, user_config)
+
+
+def _yaml_scalar(value) -> str:
+    if isinstance(value, str):
+        return json.dumps(value)
+    return yaml.safe_dump(value, default_flow_style=True).strip().removesuffix("...").strip()
+
+
+def update_config(path, updates: dict):
+    """
+    Writes `updates` ({section: {key: value}}) into the YAML file at `path`,
+    changing only those lines so comments and layout survive. Keys that are
+    missing are added under their section (or a new section at the end).
+    """
+    lines = []
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+
+    pending = {section: dict(values) for section, values in updates.items()}
+    section_end = {}  # section -> index after its last line
+    section = None
+    for i, line in enumerate(lines):
+        header = re.match(r"^([A-Za-z_][\w-]*):(\s*(#.*)?)$", line)
+        if header:
+            section = header.group(1)
+            section_end[section] = i + 1
+            continue
+        if line[:1] not in (" ", "") and not line.startswith("#"):
+            section = None
+            continue
+        if section is None:
+            continue
+        if line.strip():
+            section_end[section] = i + 1
+        entry = re.match(r"^(  )([A-Za-z_][\w-]*):(\s*)([^#]*?)(\s*#.*)?$", line)
+        if entry and entry.group(2) in pending.get(section, {}):
+            value = pending[section].pop(entry.group(2))
+            new_line = f"{entry.group(1)}{entry.group(2)}: {_yaml_scalar(value)}"
+            comment = (entry.group(5) or "").lstrip()
+            if comment:
+                # Keep the comment in its column
+                column = len(line) - len(comment)
+                new_line += " " * max(1, column - len(new_line)) + comment
+            lines[i] = new_line
+
+    # Keys (or whole sections) the file did not have yet, last section first so indices stay valid
+    for section in sorted(pending, key=lambda name: -section_end.get(name, len(lines) + 1)):
+        values = pending[section]
+        if not values:
+            continue
+        new_lines = [f"  {key}: {_yaml_scalar(value)}" for key, value in values.items()]
+        if section in section_end:
+            lines[section_end[section]:section_end[section]] = new_lines
+        else:
+            lines += ["", f"{section}:"] + new_lines
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
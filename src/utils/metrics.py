@@ -0,0 +1,206 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_text(labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+class _Histogram:
+    """Cumulative-bucket latency histogram (Prometheus semantics)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class _Timer:
+    """Context manager that reports its elapsed time to a Metrics registry."""
+
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """
+    Thread-safe registry of per-stage latency histograms, labelled counters
+    and gauges, rendered in the Prometheus text format by render().
+
+    Stage timings can also be collected per call: inside `with collect() as
+    timings`, every stage observed on the same thread is added to `timings`
+    (stage -> seconds) as well as to the histograms.
+    """
+
+    enabled = True
+
+    def __init__(self, prefix="secureprompt", buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}    # stage -> _Histogram
+        self._counters = {}  # name -> {labels tuple: value}
+        self._gauges = {}    # name -> {labels tuple: value}
+        self._local = threading.local()
+
+    def timer(self, stage):
+        """`with metrics.timer("bert.forward"):` times the block as one observation."""
+        return _Timer(self, stage)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = _Histogram(self.buckets)
+            histogram.observe(seconds)
+
+        timings = getattr(self._local, "timings", None)
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    @contextmanager
+    def collect(self):
+        """Collects this thread's stage timings (seconds) into a dict."""
+        outer = getattr(self._local, "timings", None)
+        timings = {}
+        self._local.timings = timings
+        try:
+            yield timings
+        finally:
+            self._local.timings = outer
+            if outer is not None:
+                for stage, seconds in timings.items():
+                    outer[stage] = outer.get(stage, 0.0) + seconds
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view of every stage, counter and gauge."""
+        with self._lock:
+            return {
+                "stages": {
+                    stage: {
+                        "count": h.count,
+                        "sum_seconds": round(h.sum, 6),
+                        "mean_ms": round(h.sum / h.count * 1000.0, 4) if h.count else 0.0
+                    }
+                    for stage, h in self._stages.items()
+                },
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._gauges.items()
+                }
+            }
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            name = f"{self.prefix}_stage_seconds"
+            lines.append(f"# HELP {name} Time spent in each pipeline stage.")
+            lines.append(f"# TYPE {name} histogram")
+            for stage in sorted(self._stages):
+                h = self._stages[stage]
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {h.sum:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+
+            for kind, families in (("counter", self._counters), ("gauge", self._gauges)):
+                for family in sorted(families):
+                    name = f"{self.prefix}_{family}"
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in sorted(families[family].items()):
+                        lines.append(f"{name}{_label_text(key)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class NullMetrics:
+    """
+    Drop-in Metrics that records nothing (instrumentation disabled).
+    Every call is a constant-time no-op.
+    """
+
+    enabled = False
+
+    def timer(self, stage):
+        return _NULL_TIMER
+
+    def observe(self, stage, seconds):
+        pass
+
+    def inc(self, name, amount=1, **labels):
+        pass
+
+    def set_gauge(self, name, value, **labels):
+        pass
+
+    @contextmanager
+    def collect(self):
+        yield {}
+
+    def snapshot(self) -> dict:
+        return {"stages": {}, "counters": {}, "gauges": {}}
+
+    def render(self) -> str:
+        return ""
+
+
+NULL_METRICS = NullMetrics()
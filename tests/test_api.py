@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("torch")
+
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture(scope="module")
+def client():
+    # The default config.yaml: models loaded at startup, verdict cache and metrics on
+    from api.app import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_metrics_default_config(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'cache_size{cache="verdicts"}' in response.text
+
+
+def test_metrics_with_audit_log(client, tmp_path, monkeypatch):
+    from api.app import pipeline
+    from src.utils.audit import AuditLog
+
+    monkeypatch.setattr(pipeline, "audit", AuditLog(str(tmp_path)))
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "secureprompt_audit_dropped" in response.text
@@ -0,0 +1,99 @@
+import shutil
+
+import numpy as np
+import pytest
+
+from src.utils import load_config
+from src.utils.config import update_config
+
+
+@pytest.fixture
+def config_path(tmp_path):
+    path = tmp_path / "config.yaml"
+    shutil.copy("config.yaml", path)
+    return str(path)
+
+
+@pytest.fixture
+def calibrate():
+    pytest.importorskip("tqdm")
+    from src.tools import calibrate
+    return calibrate
+
+
+def test_update_config_keeps_comments_and_layout(config_path):
+    with open(config_path, encoding="utf-8") as f:
+        before = f.read().splitlines()
+    update_config(config_path, {"thresholds": {"blocking": 0.35, "perplexity_curve": "log"},
+                                "weights": {"bert": 0.6}})
+    with open(config_path, encoding="utf-8") as f:
+        after = f.read().splitlines()
+
+    changed = [(old, new) for old, new in zip(before, after) if old != new]
+    assert len(after) == len(before) and len(changed) == 3
+    for old, new in changed:
+        assert old.index("#") == new.index("#") and old[old.index("#"):] == new[new.index("#"):]
+
+    config = load_config(config_path)
+    assert config["thresholds"]["blocking"] == 0.35
+    assert config["thresholds"]["perplexity_curve"] == "log"
+    assert config["weights"] == {"heuristic": 0.2, "perplexity": 0.3, "bert": 0.6}
+
+
+def test_update_config_adds_missing_keys_and_sections(config_path):
+    update_config(config_path, {"weights": {"extra": 1.5}, "new_section": {"name": "x", "flag": True}})
+    config = load_config(config_path)
+    assert config["weights"]["extra"] == 1.5 and config["weights"]["bert"] == 0.5
+    assert config["new_section"] == {"name": "x", "flag": True}
+
+
+def synthetic_scores(calibrate, n=400, seed=0):
+    """Raw layer scores where attacks score higher on every layer, with overlap."""
+    rng = np.random.default_rng(seed)
+    labels = (rng.random(n) < 0.3).astype(np.int8)
+    shift = labels[:, None] * 0.3
+    scores = np.column_stack([
+        rng.random(n) * 0.7 + shift[:, 0],                   # heuristic
+        rng.random(n) * 150 + shift[:, 0] * 400,             # perplexity
+        rng.random(n) * 0.7 + shift[:, 0],                   # bert
+        0.7 + rng.random(n) * 0.2 + shift[:, 0] * 0.3,       # similarity
+        rng.random(n) * 0.3 + shift[:, 0]                    # divergence
+    ]).astype(np.float32)
+    assert scores.shape[1] == len(calibrate.LAYERS)
+    return scores, labels
+
+
+def test_threshold_counts_match_brute_force(calibrate):
+    scores, labels = synthetic_scores(calibrate, n=200)
+    config = load_config("config.yaml")
+    layers = calibrate.active_layers(scores)
+    features = calibrate.normalized_features(scores, layers, config, 100.0, "linear")
+    weights = calibrate.weight_grid(len(layers), step=0.25)
+    tp, fp = calibrate.threshold_counts(features, labels, weights, bins=20, max_cells=500)
+
+    positives = labels.astype(bool)
+    for row, vector in enumerate(weights):
+        risk = features @ vector
+        for k in range(21):
+            blocked = risk + 1e-9 >= k / 20
+            assert tp[row, k] == (blocked & positives).sum()
+            assert fp[row, k] == (blocked & ~positives).sum()
+
+
+@pytest.mark.parametrize("layers", [3, 4, 5])
+def test_written_settings_reproduce_the_best_configuration(calibrate, config_path, layers):
+    scores, labels = synthetic_scores(calibrate)
+    scores[:, layers:] = np.nan  # similarity / divergence not scored
+    config = load_config(config_path)
+    result = calibrate.sweep(scores, labels, config, step=0.1, bins=200, fn_cost=3.0)
+    best = result["best"]
+
+    update_config(config_path, calibrate.config_updates(best))
+    current = calibrate.evaluate_current(scores, labels, load_config(config_path), fn_cost=3.0)
+
+    assert current["perplexity_curve"] == best["perplexity_curve"]
+    assert current["perplexity_limit"] == best["perplexity_limit"]
+    assert current["threshold"] == pytest.approx(best["threshold"])
+    assert current["weights"] == pytest.approx(best["weights"], abs=1e-3)
+    for metric in ("tpr", "fpr", "cost"):
+        assert current[metric] == pytest.approx(best[metric]), metric
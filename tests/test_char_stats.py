@@ -0,0 +1,106 @@
+import json
+import math
+import random
+import string
+from collections import Counter
+
+import pytest
+
+from src.utils import char_stats as char_stats_module
+from src.utils.char_stats import SHORT_TEXT, char_stats, char_stats_batch
+
+
+def naive_entropy(text):
+    if not text:
+        return 0.0
+    return -sum(count / len(text) * math.log2(count / len(text)) for count in Counter(text).values())
+
+
+def naive_max_window(text, window):
+    """Max entropy over `window`-char spans starting every window // 2 chars (one span for short texts)."""
+    step = max(1, window // 2)
+    if len(text) <= 2 * step:
+        return naive_entropy(text)
+    return max(naive_entropy(text[offset:offset + 2 * step]) for offset in range(0, len(text) - step, step))
+
+
+def random_text(rng, length):
+    alphabet = rng.choice([
+        "ab",
+        string.ascii_lowercase + "  ",
+        string.printable,
+        string.hexdigits,
+        "abcé中文🙂\u0000\t",
+        "".join(chr(0x4E00 + i) for i in range(300))
+    ])
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+LENGTHS = [0, 1, 31, 32, 33, 64, 65, SHORT_TEXT, SHORT_TEXT + 1, 1000, 5000]
+
+
+@pytest.mark.parametrize("length", LENGTHS)
+def test_matches_naive_statistics(length):
+    rng = random.Random(length)
+    for _ in range(20):
+        text = random_text(rng, length)
+        stats = char_stats(text, window=None)
+        assert stats["entropy"] == pytest.approx(naive_entropy(text), abs=1e-9)
+        assert stats["length"] == len(text)
+        assert stats["word_count"] == len(text.split())
+        assert stats["printable_ratio"] == pytest.approx(sum(c.isprintable() for c in text) / max(len(text), 1))
+        assert sum(stats["classes"].values()) == len(text)
+        assert stats["max_window_entropy"] is None
+
+
+@pytest.mark.parametrize("length", LENGTHS)
+@pytest.mark.parametrize("window", [2, 16, 64, 65])
+def test_matches_naive_windowed_entropy(length, window):
+    rng = random.Random(length * 100 + window)
+    for _ in range(10):
+        text = random_text(rng, length)
+        if len(set(text)) > char_stats_module.MAX_WINDOW_SYMBOLS:
+            continue  # folded into buckets: a lower bound only
+        stats = char_stats(text, window=window)
+        assert stats["max_window_entropy"] == pytest.approx(naive_max_window(text, window), abs=1e-9)
+        offset = stats["max_window_offset"]
+        span = text[offset:offset + 2 * max(1, window // 2)] if length > 2 * max(1, window // 2) else text
+        assert naive_entropy(span) == pytest.approx(stats["max_window_entropy"], abs=1e-9)
+
+
+def test_long_texts_are_processed_in_chunks(monkeypatch):
+    monkeypatch.setattr(char_stats_module, "WINDOW_CHUNK", 96)
+    rng = random.Random(7)
+    for _ in range(20):
+        text = random_text(rng, rng.randint(SHORT_TEXT + 1, 3000))
+        if len(set(text)) > char_stats_module.MAX_WINDOW_SYMBOLS:
+            continue
+        assert char_stats(text, window=64)["max_window_entropy"] == pytest.approx(naive_max_window(text, 64))
+
+
+def test_finds_a_random_blob_in_prose():
+    rng = random.Random(3)
+    blob = "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(64))
+    text = "please summarise this document for me " * 20 + blob + " thanks" * 50
+    stats = char_stats(text, window=64)
+    assert stats["max_window_entropy"] > stats["entropy"] + 0.5
+    assert abs(stats["max_window_offset"] - text.index(blob)) <= 32
+
+
+@pytest.mark.parametrize("text, is_hex, is_base64", [
+    ("deadbeef", True, True),
+    ("deadbee", False, True),
+    ("aGVsbG8gd29ybGQ=", False, True),
+    ("hello world", False, False),
+    ("", False, False),
+])
+def test_alphabet_flags(text, is_hex, is_base64):
+    stats = char_stats(text, window=None)
+    assert stats["is_hex"] is is_hex
+    assert stats["is_base64_alphabet"] is is_base64
+
+
+def test_results_are_json_serializable():
+    texts = ["", "abc", "x" * (SHORT_TEXT + 10), "中文 text"]
+    stats = char_stats_batch(texts, window=64)
+    assert json.loads(json.dumps(stats)) == stats
@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+import pytest
+
+from src.analysis import DriftDetector, SessionDriftTracker
+from src.analysis.drift_detector import RollingStats
+from src.utils.cache import LRUCache, SqliteCache
+
+
+def test_rolling_stats_match_numpy():
+    rng = random.Random(0)
+    stats = RollingStats(10)
+    values = []
+    for _ in range(100):
+        value = rng.random()
+        stats.push(value)
+        values = (values + [value])[-10:]
+        assert stats.mean() == pytest.approx(np.mean(values))
+        assert stats.std() == pytest.approx(np.std(values), abs=1e-7)
+
+
+def test_rolling_stats_round_trip():
+    stats = RollingStats(5)
+    for value in (0.1, 0.4, 0.9):
+        stats.push(value)
+    restored = RollingStats.from_list(stats.to_list())
+    assert (restored.mean(), restored.std(), restored.count) == (stats.mean(), stats.std(), stats.count)
+
+
+def test_detector_flags_a_spike():
+    detector = DriftDetector(window_size=10, threshold_std=2.0)
+    for value in (0.1, 0.2, 0.1, 0.15, 0.12, 0.18):
+        assert not detector.update_and_check(value)[0]
+    is_anomaly, z = detector.update_and_check(0.9)
+    assert is_anomaly and z > 2.0
+
+
+def tracker(**settings):
+    return SessionDriftTracker(LRUCache(100), **settings)
+
+
+def test_constant_history_does_not_explode():
+    drift = tracker(window_size=10, min_std=0.05, min_history=10)
+    for _ in range(10):
+        drift.update_and_check("user", 0.1)
+    _, z = drift.update_and_check("user", 0.3)
+    assert z == pytest.approx(4.0)
+
+
+def test_no_verdict_before_min_history():
+    drift = tracker(window_size=10, min_history=10)
+    for _ in range(9):
+        drift.update_and_check("user", 0.1)
+    assert drift.update_and_check("user", 0.9) == (False, 0.0)
+    assert drift.update_and_check("user", 0.95)[0]
+
+
+def test_sessions_are_independent():
+    drift = tracker(window_size=5, min_history=5)
+    for i in range(5):
+        drift.update_and_check("calm", 0.1)
+        drift.update_and_check("noisy", 0.9 if i % 2 else 0.1)
+    assert drift.update_and_check("calm", 0.8)[0]
+    assert not drift.update_and_check("noisy", 0.8)[0]
+    assert drift.update_and_check("new", 0.8) == (False, 0.0)
+
+
+def test_shared_store_keeps_history(tmp_path):
+    path = str(tmp_path / "drift.sqlite")
+    first = SessionDriftTracker(SqliteCache(path), window_size=5, min_history=5, shared=True)
+    for _ in range(5):
+        first.update_and_check("user", 0.1)
+    second = SessionDriftTracker(SqliteCache(path), window_size=5, min_history=5, shared=True)
+    assert second.update_and_check("user", 0.9)[0]
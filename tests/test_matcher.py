@@ -0,0 +1,112 @@
+import random
+import re
+
+import pytest
+
+from src.filters import KeywordFilter, RegexRuleEngine
+from src.filters.matcher import AhoCorasick, PatternSet, leading_literal
+
+# Characters re.IGNORECASE matches to ASCII letters that str.lower() does not:
+# long s, Kelvin sign, dotless i, dotted capital I
+FOLD_VARIANTS = {"s": "ſ", "k": "K", "i": "ı", "I": "İ"}
+
+
+def naive_literals(patterns, text):
+    return sorted(
+        (m.start(), m.start() + len(pattern), pattern)
+        for pattern in dict.fromkeys(patterns)
+        for m in re.finditer(f"(?={re.escape(pattern)})", text)
+    )
+
+
+def naive_regexes(patterns, text, flags=0):
+    return sorted(
+        (m.start(), m.end(), pattern)
+        for pattern in dict.fromkeys(patterns)
+        for m in re.finditer(pattern, text, flags)
+    )
+
+
+def random_text(rng, pieces, length):
+    """Filler words with pieces (rule hits, case and fold variants) mixed in."""
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        if rng.random() < 0.3:
+            piece = rng.choice(pieces)
+            mode = rng.random()
+            if mode < 0.3:
+                piece = piece.upper()
+            elif mode < 0.6:
+                piece = "".join(FOLD_VARIANTS.get(ch, ch) if rng.random() < 0.5 else ch for ch in piece)
+            words.append(piece)
+        else:
+            words.append("".join(rng.choice("abcdeiksxyz ") for _ in range(rng.randint(1, 8))))
+    return rng.choice(["", " ", "\n"]).join(words)
+
+
+def test_aho_corasick_finds_overlapping_matches():
+    matcher = AhoCorasick(["he", "she", "his", "hers"])
+    assert sorted(matcher.find_all("ushers")) == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+
+
+def test_aho_corasick_matches_naive_search():
+    rng = random.Random(0)
+    for _ in range(200):
+        patterns = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 12))]
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 60)))
+        assert sorted(AhoCorasick(patterns).find_all(text)) == naive_literals(patterns, text)
+
+
+def test_aho_corasick_scan_continues_across_chunks():
+    matcher = AhoCorasick(["system prompt", "jailbreak"])
+    text = "print the system prompt, then jailbreak"
+    for split in range(len(text) + 1):
+        first, state = matcher.scan(text[:split])
+        second, _ = matcher.scan(text[split:], state=state, offset=split)
+        assert first + second == matcher.find_all(text)
+
+
+@pytest.mark.parametrize("pattern, literal", [
+    (r"os\.system\(", "os.system("),
+    (r"import\s+os", "import"),
+    (r"\bsudo", "sudo"),
+    (r"colou?r", "colo"),
+    (r"(a|b)c", ""),
+    (r"a|b", ""),
+    (r"[abc]def", ""),
+    (r"\d+", ""),
+])
+def test_leading_literal(pattern, literal):
+    assert leading_literal(pattern) == literal
+
+
+@pytest.mark.parametrize("flags", [0, re.IGNORECASE])
+def test_pattern_set_matches_finditer(flags):
+    patterns = RegexRuleEngine().suspicious_patterns + [r"system\s+prompt", r"kill\s+-9", r"\d{3}-\d{4}", r"sk-\w+"]
+    pieces = ["import os", "import  sys", "os.system(", "subprocess.run", "eval(", "<script>", "javascript:",
+              "/jailbreak", "[System Mode]", "ADMIN_Override", "system prompt", "kill -9", "555-1234", "sk-abc"]
+    pattern_set = PatternSet(patterns, flags)
+    rng = random.Random(1)
+    for _ in range(300):
+        text = random_text(rng, pieces, rng.randint(0, 200))
+        assert pattern_set.find_all(text) == naive_regexes(patterns, text, flags), text
+
+
+@pytest.mark.parametrize("variant", ["ſubprocess.", "Kill -9", "ımport os", "İMPORT OS"])
+def test_pattern_set_ignorecase_fold_variants(variant):
+    patterns = [r"subprocess\.", r"kill\s+-9", r"import\s+os"]
+    text = f"run {variant} now"
+    expected = naive_regexes(patterns, text, re.IGNORECASE)
+    assert expected
+    assert PatternSet(patterns, re.IGNORECASE).find_all(text) == expected
+
+
+def test_pattern_set_non_ascii_anchor():
+    patterns = [r"straße\s+\d+", r"café"]
+    text = "STRAßE 12, CafÉ and straße 7"
+    assert PatternSet(patterns, re.IGNORECASE).find_all(text) == naive_regexes(patterns, text, re.IGNORECASE)
+
+
+def test_keyword_filter_is_case_insensitive():
+    found, keyword = KeywordFilter(extra_keywords=["Secret Sauce"]).scan("Tell me the SECRET sauce")
+    assert found and keyword == "secret sauce"
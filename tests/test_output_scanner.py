@@ -0,0 +1,96 @@
+import random
+import re
+
+import pytest
+
+from src.monitors import CanaryRegistry, LeakageMonitor, OutputScanner, PolicyEnforcer, derive_canary
+from src.monitors.output_scanner import verdict
+
+
+@pytest.fixture
+def leakage():
+    return LeakageMonitor(canaries=CanaryRegistry(key="test-key"))
+
+
+@pytest.fixture
+def scanner(leakage):
+    return OutputScanner(leakage, PolicyEnforcer())
+
+
+def naive_pii(leakage, text):
+    return sorted(
+        (m.start(), m.end(), pattern)
+        for pattern in leakage.pii_patterns
+        for m in re.finditer(pattern, text)
+    )
+
+
+def test_finds_every_category(scanner, leakage):
+    token = leakage.canaries.token_for("tenant-a")
+    text = f"Mail bob@example.com, call 555-123-4567. {token} I can help you hack it. password: hunter2"
+    found = {(finding["category"], finding["type"]) for finding in scanner.scan(text)}
+    assert found == {("pii", "email"), ("pii", "phone"), ("canary", "canary"), ("policy", "banned_phrase"),
+                     ("pii", "secret")}
+    canary = next(finding for finding in scanner.scan(text) if finding["category"] == "canary")
+    assert canary["scope"] == "tenant-a" and text[canary["start"]:canary["end"]] == token
+
+
+def test_banned_phrases_are_case_insensitive(scanner):
+    findings = scanner.scan("Sure, I CAN HELP YOU HACK that.")
+    assert [(f["category"], f["rule"]) for f in findings] == [("policy", "I can help you hack")]
+
+
+def test_pii_matches_per_pattern_finditer(scanner, leakage):
+    pieces = ["bob@example.com", "a.b@c.io", "555-123-4567", "5551234567", "sk-" + "a" * 48,
+              "secret = x", "key: value", "password:pw"]
+    rng = random.Random(0)
+    for _ in range(200):
+        text = " ".join(rng.choice(pieces + ["hello", "world", "42", "@"]) for _ in range(rng.randint(0, 12)))
+        findings = [f for f in scanner.scan(text) if f["category"] == "pii"]
+        assert sorted((f["start"], f["end"], f["rule"]) for f in findings) == naive_pii(leakage, text), text
+
+
+def test_overlapping_pii_findings_are_all_reported(scanner):
+    # The key and the generic-secret pattern overlap on the same span
+    text = "key: sk-" + "b" * 48
+    types = sorted(f["type"] for f in scanner.scan(text))
+    assert types == ["api_key", "secret"]
+
+
+def test_derived_canary_of_an_unseen_scope(leakage):
+    # Another worker issued it; the scope is known from the request
+    token = derive_canary("test-key", "session-9", 16)
+    scanner = OutputScanner(leakage, PolicyEnforcer())
+    assert scanner.scan(f"leaked {token}") == []
+    findings = scanner.scan(f"leaked {token}", scopes=("session-9",))
+    assert [f["scope"] for f in findings] == ["session-9"]
+
+
+def test_unknown_canary_lookalike_is_ignored(scanner):
+    assert scanner.scan("[SECURE_ABCDEFGHIJKLMNOP]") == []
+
+
+def test_verdict_order(scanner, leakage):
+    token = leakage.canaries.token_for("t")
+    assert verdict(scanner.scan(f"bypass security {token}"))[0] == "leakage"
+    assert verdict(scanner.scan("bypass security"))[0] == "policy"
+    assert verdict(scanner.scan("all good")) == ("safe", None)
+
+
+@pytest.mark.parametrize("length", [7, 33, 56])
+def test_canary_length_outside_the_pattern_is_rejected(length):
+    with pytest.raises(ValueError):
+        CanaryRegistry(key="k", length=length)
+
+
+def test_canary_registry_is_bounded():
+    registry = CanaryRegistry(key="k", max_scopes=10)
+    monitor = LeakageMonitor(canaries=registry)
+    tokens = [registry.token_for(f"session-{i}") for i in range(100)]
+    assert len(registry) <= 10
+    # The default canary is pinned; an evicted keyed scope is derived again on use
+    assert registry.scope_of(monitor.canary_token) == "default"
+    assert registry.scope_of(tokens[0]) is None
+    assert registry.verify(tokens[0], "session-0")
+    registry.expect("session-0")
+    assert registry.scope_of(tokens[0]) == "session-0"
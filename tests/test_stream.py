@@ -0,0 +1,107 @@
+import random
+import types
+
+import pytest
+
+from src.monitors import (CanaryRegistry, LeakageMonitor, OutputScanner, OutputStreamRedactor, OutputStreamScanner,
+                          PolicyEnforcer)
+from src.monitors.output_scanner import redact, verdict
+
+
+@pytest.fixture
+def rules():
+    # The stream scanners only use the rule set's output scanner
+    leakage = LeakageMonitor(canaries=CanaryRegistry(key="test-key"))
+    return types.SimpleNamespace(output=OutputScanner(leakage, PolicyEnforcer()), leakage=leakage)
+
+
+def random_chunks(text, rng):
+    chunks = []
+    position = 0
+    while position < len(text):
+        size = rng.randint(1, 40)
+        chunks.append(text[position:position + size])
+        position += size
+    return chunks
+
+
+def stream(scanner, chunks):
+    released = "".join(scanner.feed(chunk) for chunk in chunks)
+    return released + scanner.close()
+
+
+def response(rng, pieces, words=40):
+    filler = ["the", "answer", "is", "here", "and", "more", "text", "\n", "42"]
+    return " ".join(rng.choice(pieces) if rng.random() < 0.1 else rng.choice(filler) for _ in range(words))
+
+
+def test_safe_stream_is_released_unchanged(rules):
+    rng = random.Random(0)
+    for _ in range(50):
+        text = response(rng, ["fine"], words=rng.randint(0, 200))
+        scanner = OutputStreamScanner(rules, overlap=32)
+        assert stream(scanner, random_chunks(text, rng)) == text
+        assert scanner.result() == {"status": "PASS", "reason": None, "released_chars": len(text)}
+
+
+def test_stream_verdict_matches_whole_text(rules):
+    token = rules.leakage.canaries.token_for("tenant")
+    pieces = ["bob@example.com", "555-123-4567", token, "bypass security", "DAN mode enabled", "ok"]
+    rng = random.Random(1)
+    for _ in range(200):
+        text = response(rng, pieces)
+        expected_check, expected_reason = verdict(rules.output.scan(text))
+        scanner = OutputStreamScanner(rules, overlap=64)
+        released = stream(scanner, random_chunks(text, rng))
+
+        assert scanner.stopped == (expected_check != "safe")
+        if scanner.stopped:
+            # Nothing that is part of a violation was let through
+            assert text.startswith(released)
+            assert verdict(rules.output.scan(released))[0] == "safe"
+        else:
+            assert released == text
+
+
+def test_match_straddling_chunks_is_caught(rules):
+    text = "Well, I can help you hack that server."
+    for split in range(1, len(text)):
+        scanner = OutputStreamScanner(rules, overlap=8)
+        stream(scanner, [text[:split], text[split:]])
+        assert scanner.stopped, split
+        assert "banned phrase" in scanner.reason
+
+
+def test_memory_stays_bounded(rules):
+    scanner = OutputStreamScanner(rules, overlap=64)
+    for _ in range(2000):
+        scanner.feed("a long and harmless response ")
+        assert len(scanner._tail) <= 2 * scanner.overlap + 40
+
+
+def test_redact_replaces_spans_with_placeholders():
+    text = "mail bob@example.com now"
+    findings = [{"category": "pii", "type": "email", "start": 5, "end": 20}]
+    assert redact(text, findings) == "mail [EMAIL] now"
+    overlapping = findings + [{"category": "pii", "type": "secret", "start": 10, "end": 24}]
+    assert redact(text, overlapping) == "mail [EMAIL]"
+
+
+def test_stream_redaction_matches_whole_text(rules):
+    token = rules.leakage.canaries.token_for("tenant")
+    pieces = ["bob@example.com", "a.b@c.io", "555-123-4567", token, "password: hunter2", "ok"]
+    rng = random.Random(2)
+    for _ in range(200):
+        text = response(rng, pieces)
+        findings = rules.output.scan(text)
+        redactor = OutputStreamRedactor(rules, overlap=64)
+        assert stream(redactor, random_chunks(text, rng)) == redact(text, findings), text
+        assert [(f["start"], f["end"]) for f in redactor.findings] == [(f["start"], f["end"]) for f in findings]
+        assert redactor.result()["status"] == ("REDACTED" if findings else "PASS")
+
+
+def test_stream_redaction_still_blocks_other_findings(rules):
+    redactor = OutputStreamRedactor(rules, overlap=64)
+    released = stream(redactor, ["mail bob@example.com, then ", "bypass security ", "and more"])
+    assert redactor.stopped
+    assert "bob@example.com" not in released